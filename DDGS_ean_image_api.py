@@ -1,251 +1,443 @@
-import requests
-import os
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 from PIL import Image as PILImage
 from io import BytesIO
 from ddgs import DDGS
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 import cv2
-import warnings
+from barcode_excel_ratelimit import throttle_host
+from barcode_excel_search_cache import get_cached_search, save_search, DDGS_SEARCH_CACHE_ENABLED, DDGS_SEARCH_CACHE_ONLY
+from barcode_excel_images import fetch_image, write_file_atomic, sniff_image_type, ImageDownloadError
 
-# 设置环境变量以避免CPU核心数检测警告
-os.environ['LOKY_MAX_CPU_COUNT'] = '4'
+# --- 配置 ---
+FEATURE_SIZE = 64  # 提取特征前将图片缩放到的边长（像素）
+HIST_BINS = 8  # 每个颜色通道的直方图区间数（需能整除256）
+CANDIDATE_DOWNLOAD_WORKERS = 16  # 候选图片并发下载线程数（进程内所有条码共用）
+CANDIDATE_DEADLINE = 15  # 每个条码下载候选图片的截止时间（秒），到期后用已下载的图片选择
+THUMBNAIL_FIRST = True  # 用缩略图为候选图片评分，只下载选中图片的原图
+FULL_IMAGE_ATTEMPTS = 2  # 缩略图评分模式下最多尝试下载几张排名靠前图片的原图（选中的图片、第二名...）
+PHASH_EARLY_EXIT = True  # 足够多的候选图片感知哈希一致时提前结束下载
+PHASH_AGREEMENT = 3  # 多少张近似相同的候选图片视为一致
+PHASH_MAX_DISTANCE = 8  # 两张图片 64 位差异哈希的汉明距离不超过此值时视为近似相同
 
-def download_image_with_fallback(url, thumbnail_url, save_path=None, max_retries=3, ean=None):
+# 候选图片下载线程池（进程级共享）
+_candidate_executor = ThreadPoolExecutor(max_workers=CANDIDATE_DOWNLOAD_WORKERS, thread_name_prefix="DDGS-Download")
+
+def save_image_as_jpeg(image_data, image_type, save_path):
+    """
+    将下载的图片保存为 JPEG 文件（临时文件 + 原子替换）。
+    已经是 JPEG 的内容直接写入，其他格式才经 PIL 转换。
+    """
+    if image_type != 'jpeg':
+        img = PILImage.open(BytesIO(image_data))
+        buffer = BytesIO()
+        img.convert('RGB').save(buffer, format='JPEG')
+        image_data = buffer.getvalue()
+    write_file_atomic(save_path, image_data)
+
+
+def download_image_with_fallback(url, thumbnail_url, save_path=None, max_retries=3, ean=None, stop_event=None):
     """
     下载图片，添加重试机制和缩略图备选方案
     如果save_path为None，则返回图片内容而不保存到文件
+    通过共享连接池流式下载，超过大小上限或不是图片的响应不再重试
+    stop_event 被设置（截止时间已到或检索已取消）时不再发起新的尝试
     """
     image_data = None
     
-    # 首先尝试下载原图
-    if url:
+    # 首先尝试下载原图，失败时尝试下载缩略图
+    for label, image_url in (('图片', url), ('缩略图', thumbnail_url)):
+        if image_data is not None or not image_url:
+            continue
+        if label == '缩略图':
+            print(f"EAN为{ean}，尝试下载缩略图替代: {thumbnail_url}")
         for attempt in range(max_retries):
-            try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                
-                # 使用PIL验证图片完整性
-                img = PILImage.open(BytesIO(response.content))
-                
-                # 如果指定了保存路径则保存到文件
-                if save_path:
-                    img.save(save_path)
-                
-                image_data = response.content
-                print(f"图片下载：成功下载图片: {save_path}，EAN为{ean}")
+            if stop_event is not None and stop_event.is_set():
                 break
-            except Exception as e:
-                print(f"EAN为{ean}，下载图片失败 {url} (尝试 {attempt+1}/{max_retries}): {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # 指数退避
-    
-    # 如果原图下载失败，尝试下载缩略图
-    if image_data is None and thumbnail_url:
-        print(f"EAN为{ean}，尝试下载缩略图替代: {thumbnail_url}")
-        for attempt in range(max_retries):
             try:
-                response = requests.get(thumbnail_url, timeout=10)
-                response.raise_for_status()
-                
-                # 使用PIL验证图片完整性
-                img = PILImage.open(BytesIO(response.content))
+                data, image_type = fetch_image(image_url)
+                if stop_event is not None and stop_event.is_set():
+                    break  # 调用方已不再等待，不写入文件
                 
                 # 如果指定了保存路径则保存到文件
                 if save_path:
-                    img.save(save_path)
+                    save_image_as_jpeg(data, image_type, save_path)
                 
-                image_data = response.content
-                print(f"图片下载：成功下载缩略图: {save_path}，EAN为{ean}")
+                image_data = data
+                print(f"图片下载：成功下载{label}: {save_path}，EAN为{ean}")
+                break
+            except ImageDownloadError as e:
+                print(f"EAN为{ean}，下载{label}失败 {image_url}，不再重试: {str(e)}")
                 break
             except Exception as e:
-                print(f"EAN为{ean}，下载缩略图失败 {thumbnail_url} (尝试 {attempt+1}/{max_retries}): {str(e)}")
+                print(f"EAN为{ean}，下载{label}失败 {image_url} (尝试 {attempt+1}/{max_retries}): {str(e)}")
                 if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # 指数退避
+                    if stop_event is not None:
+                        stop_event.wait(2 ** attempt)  # 指数退避，截止时提前结束
+                    else:
+                        time.sleep(2 ** attempt)  # 指数退避
     
-    if image_data is None:
+    if image_data is None and not (stop_event is not None and stop_event.is_set()):
         print(f"EAN为{ean}，下载图片最终失败，原图: {url}, 缩略图: {thumbnail_url}")
     
     return image_data
 
-def search_product_images(ean, max_results=10):
+def search_product_images(ean, max_results=10, raise_errors=False, cache_only=DDGS_SEARCH_CACHE_ONLY, breaker=None):
     """
     使用DDGS搜索产品图片，获取更多候选图片用于聚类分析
+    raise_errors=True 时搜索出错（限流、超时等）直接抛出，便于调用方区分“出错”和“没有结果”
+    搜索结果缓存在 ddgs_search_cache 表中（带TTL），命中时不访问DDGS；
+    cache_only=True 时只读缓存（忽略TTL），未命中时返回空列表
+    breaker（熔断器）只记录实际访问DDGS的搜索：出错计为失败，正常返回（包括没有结果）计为成功，命中缓存不记录
     """
+    if DDGS_SEARCH_CACHE_ENABLED or cache_only:
+        cached_results = get_cached_search(ean, max_results, ignore_ttl=cache_only)
+        if cached_results is not None:
+            print(f"使用缓存的DDGS搜索结果：{len(cached_results)} 张图片，EAN: {ean}")
+            return cached_results
+        if cache_only:
+            print(f"EAN {ean} 没有缓存的DDGS搜索结果（只读缓存模式）")
+            return []
     try:
         keywords = ean
         
-        # 使用DDGS搜索图片
-        with DDGS() as ddgs:
-            results = list(ddgs.images(keywords, max_results=max_results))
+        # 使用DDGS搜索图片（DDGS 后端主机不固定，按名称限速）
+        throttle_host('ddgs')
+        try:
+            with DDGS() as ddgs:
+                results = list(ddgs.images(keywords, max_results=max_results))
+        except Exception:
+            if breaker is not None:
+                breaker.record_failure('error')
+            raise
+        if breaker is not None:
+            breaker.record_success()
         print(f"找到 {len(results)} 张图片用于 EAN: {ean}")
+        if DDGS_SEARCH_CACHE_ENABLED:
+            save_search(ean, max_results, results[:max_results])
             
         return results[:max_results]
     except Exception as e:
         print(f"搜索图片失败 {ean}: {str(e)}")
+        if raise_errors:
+            raise
         return []
 
+def perceptual_hash(image_data):
+    """
+    计算图片的 64 位差异哈希（dHash）：灰度缩放到 9x8，比较每行相邻像素的明暗
+    同一张图片经不同网站重新压缩、缩放后哈希基本不变
+
+    Returns:
+        int: 哈希值；无法解码时返回None
+    """
+    img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def find_agreeing_candidates(hashes, new_position):
+    """
+    返回与第 new_position 张候选图片近似相同（哈希汉明距离不超过 PHASH_MAX_DISTANCE）的候选图片位置（包括其自身）
+    """
+    new_hash = hashes[new_position]
+    if new_hash is None:
+        return [new_position]
+    return [position for position, other in enumerate(hashes)
+            if other is not None and bin(new_hash ^ other).count('1') <= PHASH_MAX_DISTANCE]
+
+def decode_candidate_images(image_data_list):
+    """
+    解码候选图片并统一缩放为 FEATURE_SIZE x FEATURE_SIZE
+
+    Returns:
+        tuple: (形状为 (有效图片数, FEATURE_SIZE, FEATURE_SIZE, 3) 的 uint8 数组, 有效图片在列表中的下标)
+    """
+    images = np.empty((len(image_data_list), FEATURE_SIZE, FEATURE_SIZE, 3), np.uint8)
+    valid_indices = []
+    for index, image_data in enumerate(image_data_list):
+        try:
+            # 使用OpenCV读取图片
+            img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        except Exception as e:
+            print(f"提取图片特征失败: {str(e)}")
+            continue
+        if img is None:
+            continue
+        images[len(valid_indices)] = cv2.resize(img, (FEATURE_SIZE, FEATURE_SIZE))
+        valid_indices.append(index)
+    return images[:len(valid_indices)], valid_indices
+
+def histogram_features(images):
+    """
+    计算缩放后图片的特征：每个通道 HIST_BINS 个区间的颜色直方图（归一化）+ 高、宽、宽高比
+    所有图片的直方图由一次 np.bincount 计算，结果与逐张 cv2.calcHist 相同
+
+    Args:
+        images (np.ndarray): 形状为 (N, FEATURE_SIZE, FEATURE_SIZE, 3) 的 uint8 数组
+
+    Returns:
+        np.ndarray: 形状为 (N, 3 * HIST_BINS + 3) 的特征数组
+    """
+    count = len(images)
+    # 按 (图片, 通道) 排成行，每行加上各自的区间编号偏移，一次计数得到所有图片的 B/G/R 直方图
+    bins = (images // (256 // HIST_BINS)).transpose(0, 3, 1, 2).reshape(count * 3, FEATURE_SIZE * FEATURE_SIZE).astype(np.intp)
+    bins += (np.arange(count * 3) * HIST_BINS)[:, None]
+    hist = np.bincount(bins.ravel(), minlength=count * 3 * HIST_BINS)
+    hist = hist.reshape(count, 3 * HIST_BINS).astype(np.float32)
+    hist /= hist.sum(axis=1, keepdims=True)
+    # 缩放后所有图片的高、宽、宽高比相同
+    shape_features = np.tile([FEATURE_SIZE, FEATURE_SIZE, 1.0], (count, 1))
+    return np.hstack([hist.astype(np.float64), shape_features])
+
+def extract_image_features_batch(image_data_list):
+    """
+    批量提取候选图片的特征用于选择
+
+    Returns:
+        tuple: (形状为 (有效图片数, 3 * HIST_BINS + 3) 的特征数组, 有效图片在列表中的下标)
+    """
+    images, valid_indices = decode_candidate_images(image_data_list)
+    return histogram_features(images), valid_indices
+
 def extract_image_features(image_data):
     """
     从图片数据中提取特征用于聚类分析
     """
-    try:
-        # 使用OpenCV读取图片
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img is None:
-            return None
-            
-        # 调整图片大小以统一特征维度
-        img = cv2.resize(img, (64, 64))
-        
-        # 提取颜色直方图特征
-        hist_b = cv2.calcHist([img], [0], None, [8], [0, 256])
-        hist_g = cv2.calcHist([img], [1], None, [8], [0, 256])
-        hist_r = cv2.calcHist([img], [2], None, [8], [0, 256])
-        
-        # 展平并归一化直方图
-        feature = np.concatenate([hist_b.flatten(), hist_g.flatten(), hist_r.flatten()])
-        feature = feature / np.sum(feature)
-        
-        # 添加图像基本属性作为特征
-        height, width = img.shape[:2]
-        aspect_ratio = width / height
-        feature = np.append(feature, [height, width, aspect_ratio])
-        
-        return feature
-    except Exception as e:
-        print(f"提取图片特征失败: {str(e)}")
-        return None
+    features, valid_indices = extract_image_features_batch([image_data])
+    return features[0] if valid_indices else None
 
-def select_best_image(image_data_list):
+def rank_by_center_distance(features):
     """
-    从图片数据列表中选择最具代表性的单张图片
+    特征按列标准化（方差为0的列不缩放）后，按距离所有特征均值（单簇聚类中心）由近到远返回各行的下标
+    距离相同时保持原顺序
+    """
+    scale = features.std(axis=0)
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+    scaled = (features - features.mean(axis=0)) / scale
+    distances = np.linalg.norm(scaled - scaled.mean(axis=0), axis=1)
+    return np.argsort(distances, kind='stable')
+
+def closest_to_center(features):
+    """
+    返回距离单簇聚类中心最近的一行的下标（标准化方式见 rank_by_center_distance）
+    """
+    return int(rank_by_center_distance(features)[0])
+
+def rank_candidate_images(image_data_list):
+    """
+    按代表性由高到低排列候选图片，返回它们在列表中的下标（无法解码的图片不包含在内）
     """
     try:
-        # 提取所有图片的特征
-        features = []
-        valid_image_data = []
-        
-        for data in image_data_list:
-            feature = extract_image_features(data)
-            if feature is not None:
-                features.append(feature)
-                valid_image_data.append(data)
+        # 批量提取所有图片的特征
+        features, valid_indices = extract_image_features_batch(image_data_list)
         
         # 检查有效图片数量
-        if len(valid_image_data) == 0:
+        if len(valid_indices) == 0:
             print("没有有效的图片可选择")
-            return None
-        elif len(valid_image_data) == 1:
+            return []
+        elif len(valid_indices) == 1:
             print("仅有一张有效图片，直接返回")
-            return valid_image_data[0]  # 只有一张图片直接返回
+            return valid_indices  # 只有一张图片直接返回
         
-        # 转换为numpy数组
-        X = np.array(features)
-        
-        # 标准化特征
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        
-        # 执行K-means聚类，分成一个簇
-        kmeans = KMeans(n_clusters=1, random_state=42, n_init=10)
-        kmeans.fit(X_scaled)
-        
-        # 找到距离聚类中心最近的图片
-        distances = []
-        for i, feature in enumerate(X_scaled):
-            distance = np.linalg.norm(feature - kmeans.cluster_centers_[0])
-            distances.append((i, distance))
-        
-        # 选择距离中心最近的图片
-        closest_idx, _ = min(distances, key=lambda x: x[1])
-        best_image = valid_image_data[closest_idx]
-        
-        return best_image
+        # 距离中心最近的图片排在最前
+        return [valid_indices[i] for i in rank_by_center_distance(features)]
     except Exception as e:
         print(f"选择最佳图片失败: {str(e)}")
-        # 出错时回退到选择第一张图片
-        return image_data_list[0] if image_data_list else None
+        # 出错时回退到原顺序（第一张图片优先）
+        return list(range(len(image_data_list)))
 
-def get_best_product_image(ean, temp_dir="temp"):
+def select_best_image_index(image_data_list):
+    """
+    从图片数据列表中选择最具代表性的单张图片，返回其在列表中的下标（没有有效图片时返回None）
+    """
+    ranking = rank_candidate_images(image_data_list)
+    return ranking[0] if ranking else None
+
+def select_best_image(image_data_list):
+    """
+    从图片数据列表中选择最具代表性的单张图片
+    """
+    index = select_best_image_index(image_data_list)
+    return image_data_list[index] if index is not None else None
+
+def get_best_product_image(ean, save_path=None, cancel_event=None, raise_errors=False, thumbnail_first=THUMBNAIL_FIRST,
+                           cache_only=DDGS_SEARCH_CACHE_ONLY, early_exit=PHASH_EARLY_EXIT, breaker=None):
     """
     根据EAN条码获取最佳产品图片和元信息
+    候选图片只保存在内存中，直接用于特征提取；只有选中的图片会被写入文件（且只在指定 save_path 时）
+    thumbnail_first 模式下只下载候选图片的DDGS缩略图用于评分（特征只用到 64x64 缩放图），
+    再下载选中图片的原图；原图下载失败时依次尝试排名第二的图片，都失败时使用选中图片的缩略图
+    early_exit 模式下每下载完一张候选图片就计算感知哈希，PHASH_AGREEMENT 张近似相同时取消其余下载，
+    只在这几张一致的图片中选择；结果不一致时仍等待全部候选图片
     
     Args:
         ean (str): 产品EAN条码
-        temp_dir (str): 临时目录路径，默认为"temp"
+        save_path (str): 可选，选中的图片以JPEG格式直接写入此路径；为None时只返回图片数据，由调用方保存
+        cancel_event (threading.Event): 可选，被设置时（如对冲竞速中其他来源已胜出）在下一张图片前放弃并返回None
+        raise_errors (bool): 搜索出错时抛出异常而不是返回None
+        thumbnail_first (bool): 用缩略图评分，只下载选中图片的原图
+        cache_only (bool): 只使用缓存的DDGS搜索结果，不访问DDGS搜索
+        early_exit (bool): 感知哈希一致时提前结束候选图片下载
+        breaker (CircuitBreaker): 可选，记录实际访问DDGS的搜索结果（命中缓存时不记录）
         
     Returns:
         dict: 包含最佳图片路径和元信息的字典
               {
-                  'image_path': str,        # 最佳图片的存储路径
+                  'image_data': bytes,      # 最佳图片的原始数据
+                  'image_type': str,        # 图片格式（jpeg / png / ...）
+                  'image_path': str,        # 最佳图片的存储路径（未指定 save_path 时为None）
                   'metadata': dict          # 图片元信息
               }
               如果失败则返回None
     """
     print(f"处理EAN码: {ean}")
     
-    # 创建临时目录
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
     # 搜索更多图片用于分析
-    image_results = search_product_images(ean, max_results=10)
+    image_results = search_product_images(ean, max_results=10, raise_errors=raise_errors, cache_only=cache_only,
+                                          breaker=breaker)
     
     if not image_results:
         print(f"未找到EAN码 {ean} 的图片")
         return None
     
-    # 下载所有候选图片
+    # 并发下载所有候选图片，截止时间到达后使用已下载的图片
     downloaded_images = []
-    
+    stop_event = threading.Event()  # 截止或取消时通知未完成的下载停止重试
+    futures = {}
     for i, result in enumerate(image_results):
         img_url = result.get('image', '')
         thumbnail_url = result.get('thumbnail', '')
         
+        if thumbnail_first:
+            # 只下载缩略图（没有缩略图时下载原图）用于评分
+            img_url, thumbnail_url = thumbnail_url or img_url, None
+        
         if img_url or thumbnail_url:
-            img_filename = f"{temp_dir}/{ean}_{i+1}.jpg"
-            image_data = download_image_with_fallback(img_url, thumbnail_url, save_path=img_filename, ean=ean)
-            
-            if image_data:
-                downloaded_images.append({
-                    'path': img_filename,
-                    'data': image_data,
-                    'result': result,
-                    'index': i
-                })
+            future = _candidate_executor.submit(download_image_with_fallback, img_url, thumbnail_url,
+                                                ean=ean, stop_event=stop_event)
+            futures[future] = (i, result)
+    
+    deadline = time.time() + CANDIDATE_DEADLINE
+    pending = set(futures)
+    hashes = []  # 与 downloaded_images 一一对应的感知哈希
+    agreed = False  # 是否已有足够多的候选图片一致
+    try:
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                print(f"EAN码 {ean} 的DDGS检索已取消")
+                return None
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                print(f"EAN码 {ean} 的候选图片下载已到截止时间（{CANDIDATE_DEADLINE} 秒），"
+                      f"放弃 {len(pending)} 张未完成的图片")
+                break
+            # 分段等待，以便及时响应取消
+            done, pending = wait(pending, timeout=min(remaining, 0.5), return_when=FIRST_COMPLETED)
+            for future in done:
+                i, result = futures[future]
+                try:
+                    image_data = future.result()
+                except Exception as e:
+                    print(f"EAN为{ean}，下载候选图片 {i+1} 出错: {str(e)}")
+                    image_data = None
+                
+                if image_data:
+                    downloaded_images.append({
+                        'data': image_data,
+                        'result': result,
+                        'index': i
+                    })
+                    if early_exit:
+                        hashes.append(perceptual_hash(image_data))
+                        agreeing = find_agreeing_candidates(hashes, len(hashes) - 1)
+                        if len(agreeing) >= PHASH_AGREEMENT:
+                            print(f"EAN码 {ean} 已有 {len(agreeing)} 张近似相同的候选图片，"
+                                  f"取消其余 {len(pending)} 张图片的下载")
+                            downloaded_images = [downloaded_images[position] for position in agreeing]
+                            agreed = True
+                            break
+            if agreed:
+                break
+    finally:
+        stop_event.set()
+        for future in pending:
+            future.cancel()  # 尚未开始的下载直接取消
+    # 按搜索结果顺序排列，与逐个下载时的选择结果一致
+    downloaded_images.sort(key=lambda img: img['index'])
     
     if not downloaded_images:
         print(f"EAN码 {ean} 没有成功下载任何图片")
         return None
     
     print(f"成功下载 {len(downloaded_images)} 张图片用于 {ean} 的分析")
+    if cancel_event is not None and cancel_event.is_set():
+        print(f"EAN码 {ean} 的DDGS检索已取消")
+        return None
     
     # 获取所有下载的图片数据
     image_data_list = [img['data'] for img in downloaded_images]
     
-    # 选择最佳图片数据
-    best_image_data = select_best_image(image_data_list)
+    # 选择最佳图片
+    ranking = rank_candidate_images(image_data_list)
     
-    if not best_image_data:
+    if not ranking:
         print(f"未能为EAN码 {ean} 选择到合适的图片")
         return None
     
-    print(f"已选择最佳图片数据")
+    print("已选择最佳图片数据")
+    best_image = downloaded_images[ranking[0]]
+    if thumbnail_first:
+        scored_bytes = sum(len(data) for data in image_data_list)
+        best_image = fetch_ranked_full_image(ean, downloaded_images, ranking, cancel_event)
+        if best_image is None:
+            return None
+        print(f"EAN码 {ean} 缩略图评分：候选图片共 {scored_bytes / 1024:.1f} KB，"
+              f"选中图片 {len(best_image['data']) / 1024:.1f} KB")
+    image_type = sniff_image_type(best_image['data'][:16])
     
-    # 查找被选中的图片的元信息和路径
-    for img_info in downloaded_images:
-        if img_info['data'] == best_image_data:
-            # 返回最佳图片路径和元信息
-            return {
-                'image_path': img_info['path'],
-                'metadata': img_info['result']
-            }
+    # 只写入选中的图片
+    if save_path:
+        try:
+            save_image_as_jpeg(best_image['data'], image_type, save_path)
+        except Exception as e:
+            print(f"EAN码 {ean} 的最佳图片保存失败: {str(e)}")
+            return None
     
-    return None
+    # 返回最佳图片数据、路径和元信息
+    return {
+        'image_data': best_image['data'],
+        'image_type': image_type,
+        'image_path': save_path,
+        'metadata': best_image['result']
+    }
+
+def fetch_ranked_full_image(ean, downloaded_images, ranking, cancel_event=None):
+    """
+    按排名依次下载候选图片的原图（最多 FULL_IMAGE_ATTEMPTS 张），返回第一张成功的候选图片
+    都失败时返回选中图片的缩略图；检索已取消时返回None
+    """
+    for rank, index in enumerate(ranking[:FULL_IMAGE_ATTEMPTS]):
+        if cancel_event is not None and cancel_event.is_set():
+            print(f"EAN码 {ean} 的DDGS检索已取消")
+            return None
+        candidate = downloaded_images[index]
+        full_url = candidate['result'].get('image', '')
+        if not candidate['result'].get('thumbnail'):
+            return candidate  # 没有缩略图时评分用的已经是原图
+        if not full_url:
+            continue
+        image_data = download_image_with_fallback(full_url, None, max_retries=2, ean=ean, stop_event=cancel_event)
+        if image_data:
+            if rank > 0:
+                print(f"EAN码 {ean} 选中图片的原图下载失败，使用排名第 {rank + 1} 的图片")
+            return dict(candidate, data=image_data)
+    print(f"EAN码 {ean} 的原图均下载失败，使用选中图片的缩略图")
+    return downloaded_images[ranking[0]]
 
 def save_image_to_file(image_data, filename):
     """
@@ -264,12 +456,14 @@ def save_image_to_file(image_data, filename):
 
 # 示例用法
 if __name__ == "__main__":
-    # 示例EAN码
-    ean = "3346130022886"
+    # 用法: python DDGS_ean_image_api.py [EAN码] [--cache-only]
+    # --cache-only 只使用缓存的搜索结果（离线重放图片选择）
+    args = [arg for arg in sys.argv[1:] if arg != '--cache-only']
+    ean = args[0] if args else "3346130022886"  # 示例EAN码
     
     # 获取最佳图片和元信息
-    result = get_best_product_image(ean)
-    print(result)
+    result = get_best_product_image(ean, save_path=f"{ean}.jpg", cache_only='--cache-only' in sys.argv)
+    print({key: value for key, value in result.items() if key != 'image_data'} if result else result)
     if result:
         # 打印图片路径
         print(f"最佳图片路径: {result['image_path']}")
@@ -1,10 +1,6 @@
-import threading
 import os
 import time
 import sqlite3
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
@@ -13,16 +9,32 @@ from selenium_stealth import stealth
 import openpyxl
 from openpyxl.drawing.image import Image
 # 导入 openpyxl.utils 模块，用于列字母和索引转换
-from openpyxl.utils import column_index_from_string
-from barcode_excel_db import init_database, get_product_from_db, insert_product_to_db
-from barcode_excel_excel import read_barcodes_from_excel_with_row, update_excel_with_results_with_row
+from openpyxl.utils import column_index_from_string, get_column_letter
+from barcode_excel_db import init_database, get_product_from_db, get_products_from_db, insert_product_to_db, product_writer, BULK_QUERY_CHUNK_SIZE
+from barcode_excel_db import status_from_product_name, STATUS_OK, STATUS_NOT_FOUND, RETRYABLE_STATUSES, SOURCE_BARCODELOOKUP, SOURCE_DDGS
+from barcode_excel_db import NEGATIVE_CACHE_TTL, negative_cache_expires_at
+from barcode_excel_excel import read_barcodes_from_excel_with_row, update_excel_with_results_with_row, prepare_excel_image, write_product_to_sheet
 #from barcode_excel_trans import translate_excel
 #from translate_excel_openpyxl import translate_excel
-from new_translate_excel_openpyxl import translate_excel
+from new_translate_excel_openpyxl import translate_excel, translate_with_retry, MAX_WORKERS as TRANSLATE_WORKERS
 from RandomUaStealth import get_random_stealth_config, get_random_user_agent, record_failure, record_success
-from DDGS_ean_image_api import get_best_product_image
+from DDGS_ean_image_api import get_best_product_image, save_image_as_jpeg
+from barcode_excel_driver_pool import get_driver_pool
+from barcode_excel_scheduler import CrawlScheduler
+from barcode_excel_pipeline import StagedPipeline
+from barcode_excel_journal import init_journal, new_job_id, create_job, get_job, set_job_status, load_job_rows, advance_rows, save_translation
+from barcode_excel_fetcher import fetch_product_http, is_invalid_product_name, target_elements_ready, tier_stats
+from barcode_excel_singleflight import barcode_inflight, normalize_barcode
+from barcode_excel_revalidate import RevalidationRunner, foreground_activity
+from barcode_excel_hedge import HedgedRace, hedge_stats, HEDGE_DELAY
+from barcode_excel_breaker import source_breakers, breaker_metrics
+from barcode_excel_concurrency import crawl_limiter, CONCURRENCY_MAX
+from barcode_excel_ratelimit import throttle, host_limiter
+from barcode_excel_snapshots import save_snapshot
+from barcode_excel_images import download_image_file, download_metrics
+from barcode_excel_search_cache import search_cache_metrics
 import random
-import shutil
+from contextlib import nullcontext
 
 
 # --- 配置 ---
@@ -35,6 +47,14 @@ BASE_URL = "https://www.barcodelookup.com/{}"
 IMAGE_XPATH = '/html/body/section[2]/div[1]/div/div/div[1]/div[1]/img'
 # 产品名称XPath
 PRODUCT_NAME_XPATH = '/html/body/section[2]/div[1]/div/div/div[2]/h4'
+ELEMENT_WAIT_TIMEOUT = 2  # 目标元素已统一等待过，单个元素提取时只做短暂等待（秒）
+STREAMING_PIPELINE = True  # 使用分阶段流式管道（爬取、下载、翻译、写入重叠执行）
+PIPELINE_DOWNLOAD_WORKERS = 4  # 图片下载阶段线程数
+PIPELINE_POSTPROCESS_WORKERS = 2  # 图片后处理（解码校验）阶段线程数
+CHECKPOINT_INTERVAL = 60  # 流式管道定期保存输出工作簿的间隔（秒）
+REVALIDATION_ENABLED = True  # 前台空闲时在后台重新检索负缓存已过期的失败条码（server.py 启动）
+HEDGED_LOOKUP = True  # 对冲模式：barcodelookup 超过 HEDGE_DELAY 秒未返回时并行启动 DDGS，先返回者胜出
+ADAPTIVE_CONCURRENCY = True  # 按延迟和拥塞信号自动调整爬取并发度（AIMD，上下限见 barcode_excel_concurrency）
 count=0  # 全局计数器，用于记录总的条形码成功处理数量
 count_1=0  # 全局计数器，用于记录总的条形码在数据库中找到的数量
 count_2=0  # 全局计数器，用于记录总的条形码成功爬取的数量
@@ -76,115 +96,311 @@ def download_image(image_url, barcode):
         print(f"图片下载：图片 {image_filename} 已存在，跳过下载。")  # 增加日志
         return image_filepath
     print(f"图片下载：开始下载图片 {image_url} 到 {image_filepath}")  # 增加日志
-    try:
-        response = requests.get(image_url, stream=True, timeout=10)
-        response.raise_for_status()  # 检查HTTP请求是否成功
-        with open(image_filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+    # 共享连接池流式下载，校验大小和格式，完整下载后才原子替换为目标文件
+    if download_image_file(image_url, image_filepath):
         print(f"图片下载：成功下载图片: {image_filename}")  # 增加日志
         return image_filepath
-    except requests.exceptions.RequestException as e:
-        print(f"错误：下载图片 {image_url} 失败: {e}")  # 增加日志
-        return None
+    return None
 
 
 # --- 爬取逻辑 ---
-# 修改 crawl_barcode 函数以接收行号并将其添加到结果中
-def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
+def ddgs_fallback(barcode, thread_name, cancel_event=None, claim=None):
     """
-    使用 Selenium 爬取单个条形码信息，处理Cloudflare和未找到情况，
-    提取数据，下载图片，并将结果添加到共享列表（包含行号）。
+    使用DDGS API作为备用方案获取产品图片和名称。
+    成功时将选中的图片直接写入标准图片目录并存入数据库，返回 (product_name, image_filepath)；否则返回None。
+    对冲竞速中：cancel_event 被设置时放弃；写入图片和入库之前调用 claim()，未能胜出则不写入。
+    实际访问DDGS的搜索出错（限流、超时等）计入 DDGS 熔断器的失败，正常返回（包括没有结果）计为成功；
+    命中搜索缓存时不访问DDGS，不计入熔断器。
     """
-    global count, count_1, count_2  # 使用全局计数器
-    print(f"线程 {thread_name} 开始处理条码: {barcode} (行号: {row_index})")  # 增加日志
+    global count, count_2  # 使用全局计数器
+    try:
+        ddgs_result = get_best_product_image(barcode, cancel_event=cancel_event, raise_errors=True,
+                                             breaker=source_breakers['ddgs'])
+        if ddgs_result and ddgs_result.get('image_data'):
+            # 从DDGS获取到图片（内存中的图片数据，尚未写入磁盘）
+            metadata = ddgs_result.get('metadata', {})
+
+            # 获取产品名称（从元数据的title字段）
+            product_name = metadata.get('title', f"Product {barcode}")
+
+            if claim is not None and not claim():
+                print(f"线程 {thread_name}: 条码 {barcode} 已由 barcodelookup 获取，放弃DDGS结果。")
+                return None
+            # 将选中的图片直接写入标准图片目录
+            if not os.path.exists(IMAGE_DIR):
+                os.makedirs(IMAGE_DIR, exist_ok=True)
+            image_filepath = os.path.join(IMAGE_DIR, f"{barcode}.jpg")
+            save_image_as_jpeg(ddgs_result['image_data'], ddgs_result['image_type'], image_filepath)
+            print(f"线程 {thread_name}: DDGS图片已保存: {image_filepath}")
+            image_url = metadata.get('image', '')
+
+            # 存储到数据库（覆盖旧的失败记录）
+            insert_product_to_db(barcode, product_name, image_url, image_filepath, source=SOURCE_DDGS)
+            print(f"线程 {thread_name}: 通过DDGS API成功获取条码 {barcode} 的数据。")
+
+            count_2 += 1
+            count += 1
+            print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")
+            print(f"线程 {thread_name}: 当前总成功计数: {count}")
+            return product_name, image_filepath
+        else:
+            print(f"线程 {thread_name}: DDGS API未能获取条码 {barcode} 的图片。")
+    except Exception as ddgs_error:
+        print(f"线程 {thread_name}: DDGS API调用失败：{ddgs_error}")
+    return None
+
+
+def save_crawled_product(barcode, thread_name, product_name, image_url):
+    """下载barcodelookup页面上的产品图片并存入数据库，返回 (product_name, image_filepath)。"""
+    global count, count_2  # 使用全局计数器
+    # --- 下载图片 ---
+    if image_url:
+        image_filepath = download_image(image_url, barcode)
+    else:
+        image_filepath = None
+        print(f"线程 {thread_name}: 没有图片URL，跳过图片下载。")  # 增加日志
+    # --- 存储到数据库 ---
+    insert_product_to_db(barcode, product_name, image_url, image_filepath, source=SOURCE_BARCODELOOKUP,
+                         error=None if image_filepath else "没有可用的产品图片")
+    print(f"线程 {thread_name}: 条码 {barcode} 数据已存入数据库。")  # 增加日志
+    print(f"线程 {thread_name}: 成功处理条码 {barcode}。")  # 增加日志
+    count_2 += 1  # 成功爬取的条码计数
+    print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")  # 增加日志
+    count += 1  # 增加总计数
+    print(f"线程 {thread_name}: 当前总成功计数: {count}")  # 增加日志
+    return product_name, image_filepath
+
+
+def cached_status(cached_data):
+    """缓存记录的状态；写入队列中尚无 status 的旧格式记录按产品名称推断。"""
+    return cached_data.get('status') or status_from_product_name(cached_data['product_name'])
+
+
+def classify_cached_product(cached_data):
+    """
+    根据缓存记录的状态（products.status）判断条码的处理方式：
+    'hit'         缓存中有有效数据，直接使用
+    'skip'        失败记录（"... And No Search" / "No Search"）的负缓存尚未过期，跳过
+    'old_failure' 旧的失败记录（"N/A" / "Not Found"），直接使用 DDGS API 重新检索
+    'crawl'       缓存未命中、无效或负缓存已过期，需要网络爬取
+    """
+    if not cached_data:
+        return 'crawl'
+    status = cached_status(cached_data)
+    if status == STATUS_OK and cached_data['image_filepath']:
+        return 'hit'
+    if status in NEGATIVE_CACHE_TTL:
+        # 写入队列中刚产生的失败记录 attempts 未知，按首次失败计算
+        expires_at = negative_cache_expires_at(dict(cached_data, status=status))
+        return 'skip' if expires_at > time.time() else 'crawl'
+    if status in RETRYABLE_STATUSES:
+        return 'old_failure'
+    return 'crawl'
+
+
+def _product_info(product_name, image_filepath=None, image_url=None, pending_download=False, parked=False):
+    """
+    页面获取阶段的结果。pending_download=True 表示图片尚未下载、结果尚未入库；
+    parked=True 表示可用的来源均在熔断中，条码暂存（不写入失败标记），稍后重试。
+    """
+    return {'product_name': product_name, 'image_filepath': image_filepath,
+            'image_url': image_url, 'pending_download': pending_download, 'parked': parked}
+
+
+def _parked_info():
+    return _product_info(None, parked=True)
+
+
+def fetch_product_info(barcode, thread_name, driver_pool=None, cached_data=None, prefetched=False):
+    """
+    页面获取阶段：获取单个条形码的产品名称和图片URL，处理Cloudflare和未找到情况。
+    先尝试直接HTTP请求并解析静态页面，页面不可用时才升级到 Selenium；
+    浏览器从 driver_pool 中借用（默认为进程级共享池），用完后归还而非关闭。
+    barcodelookup 页面上的图片不在此处下载，由 complete_product 完成下载和入库。
+    prefetched=True 表示调用方已批量查询过缓存，cached_data 即为该条码的缓存记录（可为 None）。
+
+    Returns:
+        dict: _product_info 结构；未获取到可写入Excel的结果时返回 None
+    """
+    global count, count_1  # 使用全局计数器
+    print(f"线程 {thread_name} 开始处理条码: {barcode}")  # 增加日志
 
     # 1. 检查数据库缓存
-    cached_data = get_product_from_db(barcode)
-    if cached_data and cached_data['product_name'] and cached_data['image_filepath'] and cached_data['product_name'] != "Not Found":
+    if not prefetched:
+        cached_data = get_product_from_db(barcode)
+    cache_status = classify_cached_product(cached_data)
+    if cache_status == 'hit':
         print(f"线程 {thread_name}: 条码 {barcode} 在缓存中找到有效数据。")  # 增加日志
-        results_list.append((barcode, cached_data['product_name'], cached_data['image_filepath'], row_index))  # 添加行号
         count_1 += 1  # 增加数据库找到的计数
         print(f"线程 {thread_name}: 当前数据库找到的条码数量: {count_1}")
         count += 1  # 增加总计数
         print(f"线程 {thread_name}: 当前总成功计数: {count}")
-        return  # 从缓存获取，跳过爬取
-    elif cached_data and cached_data['product_name'] == "Not Found And No Search":
-        print(f"线程 {thread_name}: 条码 {barcode} 在缓存中标记为未找到且无搜索结果，跳过。")  # 增加日志
-        return  # 已经尝试过所有方法，跳过
-    elif cached_data and cached_data['product_name'] == "N/A And No Search":
-        print(f"线程 {thread_name}: 条码 {barcode} 在缓存中标记为不规则数据且无搜索结果，跳过。")  # 增加日志
-        return  # 已经尝试过所有方法，跳过
-    elif cached_data and cached_data['product_name'] in ("N/A", "Not Found"):
+        return _product_info(cached_data['product_name'], cached_data['image_filepath'])  # 从缓存获取，跳过爬取
+    elif cache_status == 'skip':
+        print(f"线程 {thread_name}: 条码 {barcode} 在缓存中标记为 {cached_data['product_name']}，负缓存未过期，跳过。")  # 增加日志
+        return None  # 已经尝试过所有方法，跳过
+    elif cache_status == 'old_failure':
         # 旧的失败记录，直接尝试使用 DDGS API 重新检索
         print(f"线程 {thread_name}: 条码 {barcode} 在缓存中标记为旧失败记录 ({cached_data['product_name']})，尝试使用 DDGS API 重新检索。")
-        try:
-            ddgs_result = get_best_product_image(barcode)
-            if ddgs_result and ddgs_result.get('image_path'):
-                # 从DDGS获取到图片
-                temp_image_path = ddgs_result['image_path']
-                metadata = ddgs_result.get('metadata', {})
-                
-                # 获取产品名称（从元数据的title字段）
-                product_name = metadata.get('title', f"Product {barcode}")
-                
-                # 将临时图片移动到标准图片目录
-                final_image_path = os.path.join(IMAGE_DIR, f"{barcode}.jpg")
-                if os.path.exists(temp_image_path):
-                    shutil.move(temp_image_path, final_image_path)
-                    print(f"线程 {thread_name}: 移动临时图片成功: {temp_image_path} -> {final_image_path}")
-                    image_filepath = final_image_path
-                    image_url = metadata.get('image', '')
-                    
-                    # 更新数据库（覆盖旧的失败记录）
-                    insert_product_to_db(barcode, product_name, image_url, image_filepath)
-                    print(f"线程 {thread_name}: 通过DDGS API成功更新条码 {barcode} 的数据。")
-                    
-                    # 添加结果到列表
-                    results_list.append((barcode, product_name, image_filepath, row_index))
-                    count_2 += 1
-                    count += 1
-                    print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")
-                    print(f"线程 {thread_name}: 当前总成功计数: {count}")
-                    return  # 成功获取，退出函数
-                else:
-                    print(f"线程 {thread_name}: DDGS临时图片文件不存在: {temp_image_path}")
-            else:
-                print(f"线程 {thread_name}: DDGS API未能获取条码 {barcode} 的图片。")
-        except Exception as ddgs_error:
-            print(f"线程 {thread_name}: DDGS API调用失败：{ddgs_error}")
-        
+        if not source_breakers['ddgs'].allow():
+            print(f"线程 {thread_name}: DDGS 熔断中，暂存条码 {barcode}，稍后重试。")  # 增加日志
+            return _parked_info()
+        with _crawl_slot():
+            ddgs_result = ddgs_fallback(barcode, thread_name)
+        if ddgs_result:
+            return _product_info(*ddgs_result)  # 成功获取，退出函数
+
         # DDGS也失败了，根据原始标记更新为新标记
-        if cached_data['product_name'] == "Not Found":
+        if cached_status(cached_data) == STATUS_NOT_FOUND:
             new_mark = "Not Found And No Search"
-            print(f"线程 {thread_name}: DDGS搜索失败，更新条码 {barcode} 标记为 {new_mark}。")
-            insert_product_to_db(barcode, new_mark, None, None)
         else:  # N/A
             new_mark = "N/A And No Search"
-            print(f"线程 {thread_name}: DDGS搜索失败，更新条码 {barcode} 标记为 {new_mark}。")
-            insert_product_to_db(barcode, new_mark, None, None)
-        return  # 退出函数
-    # 2. 数据库中未找到或缓存无效，进行爬取
+        print(f"线程 {thread_name}: DDGS搜索失败，更新条码 {barcode} 标记为 {new_mark}。")
+        insert_product_to_db(barcode, new_mark, None, None, source=SOURCE_DDGS, error="旧失败记录经DDGS重新检索仍失败")
+        return None  # 退出函数
+    # 2. 数据库中未找到或缓存无效，网络爬取（对冲模式下 barcodelookup 与 DDGS 竞速）
+    if cached_data and cached_status(cached_data) in NEGATIVE_CACHE_TTL:
+        print(f"线程 {thread_name}: 条码 {barcode} 的失败记录 ({cached_data['product_name']}) 负缓存已过期，重新检索。")  # 增加日志
+    else:
+        print(f"线程 {thread_name}: 缓存未命中或无效，开始网络爬取条码 {barcode}。")  # 增加日志
+    with _crawl_slot():
+        if HEDGED_LOOKUP and source_breakers['ddgs'].state == 'closed':
+            return hedged_crawl(barcode, thread_name, driver_pool)
+        return crawl_barcodelookup(barcode, thread_name, driver_pool)
+
+
+def job_threads(num_threads=None):
+    """
+    本次任务的页面获取工作线程数。自适应并发开启时，调用方给出的 num_threads 为本任务的并发上限
+    （不超过 CONCURRENCY_MAX，同时作为 crawl_limiter 的上限），未给出时按 CONCURRENCY_MAX 创建工作线程，
+    实际并发度由 crawl_limiter 调整；关闭时未给出则使用 DEFAULT_THREADS。
+    """
+    if not ADAPTIVE_CONCURRENCY:
+        return num_threads or DEFAULT_THREADS
+    num_threads = min(num_threads, CONCURRENCY_MAX) if num_threads else CONCURRENCY_MAX
+    crawl_limiter.set_max_limit(num_threads)
+    return num_threads
+
+
+def _crawl_slot():
+    """网络爬取名额：自适应并发开启时由 crawl_limiter 控制同时进行的爬取数，否则由工作线程数决定。"""
+    return crawl_limiter.slot() if ADAPTIVE_CONCURRENCY else nullcontext()
+
+
+def ddgs_product_info(barcode, thread_name, crawl_start_time, cancel_event=None, claim=None):
+    """
+    DDGS 备用来源：成功时记录数据来源级别并返回 _product_info，否则返回 None。参数同 ddgs_fallback。
+    DDGS 熔断中时不请求：单独调用时返回暂存结果（parked）；作为对冲竞速的备用来源（claim 不为 None）时返回 None，
+    由主来源继续爬取，主来源的 fallback() 也失败时才暂存条码。
+    """
+    if not source_breakers['ddgs'].allow():
+        if claim is not None:
+            print(f"线程 {thread_name}: DDGS 熔断中，条码 {barcode} 等待 barcodelookup 结果。")  # 增加日志
+            return None
+        print(f"线程 {thread_name}: DDGS 熔断中，暂存条码 {barcode}，稍后重试。")  # 增加日志
+        return _parked_info()
+    ddgs_result = ddgs_fallback(barcode, thread_name, cancel_event=cancel_event, claim=claim)
+    if ddgs_result:
+        tier_stats.record(barcode, 'ddgs', time.time() - crawl_start_time)
+        return _product_info(*ddgs_result)
+    return None
+
+
+def _cancelled(cancel_event):
+    return cancel_event is not None and cancel_event.is_set()
+
+
+def hedged_crawl(barcode, thread_name, driver_pool=None):
+    """
+    对冲爬取：barcodelookup 超过 HEDGE_DELAY 秒未返回时并行启动 DDGS，先得到可用结果者胜出，
+    落败方被取消且不写入数据库。胜出来源和节省的时间记录在 hedge_stats 中。
+    """
+    crawl_start_time = time.time()
+    race = HedgedRace(
+        lambda cancel_event, fallback: crawl_barcodelookup(barcode, thread_name, driver_pool,
+                                                           fallback=fallback, cancel_event=cancel_event),
+        lambda cancel_event, claim: ddgs_product_info(barcode, thread_name, crawl_start_time,
+                                                      cancel_event=cancel_event, claim=claim),
+        delay=HEDGE_DELAY, name=f"{thread_name}/{barcode}")
+    winner, info = race.run()
+    hedge_stats.record(barcode, winner, race.elapsed, race.secondary_started_at, race.hedged)
+    print(f"线程 {thread_name}: 条码 {barcode} 对冲结果：{winner or '均失败'}，耗时 {race.elapsed:.2f} 秒。")  # 增加日志
+    return info
+
+
+def crawl_barcodelookup(barcode, thread_name, driver_pool=None, fallback=None, cancel_event=None):
+    """
+    barcodelookup 主来源：先尝试直接HTTP获取静态页面，不可用时升级到 Selenium。
+    页面未找到、数据异常或重试用尽时调用 fallback()（默认为 DDGS），它也失败时写入失败标记。
+    cancel_event 被设置（对冲竞速中 DDGS 已胜出）时在下一个检查点放弃，不写入任何结果。
+    barcodelookup 熔断中（开始前或重试过程中）时不再重试，直接使用 fallback()；它也失败则暂存条码。
+
+    Returns:
+        dict: _product_info 结构；未获取到可写入Excel的结果时返回 None
+    """
+    crawl_start_time = time.time()
+    if fallback is None:
+        fallback = lambda: ddgs_product_info(barcode, thread_name, crawl_start_time)
+    breaker = source_breakers['barcodelookup']
+    if not breaker.allow():
+        print(f"线程 {thread_name}: barcodelookup 熔断中，条码 {barcode} 直接使用下一来源。")  # 增加日志
+        return fallback() or _parked_info()
+    http_result = fetch_product_http(barcode, base_url=BASE_URL, name_xpath=PRODUCT_NAME_XPATH,
+                                     image_xpath=IMAGE_XPATH)
+    if http_result['status'] != 'challenge':
+        save_snapshot(barcode, http_result['html'], 'http', url=BASE_URL.format(barcode), status=http_result['status'])
+    if http_result['status'] in ('ok', 'not_found'):
+        breaker.record_success()
+        crawl_limiter.record_success(time.time() - crawl_start_time)
+    elif http_result['status'] == 'challenge':
+        crawl_limiter.record_congestion('challenge')  # 403 / 429 / 503 或拦截页
+    if http_result['status'] == 'ok':
+        print(f"线程 {thread_name}: HTTP直接获取成功，产品名称: '{http_result['product_name']}'")  # 增加日志
+        tier_stats.record(barcode, 'http', time.time() - crawl_start_time)
+        return _product_info(http_result['product_name'], image_url=http_result['image_url'], pending_download=True)
+    if http_result['status'] == 'not_found':
+        print(f"线程 {thread_name}: 条码 {barcode} 在barcodelookup.com未找到（HTTP），尝试使用DDGS API。")  # 增加日志
+        fallback_info = fallback()
+        if fallback_info:
+            return fallback_info
+        print(f"线程 {thread_name}: barcodelookup和DDGS均未找到条码 {barcode}，标记为未找到。")
+        insert_product_to_db(barcode, "Not Found And No Search", None, None, source=SOURCE_BARCODELOOKUP,
+                             error="barcodelookup和DDGS均未找到")
+        return None
+    if _cancelled(cancel_event):
+        return None
+    print(f"线程 {thread_name}: HTTP结果不可用 ({http_result['status']})，升级到 Selenium。")  # 增加日志
+
+    # 3. 使用 Selenium 浏览器爬取
     url = BASE_URL.format(barcode)
+    pool = driver_pool or get_driver_pool(DEFAULT_THREADS)
     driver = None
     retry_count = 10  # 重试次数
     product_name = None
     image_url = None
-    image_filepath = None
+    breaker_open = False  # 重试过程中 barcodelookup 熔断
     print(f"最大重试次数: {retry_count}")  # 增加日志
-    print(f"线程 {thread_name}: 缓存未命中或无效，开始网络爬取条码 {barcode}。")  # 增加日志
     for attempt in range(retry_count):
+        if _cancelled(cancel_event):
+            print(f"线程 {thread_name}: 条码 {barcode} 已由其他来源获取，停止 barcodelookup 爬取。")  # 增加日志
+            return None
+        if attempt > 0 and not breaker.allow():
+            print(f"线程 {thread_name}: barcodelookup 已熔断，停止重试条码 {barcode}，直接使用下一来源。")  # 增加日志
+            breaker_open = True
+            break
+        driver_broken = False  # 本次尝试中浏览器是否已损坏（损坏则不再放回池中）
+        attempt_start_time = time.time()
         try:
             # 随机选择 User-Agent 和 stealth 配置
             ua = get_random_user_agent()
             #stealth_cfg = get_random_stealth_config()
-            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 启动浏览器并导航到 {url}")  # 增加日志
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")  # 无头模式：不显示浏览器窗口
-            chrome_options.add_argument("--disable-gpu")  # 禁用 GPU 加速，有时可避免问题
-            chrome_options.add_argument("--window-size=1920x1080")  # 设置浏览器窗口大小
-            chrome_options.add_argument(f"user-agent={ua}")
-            driver = webdriver.Chrome(options=chrome_options)
+            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 从浏览器池获取浏览器并导航到 {url}")  # 增加日志
+            driver = pool.acquire()
+            # 复用的浏览器通过 CDP 覆盖 User-Agent，保持每次尝试随机 UA
+            try:
+                driver.execute_cdp_cmd('Network.setUserAgentOverride', {'userAgent': ua})
+            except Exception as e:
+                print(f"线程 {thread_name}: 设置User-Agent失败: {e}")
             # 设置额外的请求头来避免被拦截
             try:
                 driver.execute_cdp_cmd('Network.setExtraHTTPHeaders', {
@@ -194,86 +410,68 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
             except Exception as e:
                 print(f"线程 {thread_name}: 设置额外请求头失败: {e}")
             driver.set_page_load_timeout(10)
-            driver.get(url)
-            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 等待页面加载...")  # 增加日志
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 页面加载完成。")  # 增加日志
+            throttle(url)  # 与 HTTP 获取共用 barcodelookup 的令牌桶
+            driver.get(url)  # eager 加载策略：DOMContentLoaded 后即返回
+            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 等待目标元素...")  # 增加日志
+            try:
+                # 只等待产品名称和图片两个节点（或未找到/拦截页面），不等待整页加载
+                WebDriverWait(driver, 10).until(target_elements_ready(PRODUCT_NAME_XPATH, IMAGE_XPATH))
+                print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 目标元素已就绪。")  # 增加日志
+            except TimeoutException:
+                print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 等待目标元素超时，继续检测页面。")  # 增加日志
             # --- Cloudflare 拦截检测 ---
             if "Just a moment..." in driver.title or "Cloudflare" in driver.title or "Enable JavaScript and cookies to continue" in driver.page_source:
                 print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 检测到 Cloudflare 拦截页面，进行重试。")  # 增加日志
+                breaker.record_failure('challenge')
+                crawl_limiter.record_congestion('challenge')
                 
                 #retry_count += 1  # 增加重试次数
                 print(f"Cloudflare 拦截检测,本次不计数进行额外尝试")  # 增加日志
                 #record_failure(ua, stealth_cfg)  # 记录失败的UA和配置
                 wait_time = random.uniform(0.125 * (2 ** ((attempt % 5) + 1)), 0.5 * (2 ** ((attempt % 5) + 1))) # 指数退避等待时间
                 print(f"等待 {wait_time} 秒后重试")
-                time.sleep(wait_time)  # 等待一段时间后重试
-                if driver:
-                    driver.quit()
+                pool.release(driver)  # 先归还浏览器，等待期间供其他线程使用
+                driver = None
+                if cancel_event is not None:
+                    cancel_event.wait(wait_time)  # 等待期间其他来源胜出则立即结束
+                else:
+                    time.sleep(wait_time)  # 等待一段时间后重试
                 continue  # 进入下一次重试
             else:
                 #record_success(ua, stealth_cfg)  # 记录成功的UA和配置
                 print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): Cloudflare 拦截检测通过。")  # 增加日志
+                breaker.record_success()
+                crawl_limiter.record_success(time.time() - attempt_start_time)
+                save_snapshot(barcode, driver.page_source, 'selenium', url=url,
+                              status='not_found' if "Barcode Not Found | Barcode Lookup" in driver.title else 'rendered')
                 print(f"线程 {thread_name}当前UA: {ua}")  # 增加日志
                 #print(f"线程 {thread_name}当前Stealth配置: {stealth_cfg}")  # 增加日志
             # --- 条码未找到检测 ---
             if "Barcode Not Found | Barcode Lookup" in driver.title:
                 print(f"线程 {thread_name}: 条码 {barcode} 在barcodelookup.com未找到，尝试使用DDGS API。")  # 增加日志
-                if driver:
-                    driver.quit()
-                
+                pool.release(driver)
+                driver = None
+
                 # 尝试使用DDGS API作为备用方案
-                try:
-                    ddgs_result = get_best_product_image(barcode)
-                    if ddgs_result and ddgs_result.get('image_path'):
-                        # 从DDGS获取到图片
-                        temp_image_path = ddgs_result['image_path']
-                        metadata = ddgs_result.get('metadata', {})
-                        
-                        # 获取产品名称（从元数据的title字段）
-                        product_name = metadata.get('title', f"Product {barcode}")
-                        
-                        # 将临时图片移动到标准图片目录
-                        final_image_path = os.path.join(IMAGE_DIR, f"{barcode}.jpg")
-                        if os.path.exists(temp_image_path):
-                            shutil.move(temp_image_path, final_image_path)
-                            image_filepath = final_image_path
-                            image_url = metadata.get('image', '')
-                            
-                            # 存储到数据库
-                            insert_product_to_db(barcode, product_name, image_url, image_filepath)
-                            print(f"线程 {thread_name}: 通过DDGS API成功获取条码 {barcode} 的数据。")
-                            
-                            # 添加结果到列表
-                            results_list.append((barcode, product_name, image_filepath, row_index))
-                            count_2 += 1
-                            count += 1
-                            print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")
-                            print(f"线程 {thread_name}: 当前总成功计数: {count}")
-                            return  # 成功获取，退出函数
-                        else:
-                            print(f"线程 {thread_name}: DDGS临时图片文件不存在: {temp_image_path}")
-                    else:
-                        print(f"线程 {thread_name}: DDGS API未能获取条码 {barcode} 的图片。")
-                except Exception as ddgs_error:
-                    print(f"线程 {thread_name}: DDGS API调用失败：{ddgs_error}")
-                
+                fallback_info = fallback()
+                if fallback_info:
+                    return fallback_info  # 成功获取，退出函数
+
                 # DDGS也失败了，标记为未找到
                 print(f"线程 {thread_name}: barcodelookup和DDGS均未找到条码 {barcode}，标记为未找到。")
-                insert_product_to_db(barcode, "Not Found And No Search", None, None)
-                return  # 立即退出函数
+                insert_product_to_db(barcode, "Not Found And No Search", None, None, source=SOURCE_BARCODELOOKUP,
+                                     error="barcodelookup和DDGS均未找到")
+                return None  # 立即退出函数
             # --- 提取数据 ---
             print(f"线程 {thread_name}: 开始提取产品信息...")  # 增加日志
             try:
                 # 提取产品名称
-                product_name_element = WebDriverWait(driver, 5).until(
+                product_name_element = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
                     EC.presence_of_element_located((By.XPATH, PRODUCT_NAME_XPATH))
                 )
                 product_name = product_name_element.text.strip()
                 #对产品名称进行检测，如果前6个字符都是数字，第七位是一个"."，则认为是错误的产品名称，依旧记录为None 
-                if len(product_name) >= 7 and product_name[:6].isdigit() and product_name[6] == ".":
+                if is_invalid_product_name(product_name):
                     print(f"线程 {thread_name}: 提取到的产品名称 '{product_name}' 格式异常，标记为未找到。")  # 增加日志
                     product_name = None
                 print(f"线程 {thread_name}: 提取到产品名称: '{product_name}'")  # 增加日志
@@ -284,52 +482,22 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
             # 如果产品名称异常，即为"N/A"，则尝试使用DDGS API搜索
             if product_name == "N/A":
                 print(f"线程 {thread_name}: 产品名称异常，尝试使用DDGS API搜索。")  # 增加日志
-                if driver:
-                    driver.quit()
-                
+                pool.release(driver)
+                driver = None
+
                 # 尝试使用DDGS API作为备用方案
-                try:
-                    ddgs_result = get_best_product_image(barcode)
-                    if ddgs_result and ddgs_result.get('image_path'):
-                        # 从DDGS获取到图片
-                        temp_image_path = ddgs_result['image_path']
-                        metadata = ddgs_result.get('metadata', {})
-                        
-                        # 获取产品名称（从元数据的title字段）
-                        product_name = metadata.get('title', f"Product {barcode}")
-                        
-                        # 将临时图片移动到标准图片目录
-                        final_image_path = os.path.join(IMAGE_DIR, f"{barcode}.jpg")
-                        if os.path.exists(temp_image_path):
-                            shutil.move(temp_image_path, final_image_path)
-                            image_filepath = final_image_path
-                            image_url = metadata.get('image', '')
-                            
-                            # 存储到数据库
-                            insert_product_to_db(barcode, product_name, image_url, image_filepath)
-                            print(f"线程 {thread_name}: 通过DDGS API成功获取条码 {barcode} 的数据。")
-                            
-                            # 添加结果到列表
-                            results_list.append((barcode, product_name, image_filepath, row_index))
-                            count_2 += 1
-                            count += 1
-                            print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")
-                            print(f"线程 {thread_name}: 当前总成功计数: {count}")
-                            return  # 成功获取，退出函数
-                        else:
-                            print(f"线程 {thread_name}: DDGS临时图片文件不存在: {temp_image_path}")
-                    else:
-                        print(f"线程 {thread_name}: DDGS API未能获取条码 {barcode} 的图片。")
-                except Exception as ddgs_error:
-                    print(f"线程 {thread_name}: DDGS API调用失败：{ddgs_error}")
-                
+                fallback_info = fallback()
+                if fallback_info:
+                    return fallback_info  # 成功获取，退出函数
+
                 # DDGS也失败了，标记为N/A And No Search （数据异常且搜索失败）
                 print(f"线程 {thread_name}: 产品名称异常且DDGS搜索失败，标记为N/A And No Search。")
-                insert_product_to_db(barcode, "N/A And No Search", None, None)
-                return  # 立即退出函数
+                insert_product_to_db(barcode, "N/A And No Search", None, None, source=SOURCE_BARCODELOOKUP,
+                                     error="产品名称异常且DDGS搜索失败")
+                return None  # 立即退出函数
             try:
                 # 提取图片URL
-                image_element = WebDriverWait(driver, 5).until(
+                image_element = WebDriverWait(driver, ELEMENT_WAIT_TIMEOUT).until(
                     EC.presence_of_element_located((By.XPATH, IMAGE_XPATH))
                 )
                 image_url = image_element.get_attribute('src')
@@ -337,85 +505,434 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
             except (TimeoutException, WebDriverException):
                 print(f"线程 {thread_name}: 未找到图片元素或提取失败。")  # 增加日志
                 image_url = None  # 未找到则标记为None
-            # --- 下载图片 ---
-            if image_url:
-                image_filepath = download_image(image_url, barcode)
-            else:
-                image_filepath = None
-                print(f"线程 {thread_name}: 没有图片URL，跳过图片下载。")  # 增加日志
-            # --- 存储到数据库 ---
-            insert_product_to_db(barcode, product_name, image_url, image_filepath)
-            print(f"线程 {thread_name}: 条码 {barcode} 数据已存入数据库。")  # 增加日志
-            # --- 添加结果到列表 ---
-            results_list.append((barcode, product_name, image_filepath, row_index))  # 添加行号
-            print(f"线程 {thread_name}: 成功处理条码 {barcode}。")  # 增加日志
-            count_2 += 1  # 成功爬取的条码计数
-            print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")  # 增加日志
-            count += 1  # 增加总计数
-            print(f"线程 {thread_name}: 当前总成功计数: {count}")  # 增加日志
-            break  # 成功完成，退出重试循环
+            # 页面数据已提取完毕，归还浏览器；图片下载和入库由 complete_product 完成
+            pool.release(driver)
+            driver = None
+            tier_stats.record(barcode, 'selenium', time.time() - crawl_start_time)
+            return _product_info(product_name, image_url=image_url, pending_download=True)  # 成功完成，退出重试循环
         except (TimeoutException, WebDriverException) as e:
             print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 使用 Selenium 发生错误：{e}")  # 增加日志
+            breaker.record_failure('timeout' if isinstance(e, TimeoutException) else 'error')
+            if isinstance(e, TimeoutException):
+                crawl_limiter.record_congestion('timeout')
             if driver:
-                driver.quit()  # 发生错误时关闭浏览器实例
+                # 超时的浏览器归还时会被重置回空白页；其他 WebDriver 错误则丢弃该实例，由池重建
+                pool.release(driver, discard=not isinstance(e, TimeoutException))
+                driver = None
             # 如果还有重试次数，打印重试提示
             if attempt < retry_count - 1:
                 print(f"线程 {thread_name}: 进行重试。")  # 增加日志
             else:
                 # 如果达到最大重试次数，尝试使用DDGS API作为备用方案
                 print(f"线程 {thread_name}: 达到最大重试次数，尝试使用DDGS API获取图片。")  # 增加日志
-                try:
-                    ddgs_result = get_best_product_image(barcode)
-                    if ddgs_result and ddgs_result.get('image_path'):
-                        # 从DDGS获取到图片
-                        temp_image_path = ddgs_result['image_path']
-                        metadata = ddgs_result.get('metadata', {})
-                        
-                        # 获取产品名称（从元数据的title字段）
-                        product_name = metadata.get('title', f"Product {barcode}")
-                        
-                        # 将临时图片移动到标准图片目录
-                        final_image_path = os.path.join(IMAGE_DIR, f"{barcode}.jpg")
-                        if os.path.exists(temp_image_path):
-                            shutil.move(temp_image_path, final_image_path)
-                            image_filepath = final_image_path
-                            image_url = metadata.get('image', '')
-                            
-                            # 存储到数据库
-                            insert_product_to_db(barcode, product_name, image_url, image_filepath)
-                            print(f"线程 {thread_name}: 通过DDGS API成功获取条码 {barcode} 的数据。")
-                            
-                            # 添加结果到列表
-                            results_list.append((barcode, product_name, image_filepath, row_index))
-                            count_2 += 1
-                            count += 1
-                            print(f"线程 {thread_name}: 当前成功爬取条码数量: {count_2}")
-                            print(f"线程 {thread_name}: 当前总成功计数: {count}")
-                            return  # 成功获取，退出函数
-                        else:
-                            print(f"线程 {thread_name}: DDGS临时图片文件不存在: {temp_image_path}")
-                    else:
-                        print(f"线程 {thread_name}: DDGS API未能获取条码 {barcode} 的图片。")
-                except Exception as ddgs_error:
-                    print(f"线程 {thread_name}: DDGS API调用失败：{ddgs_error}")
-                
+                fallback_info = fallback()
+                if fallback_info:
+                    return fallback_info  # 成功获取，退出函数
+
                 # DDGS也失败了，标记为未找到
                 print(f"线程 {thread_name}: 所有方法均失败，标记条码 {barcode} 为未搜索到。")
-                insert_product_to_db(barcode, "No Search", None, None)
+                insert_product_to_db(barcode, "No Search", None, None, source=SOURCE_BARCODELOOKUP,
+                                     error=f"达到最大重试次数且DDGS失败：{e}")
         except Exception as e:
             print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 发生未知错误：{e}")  # 增加日志
-            if driver:
-                driver.quit()  # 发生错误时关闭浏览器实例
+            driver_broken = True  # 未知错误，不再复用该浏览器实例
             break  # 未知错误，不再重试
         finally:
             if driver:
-                driver.quit()  # 确保每次尝试后都关闭浏览器实例
+                pool.release(driver, discard=driver_broken)  # 确保每次尝试后都归还浏览器实例
+                driver = None
+    if breaker_open:
+        return fallback() or _parked_info()  # 下一来源也不可用时暂存，不写入失败标记
+    return None
+
+
+def complete_product(barcode, thread_name, info):
+    """
+    图片下载阶段：对页面获取阶段的结果下载图片并存入数据库。
+    同一条码的下载通过单飞登记表合并，共享页面结果的多个调用只下载一次。
+
+    Returns:
+        tuple: (product_name, image_filepath)；info 为 None 或暂存（parked）时返回 None
+    """
+    if info is None or info['parked']:
+        return None
+    if not info['pending_download']:
+        return info['product_name'], info['image_filepath']
+    result, _ = barcode_inflight.do(('download', normalize_barcode(barcode)),
+                                    lambda: save_crawled_product(barcode, thread_name, info['product_name'],
+                                                                 info['image_url']))
+    return result
+
+
+def crawl_barcode(barcode, thread_name, **kwargs):
+    """
+    爬取单个条形码信息：页面获取 + 图片下载。参数同 fetch_product_info。
+
+    Returns:
+        tuple: (product_name, image_filepath)；未获取到可写入Excel的结果时返回 None
+    """
+    return complete_product(barcode, thread_name, fetch_product_info(barcode, thread_name, **kwargs))
+
+
+def fetch_product_info_shared(barcode, thread_name, **kwargs):
+    """
+    单飞页面获取：同一条码（跨线程、跨 /upload 任务）同时只获取一次，
+    其他调用等待并共享同一结果。参数同 fetch_product_info。
+    """
+    info, shared = barcode_inflight.do(normalize_barcode(barcode),
+                                       lambda: fetch_product_info(barcode, thread_name, **kwargs))
+    if shared:
+        print(f"线程 {thread_name}: 条码 {barcode} 已由其他线程处理，共享其结果。")  # 增加日志
+    return info
+
+
+def crawl_barcode_shared(barcode, thread_name, **kwargs):
+    """单飞爬取：页面获取和图片下载均按条码合并。参数同 fetch_product_info。"""
+    return complete_product(barcode, thread_name, fetch_product_info_shared(barcode, thread_name, **kwargs))
+
+
+# 后台重验证：前台空闲时逐个重新检索负缓存已过期的失败条码（由 server.py 启动）
+revalidation_runner = RevalidationRunner(crawl_barcode_shared)
+
+
+# 修改 crawl_barcode 函数以接收行号并将其添加到结果中
+def crawl_barcode_with_row(barcode, thread_name, results_list, row_index, **kwargs):
+    """
+    爬取单个条形码信息，并将结果添加到共享列表（包含行号）。参数同 crawl_barcode。
+    """
+    result = crawl_barcode_shared(barcode, thread_name, **kwargs)
+    if result:
+        product_name, image_filepath = result
+        results_list.append((barcode, product_name, image_filepath, row_index))  # 添加行号
+
+
+@foreground_activity.track
+def process_excel_streaming(excel_filepath, barcode_column_letter, start_row, end_row, image_column_letter,
+                            product_name_column_letter, translate_dst_column_letter, num_threads=None,
+                            cancel_event=None, job_id=None):
+    """
+    分阶段流式处理Excel：缓存查询、页面获取、图片下载、图片后处理、翻译和写入各自并发、重叠执行。
+    某一行的产品名称一经获得即进入翻译队列，不必等待全部爬取完成。
+    工作簿只加载一次，由单个写入线程修改，保存到 *_translated.xlsx（原文件不修改）。
+
+    每行的进度记录在任务日志（barcode_excel_journal）中，输出工作簿每 CHECKPOINT_INTERVAL 秒保存一次；
+    job_id 对应已有任务时从上次保存的输出工作簿和行状态继续（见 resume）。
+
+    Returns:
+        str: 输出文件路径；读取Excel失败时返回 None
+    """
+    global count, count_1, count_2  # 使用全局计数器
+    total_start_time = time.time()  # 记录总程序开始时间
+    print("脚本开始执行（流式管道）。")  # 增加日志
+    print(f"用户输入：Excel文件路径='{excel_filepath}', 条码列='{barcode_column_letter}', 开始行={start_row}, 结束行={end_row}, 产品名称列='{product_name_column_letter}', 图片列='{image_column_letter}', 翻译列='{translate_dst_column_letter}'")  # 增加日志
+    params = {'excel_filepath': excel_filepath, 'barcode_column_letter': barcode_column_letter,
+              'start_row': start_row, 'end_row': end_row, 'image_column_letter': image_column_letter,
+              'product_name_column_letter': product_name_column_letter,
+              'translate_dst_column_letter': translate_dst_column_letter, 'num_threads': num_threads}
+    init_database()
+    init_journal()
+    output_path = excel_filepath.replace('.xlsx', '_translated.xlsx')
+    job = get_job(job_id) if job_id else None
+    journal_rows = load_job_rows(job_id) if job else {}  # row_index -> 上次记录的进度
+    # 续跑时从上次保存的输出工作簿继续，已写入的单元格无需重做
+    workbook_path = output_path if job and os.path.exists(output_path) else excel_filepath
+    try:
+        workbook = openpyxl.load_workbook(workbook_path)
+    except Exception as e:
+        print(f"错误：读取Excel文件失败：{e}")  # 增加日志
+        return None
+    sheet = workbook.active
+    barcode_col_index = column_index_from_string(barcode_column_letter)
+    product_name_col_index = column_index_from_string(product_name_column_letter)
+    image_col_index = column_index_from_string(image_column_letter)
+    translate_col_index = column_index_from_string(translate_dst_column_letter)
+    sheet.column_dimensions[get_column_letter(image_col_index)].width = 12  # 设置图片列的宽度
+    if end_row is None or end_row > sheet.max_row:
+        end_row = sheet.max_row
+
+    # 1. 在启动工作线程之前读取所有行；此后工作表只由写入线程访问
+    rows_by_barcode = {}  # barcode -> [(row_index, 原产品名称, 原条码单元格值), ...]
+    rows_without_barcode = []  # [(row_index, 原产品名称)]，只需翻译
+    restored_rows = []  # [(row_index, 原产品名称, 原条码单元格值, 日志记录)]，续跑时已有进度的行
+    journal_entries = []  # [(row_index, barcode 或 None)]，用于登记新任务
+    for row_index in range(start_row, end_row + 1):
+        barcode_value = sheet.cell(row=row_index, column=barcode_col_index).value
+        original_name = sheet.cell(row=row_index, column=product_name_col_index).value
+        has_barcode = barcode_value is not None and str(barcode_value).strip() != ""
+        journal_entries.append((row_index, normalize_barcode(barcode_value) if has_barcode else None))
+        record = journal_rows.get(row_index)
+        if record and record['state'] != 'pending':
+            restored_rows.append((row_index, original_name, barcode_value, record))
+        elif has_barcode:
+            rows_by_barcode.setdefault(normalize_barcode(barcode_value), []).append(
+                (row_index, original_name, barcode_value))
+        else:
+            rows_without_barcode.append((row_index, original_name))
+    num_rows = sum(1 for _, barcode in journal_entries if barcode)
+    if job is None:
+        job_id = job_id or new_job_id()
+        create_job(job_id, params, output_path, journal_entries)
+    else:
+        set_job_status(job_id, 'running')
+        print(f"续跑任务 {job_id}：{len(restored_rows)} 行已有进度，从断点继续。")  # 增加日志
+    print(f"任务 {job_id}：共 {len(rows_by_barcode)} 个待处理条码，{len(rows_without_barcode)} 行无条码。")  # 增加日志
+    num_threads = max(1, min(job_threads(num_threads), len(rows_by_barcode) or 1))
+    driver_pool = get_driver_pool(num_threads)  # 跨条码、跨任务复用的浏览器池（按需新建浏览器）
+    pipeline = StagedPipeline()
+
+    # 检查点状态（只由写入线程和 join 之后的主线程访问）
+    product_rows = {row_index for row_index, _ in rows_without_barcode}  # 产品部分已完成（无需写入或已写入）的行
+    translated_rows = set()  # 翻译已写入的行
+    saved_written = set()  # 已在日志中标记为 written 的行
+    saved_translated = set()  # 已在日志中标记为 translated 的行
+    for row_index, _, _, record in restored_rows:
+        if record['state'] in ('written', 'translated'):
+            product_rows.add(row_index)
+            saved_written.add(row_index)
+    last_checkpoint = [time.time()]
+    parked_rows = []  # 来源熔断而暂存的行：保持 pending 状态，resume 时重新获取
+
+    def save_checkpoint():
+        """保存输出工作簿，并把随工作簿落盘的行推进到 written / translated。"""
+        try:
+            workbook.save(output_path)
+        except Exception as e:
+            print(f"错误：保存Excel文件时发生错误：{e}")  # 增加日志
+            return False
+        newly_written = product_rows - saved_written
+        advance_rows(job_id, newly_written, 'written')
+        saved_written.update(newly_written)
+        newly_translated = (product_rows & translated_rows) - saved_translated
+        advance_rows(job_id, newly_translated, 'translated')
+        saved_translated.update(newly_translated)
+        last_checkpoint[0] = time.time()
+        print(f"检查点：已保存 {output_path}，累计完成 {len(saved_translated)} 行。")  # 增加日志
+        return True
+
+    def translate_row(row_index, text, ean):
+        """提交一行翻译；续跑时已保存的翻译直接写入，不重复调用翻译接口。"""
+        record = journal_rows.get(row_index)
+        if record and record['translation'] is not None:
+            pipeline.submit('write', ('translation', row_index, record['translation']))
+        else:
+            pipeline.submit('translate', (row_index, text, ean))
+
+    def translate_rows(rows, text):
+        """将条码对应的每一行提交到翻译阶段。text 为 None 时翻译该行原有的产品名称。"""
+        for row_index, original_name, barcode_value in rows:
+            translate_row(row_index, text if text is not None else original_name, barcode_value)
+
+    def finish_without_product(rows):
+        """该条码没有可写入的产品结果：记录进度并翻译原有内容。"""
+        advance_rows(job_id, [row_index for row_index, _, _ in rows], 'image_done')
+        for row_index, _, _ in rows:
+            pipeline.submit('write', ('none', row_index))
+        translate_rows(rows, None)
+
+    # 2. 缓存查询阶段：每个条目为一批 [(barcode, rows)]，批量查询后分流
+    def handle_lookup(chunk, thread_name):
+        global count, count_1
+        cached_products = get_products_from_db([barcode for barcode, _ in chunk])
+        for barcode, rows in chunk:
+            cached_data = cached_products.get(barcode)
+            cache_status = classify_cached_product(cached_data)
+            if cache_status == 'hit':
+                count_1 += len(rows)  # 增加数据库找到的计数
+                count += len(rows)  # 增加总计数
+                advance_rows(job_id, [row_index for row_index, _, _ in rows], 'image_done',
+                             product_name=cached_data['product_name'], image_filepath=cached_data['image_filepath'])
+                translate_rows(rows, cached_data['product_name'])
+                pipeline.submit('postprocess', (barcode, rows, cached_data['product_name'], cached_data['image_filepath']))
+            elif cache_status == 'skip':
+                print(f"线程 {thread_name}: 条码 {barcode} 在缓存中标记为 {cached_data['product_name']}，负缓存未过期，跳过。")  # 增加日志
+                finish_without_product(rows)
+            elif not pipeline.submit('fetch', (barcode, rows, cached_data)):
+                break  # 页面获取阶段已取消
+
+    # 3. 页面获取阶段：名称一经获得立即分叉到翻译阶段，图片交给下载阶段
+    def handle_fetch(task, thread_name):
+        barcode, rows, cached_data = task
+        if cancel_event is not None and cancel_event.is_set():
+            return  # 任务已取消，跳过尚未开始的条码
+        info = fetch_product_info_shared(barcode, thread_name, driver_pool=driver_pool,
+                                         cached_data=cached_data, prefetched=True)
+        if info is None:
+            finish_without_product(rows)
+            return
+        if info['parked']:
+            # 来源均在熔断中：不写入、不翻译，行保持 pending，任务结束后可通过 resume 重试
+            parked_rows.extend(row_index for row_index, _, _ in rows)
+            return
+        row_indices = [row_index for row_index, _, _ in rows]
+        if info['pending_download']:
+            advance_rows(job_id, row_indices, 'fetched', product_name=info['product_name'], image_url=info['image_url'])
+        else:
+            advance_rows(job_id, row_indices, 'image_done', product_name=info['product_name'],
+                         image_filepath=info['image_filepath'])
+        translate_rows(rows, info['product_name'])
+        pipeline.submit('download', (barcode, rows, info))
+
+    # 4. 图片下载阶段：下载并入库
+    def handle_download(task, thread_name):
+        global count
+        barcode, rows, info = task
+        product_name, image_filepath = complete_product(barcode, thread_name, info)
+        count += len(rows) - 1  # 重复行共享同一结果，计入成功数量
+        advance_rows(job_id, [row_index for row_index, _, _ in rows], 'image_done',
+                     product_name=product_name, image_filepath=image_filepath)
+        pipeline.submit('postprocess', (barcode, rows, product_name, image_filepath))
+
+    # 5. 图片后处理阶段：解码校验图片并取得尺寸，写入线程只需嵌入
+    def handle_postprocess(task, thread_name):
+        barcode, rows, product_name, image_filepath = task
+        image_size = prepare_excel_image(image_filepath)
+        for row_index, _, _ in rows:
+            pipeline.submit('write', ('product', row_index, barcode, product_name, image_filepath, image_size))
+
+    # 6. 翻译阶段：成功的翻译立即存入任务日志
+    def handle_translate(task, thread_name):
+        row_index, text, ean = task
+        success, result = translate_with_retry(text, ean, row_index, show_log=True)
+        if success:
+            save_translation(job_id, row_index, result)
+        pipeline.submit('write', ('translation', row_index, result))
+
+    # 7. 写入阶段：单线程持有工作簿，定期保存检查点
+    def handle_write(task, thread_name):
+        kind, row_index = task[0], task[1]
+        if kind == 'product':
+            _, row_index, barcode, product_name, image_filepath, image_size = task
+            write_product_to_sheet(sheet, row_index, barcode, product_name, image_filepath,
+                                   product_name_col_index, image_col_index, image_size=image_size)
+        elif kind == 'translation':
+            sheet.cell(row=row_index, column=translate_col_index, value=task[2])
+        # kind == 'none'：该行没有可写入的产品结果，只记录进度
+        if kind == 'translation':
+            translated_rows.add(row_index)
+        else:
+            product_rows.add(row_index)
+        if time.time() - last_checkpoint[0] >= CHECKPOINT_INTERVAL:
+            save_checkpoint()
+
+    # 阶段按上游到下游的顺序添加，join 时依次排空
+    pipeline.add_stage('lookup', handle_lookup, num_workers=1)
+    pipeline.add_stage('fetch', handle_fetch, num_workers=num_threads)
+    pipeline.add_stage('download', handle_download, num_workers=PIPELINE_DOWNLOAD_WORKERS)
+    pipeline.add_stage('postprocess', handle_postprocess, num_workers=PIPELINE_POSTPROCESS_WORKERS)
+    pipeline.add_stage('translate', handle_translate, num_workers=TRANSLATE_WORKERS)
+    pipeline.add_stage('write', handle_write, num_workers=1)
+    pipeline.start()
+    print(f"开始流式处理：页面获取 {num_threads} 线程，图片下载 {PIPELINE_DOWNLOAD_WORKERS} 线程，"
+          f"翻译 {TRANSLATE_WORKERS} 线程。")  # 增加日志
+    try:
+        # 续跑：已有进度的行从对应阶段继续
+        for row_index, original_name, barcode_value, record in restored_rows:
+            state = record['state']
+            if state == 'translated':
+                continue  # 该行已完成
+            barcode = normalize_barcode(barcode_value) if barcode_value is not None else None
+            rows = [(row_index, original_name, barcode_value)]
+            if state == 'fetched':
+                info = _product_info(record['product_name'], image_url=record['image_url'], pending_download=True)
+                pipeline.submit('download', (barcode, rows, info))
+            elif state == 'image_done':
+                if record['product_name'] is not None:
+                    pipeline.submit('postprocess', (barcode, rows, record['product_name'], record['image_filepath']))
+                else:
+                    pipeline.submit('write', ('none', row_index))
+            # written：产品部分已落盘，只需翻译
+            translate_rows(rows, record['product_name'])
+        items = list(rows_by_barcode.items())
+        for i in range(0, len(items), BULK_QUERY_CHUNK_SIZE):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            pipeline.submit('lookup', items[i:i + BULK_QUERY_CHUNK_SIZE])
+        for row_index, original_name in rows_without_barcode:
+            translate_row(row_index, original_name, None)
+        if cancel_event is not None and cancel_event.is_set():
+            pipeline.cancel(['lookup', 'fetch'])  # 放弃尚未开始的条码，已获取的结果继续写入
+    finally:
+        pipeline.join()
+    print(f"流式管道统计: {pipeline.metrics()}")  # 增加日志（busy_seconds 最大的阶段即瓶颈）
+    print(f"浏览器池统计: {driver_pool.metrics()}")  # 增加日志
+    print(f"数据来源分级统计: {tier_stats.summary()}")  # 增加日志（http / selenium / ddgs）
+    print(f"对冲统计: {hedge_stats.summary()}")  # 增加日志
+    print(f"熔断器统计: {breaker_metrics()}")  # 增加日志
+    print(f"并发控制统计: {crawl_limiter.metrics()}")  # 增加日志
+    print(f"主机限速统计: {host_limiter.metrics()}")  # 增加日志
+    print(f"图片下载统计: {download_metrics()}")  # 增加日志
+    print(f"DDGS搜索缓存统计: {search_cache_metrics()}")  # 增加日志
+    print(f"单飞去重统计: {barcode_inflight.metrics()}")  # 增加日志
+    print(f"数据库写入队列统计: {product_writer.metrics()}")  # 增加日志
+
+    # 8. 最终保存
+    if save_checkpoint():
+        print(f"结果已保存到: {output_path}")  # 增加日志
+        cancelled = cancel_event is not None and cancel_event.is_set()
+        if cancelled:
+            set_job_status(job_id, 'cancelled')
+        elif parked_rows:
+            # 有行因来源熔断而暂存，待来源恢复后 POST /resume/<job_id> 重试这些行
+            set_job_status(job_id, 'parked')
+            print(f"任务 {job_id}：{len(parked_rows)} 行因数据来源熔断暂存，来源恢复后可续跑。")  # 增加日志
+        else:
+            set_job_status(job_id, 'done')
+    else:
+        output_path = None
+    total_execution_time = time.time() - total_start_time
+    print("\n" + "=" * 30)
+    print("脚本执行完成。")
+    print(f"总执行时间 (包括翻译和Excel写入): {total_execution_time:.2f} 秒")
+    print(f"处理条码数量: {num_rows}")
+    if num_rows > 0:
+        print(f"平均每个条码时间: {total_execution_time / num_rows:.2f} 秒")
+    print("=" * 30)
+    print("{} 个条形码失败。".format(num_rows - count))  # 打印失败条形码数量
+    print("{} 个条形码处理成功".format(count))  # 打印总处理条形码数量
+    count = 0  # 重置计数器
+    print("{} 个条形码在数据库中成功找到。".format(count_1))  # 打印数据库找到的条形码数量
+    count_1 = 0  # 重置数据库找到的计数器
+    print("{} 个条形码在数据库未找到但爬取到了。".format(count_2))
+    count_2 = 0  # 重置成功爬取的计数器
+    return output_path
+
+
+def resume(job_id, cancel_event=None):
+    """
+    从任务日志记录的断点继续一个未完成的任务（进程崩溃或重启之后）。
+
+    Returns:
+        str: 输出文件路径；任务不存在时返回 None
+    """
+    init_journal()
+    job = get_job(job_id)
+    if job is None:
+        print(f"错误：任务 {job_id} 不存在。")  # 增加日志
+        return None
+    if job['status'] == 'done':
+        print(f"任务 {job_id} 已完成，无需续跑。")  # 增加日志
+        return job['output_path']
+    print(f"续跑任务 {job_id}（状态 {job['status']}）。")  # 增加日志
+    return process_excel_streaming(**job['params'], cancel_event=cancel_event, job_id=job_id)
 
 
 # --- 主程序入口 ---
+@foreground_activity.track
 def process_excel(excel_filepath, barcode_column_letter, start_row, end_row, image_column_letter,
-                  product_name_column_letter, translate_dst_column_letter):
+                  product_name_column_letter, translate_dst_column_letter, num_threads=None,
+                  cancel_event=None, streaming=STREAMING_PIPELINE, job_id=None):
+    """
+    处理Excel：读取条码、爬取产品信息、回写Excel并翻译。
+    num_threads 为本次任务的工作线程数（自适应并发开启时为并发上限，见 job_threads；None 为默认值）；cancel_event（threading.Event）被设置后，
+    尚未开始的条码将被放弃，正在处理的条码完成后结束。
+    streaming=True 时使用分阶段流式管道（process_excel_streaming，支持 job_id 断点续跑），否则按阶段依次执行。
+    """
     global count, count_1, count_2  # 使用全局计数器
+    if streaming:
+        return process_excel_streaming(excel_filepath, barcode_column_letter, start_row, end_row,
+                                       image_column_letter, product_name_column_letter,
+                                       translate_dst_column_letter, num_threads=num_threads,
+                                       cancel_event=cancel_event, job_id=job_id)
     total_start_time = time.time()  # 记录总程序开始时间
     print("脚本开始执行。")  # 增加日志
 
@@ -432,38 +949,70 @@ def process_excel(excel_filepath, barcode_column_letter, start_row, end_row, ima
     else:
         print(f"成功读取 {len(barcodes_with_row_to_crawl)} 个条码及对应行号。")  # 增加日志
         results_list = []  # 用于存储爬取结果 (barcode, product_name, image_filepath, row_index)  # 包含行号
-        threads = []
-        num_threads = DEFAULT_THREADS  # 可以根据需要让用户输入线程数
-        active_threads = []
-        thread_counter = 0
-        # 修改 run_thread 函数以传递 (barcode, row_index)
-        def run_thread(barcode_with_row, thread_name, results_list):
-            barcode, row_index = barcode_with_row
-            # 修改 crawl_barcode 函数以接收行号并将其添加到结果中
-            crawl_barcode_with_row(barcode, thread_name, results_list, row_index)
-            # 线程完成后，从活动线程列表中移除
-            active_threads.remove(threading.current_thread())
-        # 修改 crawl_barcode 函数以接收行号并将其添加到结果中
-        print(f"开始使用 {min(num_threads, len(barcodes_with_row_to_crawl))} 个线程进行爬取...")  # 增加日志
-        for barcode_with_row in barcodes_with_row_to_crawl:
-            thread_name = f"Thread-{thread_counter + 1}"
-            thread = threading.Thread(target=run_thread, args=(barcode_with_row, thread_name, results_list))
-            threads.append(thread)
-            active_threads.append(thread)
-            thread.start()
-            thread_counter += 1
-            # 控制并发线程数
-            while len(active_threads) >= num_threads:
-                # 等待任意一个活动线程完成
-                time.sleep(0.1)  # 短暂等待，避免CPU空转
-                # 检查活动线程列表，移除已完成的线程
-                # 注意：直接修改列表可能导致问题，这里只是一个简化的逻辑
-                # 更好的方法是使用队列或线程池
-                active_threads = [t for t in active_threads if t.is_alive()]
-        # 等待所有线程完成执行
-        for thread in threads:
-            thread.join()
-        # 5. 更新Excel文件
+        # 4. 按规范化条码合并重复行：同一条码只处理一次，结果分发到所有对应行
+        rows_by_barcode = {}  # barcode -> [row_index, ...]（保持首次出现的顺序）
+        for barcode, row_index in barcodes_with_row_to_crawl:
+            rows_by_barcode.setdefault(normalize_barcode(barcode), []).append(row_index)
+        print(f"共 {len(rows_by_barcode)} 个不同条码（{len(barcodes_with_row_to_crawl)} 行）。")  # 增加日志
+        # 5. 批量查询缓存：命中的条码直接写入结果，只有未命中和可重试的失败记录进入爬取队列
+        partition_start_time = time.time()
+        cached_products = get_products_from_db(list(rows_by_barcode))
+        crawl_tasks = []  # (barcode, row_indices, cached_data)
+        cache_hits = 0
+        skipped = 0
+        for barcode, row_indices in rows_by_barcode.items():
+            cached_data = cached_products.get(barcode)
+            cache_status = classify_cached_product(cached_data)
+            if cache_status == 'hit':
+                for row_index in row_indices:
+                    results_list.append((barcode, cached_data['product_name'], cached_data['image_filepath'], row_index))
+                cache_hits += len(row_indices)
+                count_1 += len(row_indices)  # 增加数据库找到的计数
+                count += len(row_indices)  # 增加总计数
+            elif cache_status == 'skip':
+                skipped += len(row_indices)  # 已经尝试过所有方法，跳过
+            else:
+                crawl_tasks.append((barcode, row_indices, cached_data))
+        print(f"缓存预分区完成 ({time.time() - partition_start_time:.2f} 秒): 命中 {cache_hits} 行，"
+              f"跳过 {skipped} 行，待爬取 {len(crawl_tasks)} 个条码。")  # 增加日志
+
+        if crawl_tasks:
+            num_threads = max(1, min(job_threads(num_threads), len(crawl_tasks)))
+            driver_pool = get_driver_pool(num_threads)  # 跨条码、跨任务复用的浏览器池
+
+            # 工作线程处理函数：每个任务为 (barcode, row_indices, cached_data)
+            def handle_barcode(task, thread_name):
+                global count
+                barcode, row_indices, cached_data = task
+                if cancel_event is not None and cancel_event.is_set():
+                    return  # 任务已取消，跳过尚未开始的条码
+                result = crawl_barcode_shared(barcode, thread_name, driver_pool=driver_pool,
+                                              cached_data=cached_data, prefetched=True)
+                if result:
+                    product_name, image_filepath = result
+                    for row_index in row_indices:
+                        results_list.append((barcode, product_name, image_filepath, row_index))
+                    count += len(row_indices) - 1  # 重复行共享同一结果，计入成功数量
+
+            print(f"开始使用 {num_threads} 个线程进行爬取...")  # 增加日志
+            # 固定数量的工作线程从有界队列取任务，队列满时 submit 阻塞（背压）
+            with CrawlScheduler(handle_barcode, num_workers=num_threads) as scheduler:
+                for task in crawl_tasks:
+                    if cancel_event is not None and cancel_event.is_set():
+                        scheduler.cancel()
+                    if not scheduler.submit(task):
+                        break  # 调度器已取消
+            print(f"调度器统计: {scheduler.metrics()}")  # 增加日志
+            print(f"浏览器池统计: {driver_pool.metrics()}")  # 增加日志
+            print(f"数据来源分级统计: {tier_stats.summary()}")  # 增加日志（http / selenium / ddgs）
+            print(f"对冲统计: {hedge_stats.summary()}")  # 增加日志
+            print(f"熔断器统计: {breaker_metrics()}")  # 增加日志
+            print(f"并发控制统计: {crawl_limiter.metrics()}")  # 增加日志
+            print(f"主机限速统计: {host_limiter.metrics()}")  # 增加日志
+            print(f"图片下载统计: {download_metrics()}")  # 增加日志
+            print(f"DDGS搜索缓存统计: {search_cache_metrics()}")  # 增加日志
+            print(f"单飞去重统计: {barcode_inflight.metrics()}")  # 增加日志
+        # 6. 更新Excel文件
         print("\n开始更新Excel文件...")  # 增加日志
         # 修改 update_excel_with_results 函数以接收包含行号的结果列表
         update_excel_with_results_with_row(excel_filepath, results_list, barcode_column_letter,
@@ -6,20 +6,20 @@
 脚本集成了 selenium-stealth 库，并实现了页面加载超时、显式等待以及
 对 Cloudflare 拦截页面的检测和重试机制。
 
-每个线程负责抓取一个条形码的信息，并将抓取到的页面 HTML 内容和截图
-保存到以线程名称命名的单独文件夹中。同时，脚本会记录并输出总执行时间
-以及每个线程的执行时间，以便进行性能分析。
+固定数量的工作线程从有界队列中依次取条形码抓取，并将抓取到的页面 HTML 内容和截图
+保存到以工作线程名称命名的单独文件夹中。同时，脚本会记录并输出总执行时间
+以及每个条形码的执行时间，以便进行性能分析。
 
 依赖库:
 - selenium: 用于浏览器自动化
 - selenium-stealth: 用于使 Selenium 更难被检测
-- threading: 用于实现多线程
+- barcode_excel_scheduler: 有界工作线程调度器
 - os: 用于文件系统操作（创建目录、拼接路径）
 - time: 用于添加延时和记录时间
 - random: 未在当前版本中使用，但可能用于随机化操作
 """
 
-import threading # 导入多线程模块
+from barcode_excel_scheduler import CrawlScheduler # 导入有界工作线程调度器
 import os # 导入操作系统模块，用于文件路径操作
 import time # 导入时间模块
 from selenium import webdriver # 导入 Selenium WebDriver
@@ -153,10 +153,10 @@ def download_page(barcode, thread_name):
     thread_end_time = time.time() # 记录线程结束时间
     thread_execution_time = thread_end_time - thread_start_time # 计算线程执行时间
 
-    # 将线程执行时间保存到 time.txt 文件
+    # 将执行时间追加到 time.txt 文件（同一工作线程会依次处理多个条形码）
     time_filepath = os.path.join(thread_dir, "time.txt")
-    with open(time_filepath, "w") as f:
-        f.write(f"Thread Execution Time: {thread_execution_time:.2f} seconds\n")
+    with open(time_filepath, "a") as f:
+        f.write(f"{barcode} Execution Time: {thread_execution_time:.2f} seconds\n")
 
 # --- 主程序入口 ---
 if __name__ == "__main__":
@@ -175,20 +175,14 @@ if __name__ == "__main__":
         "768614178767",
         "8053288240004",
     ]
-    # 生成与条形码列表对应的线程名称列表
-    thread_names = [f"Thread-{i+1}" for i in range(len(barcodes))]
-
-    threads = [] # 创建一个列表来存储线程对象
-    # 遍历条形码列表，为每个条形码创建一个线程
-    for i in range(len(barcodes)):
-        # 创建一个新线程，目标函数是 download_page，并传递条形码和线程名称作为参数
-        thread = threading.Thread(target=download_page, args=(barcodes[i], thread_names[i]))
-        threads.append(thread) # 将线程添加到列表中
-        thread.start() # 启动线程
-
-    # 等待所有线程完成执行
-    for thread in threads:
-        thread.join() # 阻塞主线程，直到当前线程执行完毕
+    num_workers = 5 # 工作线程数（固定数量的常驻线程）
+
+    # 固定数量的工作线程从有界队列中取条形码执行 download_page，
+    # 每个工作线程的输出保存在以其线程名称命名的文件夹中
+    with CrawlScheduler(download_page, num_workers=num_workers) as scheduler:
+        for barcode in barcodes:
+            scheduler.submit(barcode) # 队列满时阻塞等待
+    # 退出 with 时等待所有条形码处理完成
 
     total_end_time = time.time() # 记录总程序结束时间
     total_execution_time = total_end_time - total_start_time # 计算总执行时间
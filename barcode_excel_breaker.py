@@ -0,0 +1,143 @@
+"""
+按数据来源的熔断器（circuit breaker）
+
+barcodelookup 开始对每个请求都返回 Cloudflare 拦截或超时时，每个工作线程仍会用完 10 次重试
+（中间还有退避等待）才回退到 DDGS，整个任务可能因此停滞数小时。每个来源一个熔断器，统计滚动窗口内的
+失败率（失败 + 拦截）：
+
+    closed     正常请求；窗口内调用数达到 min_calls 且失败率达到 failure_rate 时 -> open
+    open       不再请求该来源，调用方直接使用下一来源或暂存（park）条码；open_seconds 秒后 -> half_open
+    half_open  只放行一个探测请求：成功 -> closed，失败 -> open（重新计时）
+
+状态变化打印日志，metrics() 给出状态和窗口统计。
+
+用法:
+    breaker = source_breakers['barcodelookup']
+    if not breaker.allow():
+        ...  # 熔断中，改用下一来源
+    breaker.record_success() / breaker.record_failure('challenge')
+"""
+
+import threading
+import time
+from collections import deque
+
+# --- 配置 ---
+BREAKER_WINDOW_SECONDS = 120  # 滚动统计窗口（秒）
+BREAKER_MIN_CALLS = 10  # 窗口内至少有这么多次调用才判断是否熔断
+BREAKER_FAILURE_RATE = 0.8  # 窗口内失败率（失败 + 拦截）达到此值时熔断
+BREAKER_OPEN_SECONDS = 60  # 熔断后等待多久进入半开状态（秒）
+BREAKER_PROBE_TIMEOUT = 120  # 半开探测未报告结果时，超过此时间（秒）允许新的探测
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """单个来源的熔断器（线程安全）。"""
+
+    def __init__(self, name, window_seconds=BREAKER_WINDOW_SECONDS, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, open_seconds=BREAKER_OPEN_SECONDS,
+                 probe_timeout=BREAKER_PROBE_TIMEOUT):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started_at = None  # 半开状态下探测请求的开始时间
+        self._window = deque()  # [(time, outcome)]，outcome 为 'success' 或失败类型
+        self._stats = {'opened': 0, 'rejected': 0, 'probes': 0}
+
+    def _transition(self, state, reason):
+        """切换状态（调用方持有锁）。"""
+        if state == self._state:
+            return
+        print(f"熔断器：{self.name} {self._state} -> {state}（{reason}）")  # 增加日志
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.time()
+            self._stats['opened'] += 1
+        if state != HALF_OPEN:
+            self._probe_started_at = None
+        if state == CLOSED:
+            self._window.clear()
+
+    def _prune(self, now):
+        while self._window and self._window[0][0] < now - self.window_seconds:
+            self._window.popleft()
+
+    def allow(self):
+        """是否可以请求该来源。半开状态下只放行一个探测请求。"""
+        now = time.time()
+        with self._lock:
+            if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, f"已熔断 {self.open_seconds} 秒，放行探测请求")
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and (self._probe_started_at is None
+                                             or now - self._probe_started_at >= self.probe_timeout):
+                self._probe_started_at = now
+                self._stats['probes'] += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        now = time.time()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED, "探测成功，来源已恢复")
+                return
+            self._window.append((now, 'success'))
+            self._prune(now)
+
+    def record_failure(self, kind='failure'):
+        """记录一次失败；kind 为失败类型，如 'challenge'（Cloudflare 拦截）、'timeout'。"""
+        now = time.time()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN, f"探测失败（{kind}）")
+                return
+            self._window.append((now, kind))
+            self._prune(now)
+            if self._state == CLOSED and len(self._window) >= self.min_calls:
+                failures = sum(1 for _, outcome in self._window if outcome != 'success')
+                rate = failures / len(self._window)
+                if rate >= self.failure_rate:
+                    self._transition(OPEN, f"{self.window_seconds} 秒内失败率 {rate:.0%}（{failures}/{len(self._window)}）")
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN  # 下一次 allow 即转为半开
+            return self._state
+
+    def metrics(self):
+        """返回状态和滚动窗口统计的快照。"""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            outcomes = {}
+            for _, outcome in self._window:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            snapshot = dict(self._stats)
+            snapshot.update({'state': self._state, 'window_calls': len(self._window), 'window_outcomes': outcomes})
+        return snapshot
+
+
+# 进程级熔断器：每个数据来源一个
+source_breakers = {
+    'barcodelookup': CircuitBreaker('barcodelookup'),
+    'ddgs': CircuitBreaker('ddgs'),
+}
+
+
+def breaker_metrics():
+    """所有来源熔断器的统计。"""
+    return {name: breaker.metrics() for name, breaker in source_breakers.items()}
@@ -0,0 +1,147 @@
+"""
+爬取并发度的自适应控制（AIMD）
+
+固定的 DEFAULT_THREADS 无论目标网站 1 秒响应还是正在限流都一样。本模块按 TCP 拥塞控制的
+加性增、乘性减（AIMD）思路调整同时进行的网络爬取数量：
+
+- 每累计 window 次成功请求评估一次：窗口内延迟 p90 不超过 latency_target 时并发度 +increase；
+  延迟超过 latency_target 的 LATENCY_BACKOFF_FACTOR 倍时按拥塞处理；
+- 出现超时、429/403/503 或 Cloudflare 拦截页时立即乘以 decrease（至少间隔 cooldown 秒，
+  同一波错误只减一次）；
+- 并发度始终在 [min_limit, max_limit] 之间。
+
+工作线程数按上限创建（任务指定了线程数时以其为上限，见 set_max_limit），每次网络爬取前通过 slot() 取得名额，
+名额数即当前并发度。
+crawl_limiter 为进程级实例，多个同时运行的任务共享同一并发度（对目标网站的总压力）。
+
+用法:
+    with crawl_limiter.slot():
+        ...  # 网络爬取
+        crawl_limiter.record_success(latency) / crawl_limiter.record_congestion('challenge')
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# --- 配置 ---
+CONCURRENCY_MIN = 1  # 并发度下限
+CONCURRENCY_MAX = 12  # 并发度上限（流式管道页面获取阶段的工作线程数）
+CONCURRENCY_INITIAL = 5  # 初始并发度
+AIMD_INCREASE = 1  # 每个健康窗口增加的并发度
+AIMD_DECREASE = 0.5  # 拥塞时并发度乘以此系数
+AIMD_WINDOW = 10  # 每累计多少次成功请求评估一次
+AIMD_LATENCY_TARGET = 6.0  # 健康的请求延迟 p90（秒）
+LATENCY_BACKOFF_FACTOR = 2.0  # p90 超过目标的此倍数时视为拥塞
+AIMD_COOLDOWN = 10.0  # 两次减小之间的最短间隔（秒）
+
+
+class AdaptiveLimiter:
+    """AIMD 并发度控制器 + 可调上限的信号量（线程安全）。"""
+
+    def __init__(self, initial=CONCURRENCY_INITIAL, min_limit=CONCURRENCY_MIN, max_limit=CONCURRENCY_MAX,
+                 increase=AIMD_INCREASE, decrease=AIMD_DECREASE, window=AIMD_WINDOW,
+                 latency_target=AIMD_LATENCY_TARGET, cooldown=AIMD_COOLDOWN, name="crawl"):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.name = name
+        self._cond = threading.Condition()
+        self._limit = max(min_limit, min(max_limit, initial))
+        self._in_flight = 0
+        self._latencies = []  # 当前窗口内成功请求的延迟
+        self._last_decrease = 0.0
+        self._stats = {'increases': 0, 'decreases': 0, 'successes': 0, 'congestions': {}}
+
+    @property
+    def limit(self):
+        with self._cond:
+            return self._limit
+
+    def acquire(self):
+        """取得一个名额；正在进行的爬取数达到当前并发度时阻塞等待。"""
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """上下文管理器：取得名额，结束时归还。"""
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def _set_limit(self, limit, reason):
+        """调整并发度（调用方持有锁）。"""
+        limit = max(self.min_limit, min(self.max_limit, limit))
+        if limit == self._limit:
+            return
+        print(f"并发控制：{self.name} 并发度 {self._limit} -> {limit}（{reason}）")  # 增加日志
+        if limit > self._limit:
+            self._stats['increases'] += 1
+            self._cond.notify_all()
+        else:
+            self._stats['decreases'] += 1
+        self._limit = limit
+
+    def _decrease(self, reason):
+        """乘性减（调用方持有锁）；cooldown 内只减一次。"""
+        now = time.time()
+        self._latencies.clear()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._set_limit(int(self._limit * self.decrease), reason)
+
+    def set_max_limit(self, max_limit):
+        """调整并发度上限（如任务指定的线程数）；当前并发度超过新上限时随之降低。"""
+        with self._cond:
+            self.max_limit = max(self.min_limit, max_limit)
+            if self._limit > self.max_limit:
+                self._set_limit(self.max_limit, f"上限调整为 {self.max_limit}")
+
+    def record_success(self, latency):
+        """记录一次成功请求及其延迟（秒）；每满一个窗口评估一次。"""
+        with self._cond:
+            self._stats['successes'] += 1
+            self._latencies.append(latency)
+            if len(self._latencies) < self.window:
+                return
+            latencies = sorted(self._latencies)
+            self._latencies.clear()
+            p90 = latencies[int(0.9 * (len(latencies) - 1))]
+            if p90 > self.latency_target * LATENCY_BACKOFF_FACTOR:
+                self._decrease(f"延迟 p90 {p90:.1f} 秒")
+            elif p90 <= self.latency_target:
+                self._set_limit(self._limit + self.increase, f"延迟 p90 {p90:.1f} 秒，状态良好")
+
+    def record_congestion(self, kind):
+        """记录一次拥塞信号（'timeout'、'challenge' 等），立即乘性减小并发度。"""
+        with self._cond:
+            self._stats['congestions'][kind] = self._stats['congestions'].get(kind, 0) + 1
+            self._decrease(kind)
+
+    def metrics(self):
+        """返回并发度和调整统计的快照。"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['congestions'] = dict(self._stats['congestions'])
+            snapshot.update({'limit': self._limit, 'in_flight': self._in_flight,
+                             'min': self.min_limit, 'max': self.max_limit})
+        return snapshot
+
+
+# 进程级爬取并发控制，所有任务共享
+crawl_limiter = AdaptiveLimiter()
@@ -21,20 +21,18 @@ barcodelookup.com网站获取产品图片和名称。为了提高效率，脚本
 - openpyxl: 用于读写Excel文件
 - selenium: 用于浏览器自动化
 - selenium-stealth: 用于使Selenium更难被检测
-- threading: 用于实现多线程
+- barcode_excel_scheduler: 有界工作线程调度器
 - os: 用于文件系统操作
 - time: 用于时间记录
 - requests: 用于下载图片
 - sqlite3: Python内置库，用于SQLite数据库操作
 """
 
-import threading
 import os
 import time
 import sqlite3
 import requests
 from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
@@ -49,6 +47,9 @@ from barcode_excel_excel import read_barcodes_from_excel_with_row, update_excel_
 #from barcode_excel_trans import translate_excel
 from translate_excel_openpyxl import translate_excel
 from RandomUaStealth import get_random_stealth_config, get_random_user_agent, record_failure, record_success
+from barcode_excel_driver_pool import DriverPool, create_chrome_options, apply_crawl_profile
+from barcode_excel_fetcher import target_elements_ready
+from barcode_excel_scheduler import CrawlScheduler
 
 # --- 配置 ---
 DATABASE_NAME = 'barcode_cache.db' # SQLite数据库文件名
@@ -61,6 +62,30 @@ IMAGE_XPATH = '/html/body/section[2]/div[1]/div/div/div[1]/div[1]/img'
 # 产品名称XPath
 PRODUCT_NAME_XPATH = '/html/body/section[2]/div[1]/div/div/div[2]/h4'
 
+# --- 浏览器池 ---
+def create_stealth_driver():
+    """
+    浏览器池的工厂函数：启动无头 Chrome 并应用随机的 stealth 配置。
+    所用的 UA 和 stealth 配置挂在 driver 上，供成功/失败统计使用。
+    """
+    ua = get_random_user_agent()
+    stealth_cfg = get_random_stealth_config()
+    chrome_options = create_chrome_options()  # eager 加载策略 + 不加载图片
+    chrome_options.add_argument(f"user-agent={ua}")
+    driver = webdriver.Chrome(options=chrome_options)
+    apply_crawl_profile(driver)  # 屏蔽非必要资源
+    stealth(driver,
+        languages=stealth_cfg["languages"],
+        vendor=stealth_cfg["vendor"],
+        platform=stealth_cfg["platform"],
+        webgl_vendor=stealth_cfg["webgl_vendor"],
+        renderer=stealth_cfg["renderer"],
+        fix_hairline=True,
+    )
+    driver.ua = ua
+    driver.stealth_cfg = stealth_cfg
+    return driver
+
 # --- 图片下载 ---
 def download_image(image_url, barcode):
     """下载图片并保存到本地。"""
@@ -98,10 +123,11 @@ def download_image(image_url, barcode):
 
 # --- 爬取逻辑 ---
 # 修改 crawl_barcode 函数以接收行号并将其添加到结果中
-def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
+def crawl_barcode_with_row(barcode, thread_name, results_list, row_index, driver_pool):
     """
     使用 Selenium 爬取单个条形码信息，处理Cloudflare和未找到情况，
     提取数据，下载图片，并将结果添加到共享列表（包含行号）。
+    浏览器从 driver_pool 中借用，用完后归还。
     """
     print(f"线程 {thread_name} 开始处理条码: {barcode} (行号: {row_index})") # 增加日志
     
@@ -125,40 +151,30 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
     print(f"最大重试次数: {retry_count}") # 增加日志
     print(f"线程 {thread_name}: 缓存未命中或无效，开始网络爬取条码 {barcode}。") # 增加日志
     for attempt in range(retry_count):
+        driver_broken = False # 本次尝试中浏览器是否已损坏
         try:
-            # 随机选择 User-Agent 和 stealth 配置
-            ua = get_random_user_agent()
-            stealth_cfg = get_random_stealth_config()
-            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 启动浏览器并导航到 {url}") # 增加日志
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")  # 无头模式：不显示浏览器窗口
-            chrome_options.add_argument("--disable-gpu")  # 禁用 GPU 加速，有时可避免问题
-            chrome_options.add_argument("--window-size=1920x1080")  # 设置浏览器窗口大小
-            chrome_options.add_argument("user-agent={ua}")
-
-            driver = webdriver.Chrome(options=chrome_options)
-            stealth(driver,
-                languages=stealth_cfg["languages"],
-                vendor=stealth_cfg["vendor"],
-                platform=stealth_cfg["platform"],
-                webgl_vendor=stealth_cfg["webgl_vendor"],
-                renderer=stealth_cfg["renderer"],
-                fix_hairline=True,
-            )
+            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 从浏览器池获取浏览器并导航到 {url}") # 增加日志
+            driver = driver_pool.acquire()
+            # UA 和 stealth 配置在浏览器创建时确定
+            ua = driver.ua
+            stealth_cfg = driver.stealth_cfg
             #time.sleep(random.uniform(0.5, 1.5))
             driver.set_page_load_timeout(10)
-            driver.get(url)
-            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 等待页面加载...") # 增加日志
-            WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 页面加载完成。") # 增加日志
+            driver.get(url) # eager 加载策略：DOMContentLoaded 后即返回
+            print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 等待目标元素...") # 增加日志
+            try:
+                # 只等待产品名称和图片两个节点（或未找到/拦截页面），不等待整页加载
+                WebDriverWait(driver, 5).until(target_elements_ready(PRODUCT_NAME_XPATH, IMAGE_XPATH))
+                print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 目标元素已就绪。") # 增加日志
+            except TimeoutException:
+                print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 等待目标元素超时，继续检测页面。") # 增加日志
             # --- Cloudflare 拦截检测 ---
             if "Just a moment..." in driver.title or "Cloudflare" in driver.title or "Enable JavaScript and cookies to continue" in driver.page_source:
                 print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 检测到 Cloudflare 拦截页面，进行重试。") # 增加日志
                 record_failure(ua, stealth_cfg) # 记录失败的UA和配置
-                if driver:
-                    driver.quit()
+                # 该指纹已被拦截，回收此浏览器，下次尝试由池新建（随机新的UA和配置）
+                driver_pool.release(driver, recycle=True)
+                driver = None
                 continue # 进入下一次重试
             else:
                 record_success(ua, stealth_cfg) # 记录成功的UA和配置
@@ -168,8 +184,6 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
             # --- 条码未找到检测 ---
             if "Barcode Not Found | Barcode Lookup" in driver.title:
                 print(f"线程 {thread_name}: 条码 {barcode} 未找到，跳过下载和截图。") # 增加日志
-                if driver:
-                    driver.quit()
                 # 将未找到的条码也存入数据库，标记为无产品信息，避免重复爬取
                 insert_product_to_db(barcode, "Not Found", None, None)
                 results_list.append((barcode, "Not Found", None, row_index)) # 添加未找到结果和行号
@@ -178,7 +192,7 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
             print(f"线程 {thread_name}: 开始提取产品信息...") # 增加日志
             try:
                 # 提取产品名称
-                product_name_element = WebDriverWait(driver, 5).until(
+                product_name_element = WebDriverWait(driver, 1).until(
                     EC.presence_of_element_located((By.XPATH, PRODUCT_NAME_XPATH))
                 )
                 product_name = product_name_element.text.strip()
@@ -188,7 +202,7 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
                 product_name = "N/A" # 未找到则标记为N/A
             try:
                 # 提取图片URL
-                image_element = WebDriverWait(driver, 5).until(
+                image_element = WebDriverWait(driver, 1).until(
                     EC.presence_of_element_located((By.XPATH, IMAGE_XPATH))
                 )
                 image_url = image_element.get_attribute('src')
@@ -211,8 +225,8 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
             break # 成功完成，退出重试循环
         except (TimeoutException, WebDriverException) as e:
             print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 使用 Selenium 发生错误：{e}") # 增加日志
-            if driver:
-                driver.quit() # 发生错误时关闭浏览器实例
+            # 超时的浏览器可以重置后复用，其他 WebDriver 错误则丢弃
+            driver_broken = not isinstance(e, TimeoutException)
             # 如果还有重试次数，打印重试提示
             if attempt < retry_count - 1:
                 print(f"线程 {thread_name}: 进行重试。") # 增加日志
@@ -221,12 +235,12 @@ def crawl_barcode_with_row(barcode, thread_name, results_list, row_index):
                 print(f"线程 {thread_name}: 达到最大重试次数，未能成功处理条码 {barcode}。") # 增加日志
         except Exception as e:
             print(f"线程 {thread_name} (尝试 {attempt + 1}/{retry_count}): 发生未知错误：{e}") # 增加日志
-            if driver:
-                driver.quit() # 发生错误时关闭浏览器实例
+            driver_broken = True # 未知错误，不再复用该浏览器实例
             break # 未知错误，不再重试
         finally:
             if driver:
-                driver.quit() # 确保每次尝试后都关闭浏览器实例
+                driver_pool.release(driver, discard=driver_broken) # 确保每次尝试后都归还浏览器实例
+                driver = None
             # 如果所有重试都失败且未成功，将失败信息添加到结果列表（可选，取决于是否需要在Excel中标记失败）
             # if not success:
             #     results_list.append((barcode, "爬取失败", None, row_index)) # 添加行号
@@ -275,41 +289,22 @@ def main():
         # 对于threading，直接使用列表并加锁是更常见的方式，但为了简单，
         # 且我们只是append，这里先直接使用列表，如果出现问题再考虑加锁
         results_list = [] # 用于存储爬取结果 (barcode, product_name, image_filepath, row_index) # 包含行号
-        threads = []
-        # 使用用户指定的线程数
-        num_threads = DEFAULT_THREADS # 可以根据需要让用户输入线程数
-        # 将条形码列表分割成适合每个线程处理的块（可选，但对于大量条码更有效）
-        # 这里简单地为每个条码创建一个线程，线程数等于条码数（最多DEFAULT_THREADS）
-        # 限制并发线程数
-        active_threads = []
-        thread_counter = 0
-        # 修改 run_thread 函数以传递 (barcode, row_index) 
-        def run_thread(barcode_with_row, thread_name, results_list):
-             barcode, row_index = barcode_with_row
-             # 修改 crawl_barcode 函数以接收行号并将其添加到结果中
-             crawl_barcode_with_row(barcode, thread_name, results_list, row_index)
-             # 线程完成后，从活动线程列表中移除
-             active_threads.remove(threading.current_thread())
-        # 修改 crawl_barcode 函数以接收行号并将其添加到结果中
-        print(f"开始使用 {min(num_threads, len(barcodes_with_row_to_crawl))} 个线程进行爬取...") # 增加日志
-        for barcode_with_row in barcodes_with_row_to_crawl:
-            thread_name = f"Thread-{thread_counter + 1}"
-            thread = threading.Thread(target=run_thread, args=(barcode_with_row, thread_name, results_list))
-            threads.append(thread)
-            active_threads.append(thread)
-            thread.start()
-            thread_counter += 1
-            # 控制并发线程数
-            while len(active_threads) >= num_threads:
-                 # 等待任意一个活动线程完成
-                 time.sleep(0.1) # 短暂等待，避免CPU空转
-                 # 检查活动线程列表，移除已完成的线程
-                 # 注意：直接修改列表可能导致问题，这里只是一个简化的逻辑
-                 # 更好的方法是使用队列或线程池
-                 active_threads = [t for t in active_threads if t.is_alive()]
-        # 等待所有线程完成执行
-        for thread in threads:
-            thread.join()
+        num_threads = min(DEFAULT_THREADS, len(barcodes_with_row_to_crawl)) # 工作线程数（固定数量的常驻线程）
+        # 每个线程最多同时占用一个浏览器，池大小与线程数一致
+        driver_pool = DriverPool(num_threads, driver_factory=create_stealth_driver)
+        # 工作线程处理函数：每个任务为 (barcode, row_index)
+        def handle_barcode(barcode_with_row, thread_name):
+            barcode, row_index = barcode_with_row
+            crawl_barcode_with_row(barcode, thread_name, results_list, row_index, driver_pool)
+        print(f"开始使用 {num_threads} 个线程进行爬取...") # 增加日志
+        # 固定数量的工作线程从有界队列取任务，队列满时 submit 阻塞（背压）
+        with CrawlScheduler(handle_barcode, num_workers=num_threads) as scheduler:
+            for barcode_with_row in barcodes_with_row_to_crawl:
+                scheduler.submit(barcode_with_row)
+        # 退出 with 时等待所有条码处理完成
+        print(f"调度器统计: {scheduler.metrics()}") # 增加日志
+        print(f"浏览器池统计: {driver_pool.metrics()}") # 增加日志
+        driver_pool.close() # 爬取结束，关闭所有浏览器
         # 5. 更新Excel文件
         print("\n开始更新Excel文件...") # 增加日志
         # 修改 update_excel_with_results 函数以接收包含行号的结果列表
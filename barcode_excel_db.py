@@ -1,79 +1,484 @@
-
+import atexit
+import sqlite3
 import threading
-import os
 import time
-import sqlite3
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from selenium_stealth import stealth
-import openpyxl
-from openpyxl.drawing.image import Image
-# 导入 openpyxl.utils 模块，用于列字母和索引转换
-from openpyxl.utils import column_index_from_string
+from concurrent.futures import Future
+from queue import Queue, Empty
 DATABASE_NAME = 'barcode_cache.db' # SQLite数据库文件名
+BULK_QUERY_CHUNK_SIZE = 500 # 批量查询时每条 IN (...) 语句的条码数量（低于SQLite变量个数上限）
+DB_BUSY_TIMEOUT_MS = 30000 # 等待其他连接释放写锁的最长时间（毫秒）
+DB_MMAP_SIZE = 256 * 1024 * 1024 # 内存映射读取的大小（字节）
+SCHEMA_VERSION = 2 # products 表结构版本（PRAGMA user_version）
+
+# 缓存状态（products.status，取代 product_name 中的标记字符串，有索引）
+STATUS_OK = 'ok' # 有效数据
+STATUS_NOT_FOUND = 'not_found' # "Not Found"：barcodelookup 未找到（旧记录，可用 DDGS 重新检索）
+STATUS_NA = 'na' # "N/A"：页面数据异常（旧记录，可用 DDGS 重新检索）
+STATUS_NOT_FOUND_NO_SEARCH = 'not_found_no_search' # "Not Found And No Search"：未找到且 DDGS 也失败
+STATUS_NA_NO_SEARCH = 'na_no_search' # "N/A And No Search"：数据异常且 DDGS 也失败
+STATUS_NO_SEARCH = 'no_search' # "No Search"：多次重试失败且 DDGS 也失败
+STATUS_INVALID = 'invalid' # 产品名称为空
+SENTINEL_STATUS = {
+    "Not Found": STATUS_NOT_FOUND,
+    "N/A": STATUS_NA,
+    "Not Found And No Search": STATUS_NOT_FOUND_NO_SEARCH,
+    "N/A And No Search": STATUS_NA_NO_SEARCH,
+    "No Search": STATUS_NO_SEARCH,
+}
+RETRYABLE_STATUSES = (STATUS_NOT_FOUND, STATUS_NA) # 旧失败记录，可重新检索
+EXHAUSTED_STATUSES = (STATUS_NOT_FOUND_NO_SEARCH, STATUS_NA_NO_SEARCH) # 所有方法均已失败
+# 负缓存：失败记录在 TTL 内直接跳过，过期后重新检索；每多失败一次 TTL 翻倍（不超过上限）
+NEGATIVE_CACHE_TTL = {
+    STATUS_NOT_FOUND_NO_SEARCH: 7 * 24 * 3600, # 未找到且 DDGS 也失败
+    STATUS_NA_NO_SEARCH: 3 * 24 * 3600, # 数据异常且 DDGS 也失败
+    STATUS_NO_SEARCH: 6 * 3600, # 多次重试失败（多为网络或拦截问题，较快重试）
+}
+NEGATIVE_CACHE_BACKOFF = 2 # 每次失败后 TTL 的增长倍数
+NEGATIVE_CACHE_MAX_TTL = 90 * 24 * 3600 # TTL 上限（秒）
+SOURCE_BARCODELOOKUP = 'barcodelookup' # 数据来源
+SOURCE_DDGS = 'ddgs'
+WRITE_BATCH_SIZE = 200 # 写入队列每批最多提交的记录数
+WRITE_FLUSH_INTERVAL = 0.5 # 写入队列最长攒批时间（秒），到时即提交
+
+# --- 连接管理 ---
+_local = threading.local() # 每个线程各自的持久连接
+_connections = [] # [(thread, db_path, conn)]，用于清理已退出线程的连接和进程退出时关闭
+_connections_lock = threading.Lock()
+
+
+def status_from_product_name(product_name):
+    """由产品名称（含旧的标记字符串）推断缓存状态。"""
+    if not product_name:
+        return STATUS_INVALID
+    return SENTINEL_STATUS.get(product_name, STATUS_OK)
+
+
+def negative_cache_expires_at(product):
+    """
+    失败记录的负缓存到期时间（时间戳）：fetched_at + TTL * BACKOFF^(attempts-1)，不超过 NEGATIVE_CACHE_MAX_TTL。
+    attempts 为连续以该状态失败的次数。
+    不属于负缓存的记录（有效数据、旧失败记录等）返回 None。
+    """
+    base_ttl = NEGATIVE_CACHE_TTL.get(product.get('status'))
+    if base_ttl is None:
+        return None
+    attempts = max(1, product.get('attempts') or 1)
+    ttl = min(base_ttl * NEGATIVE_CACHE_BACKOFF ** (attempts - 1), NEGATIVE_CACHE_MAX_TTL)
+    return (product.get('fetched_at') or 0) + ttl
+
+
+def negative_cache_expired(product, now=None):
+    """失败记录的负缓存是否已过期（可以重新检索）。不属于负缓存的记录返回 False。"""
+    expires_at = negative_cache_expires_at(product)
+    return expires_at is not None and expires_at <= (now or time.time())
+
+
+def connect(db_path=None):
+    """
+    按统一配置打开一个新连接：WAL 日志模式（读写互不阻塞）、synchronous=NORMAL、
+    busy_timeout 和 mmap。维护脚本使用此函数，调用方负责关闭。db_path 默认为 DATABASE_NAME。
+    """
+    conn = sqlite3.connect(db_path or DATABASE_NAME, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    return conn
+
+
+def get_connection(db_path=None):
+    """返回当前线程的持久连接（每个线程每个数据库一个，首次调用时创建，不要关闭）。"""
+    db_path = db_path or DATABASE_NAME
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connect(db_path)
+        connections[db_path] = conn
+        with _connections_lock:
+            # 顺便关闭已退出线程遗留的连接（调度器的工作线程随任务结束而退出）
+            alive = []
+            for thread, path, other in _connections:
+                if thread.is_alive():
+                    alive.append((thread, path, other))
+                else:
+                    other.close()
+            alive.append((threading.current_thread(), db_path, conn))
+            _connections[:] = alive
+    return conn
+
+
+def close_connections():
+    """关闭所有线程的持久连接（进程退出时自动调用）。"""
+    with _connections_lock:
+        for _, _, conn in _connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+atexit.register(close_connections)
+
+
+# --- 写入队列 ---
+# 写入时更新状态、来源和时间；attempts 为连续得到同一状态的次数（状态变化时重置为 1），
+# 成功之后的第一次失败按首次失败计算负缓存 TTL
+_UPSERT_SQL = '''
+    INSERT INTO products (barcode, product_name, image_url, image_filepath, status, source, fetched_at, attempts, last_error)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+    ON CONFLICT(barcode) DO UPDATE SET
+        product_name = excluded.product_name, image_url = excluded.image_url,
+        image_filepath = excluded.image_filepath, status = excluded.status, source = excluded.source,
+        fetched_at = excluded.fetched_at, last_error = excluded.last_error,
+        attempts = CASE WHEN excluded.status = products.status THEN products.attempts + 1 ELSE 1 END
+'''
+_PRODUCT_COLUMNS = ('product_name', 'image_url', 'image_filepath', 'status', 'source', 'fetched_at', 'attempts', 'last_error')
+
+
+class ProductWriter:
+    """
+    产品写入队列（write-behind）：爬取线程只负责入队，单个写入线程按批次提交（group commit），
+    攒满 batch_size 条或等待 flush_interval 秒后提交一次，一次事务只付出一次 fsync。
+    submit 返回 Future，提交完成后结果为 True；已入队但未提交的记录可通过 pending 读到。
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = Queue()
+        self._pending = {} # barcode -> (row, future)，已入队未提交的最新记录
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._stats = {'submitted': 0, 'committed': 0, 'batches': 0, 'failed': 0}
+
+    def _ensure_started(self):
+        """启动写入线程（调用方持有 self._lock）。返回写入队列是否可用（未关闭）。"""
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="ProductWriter", daemon=True)
+            self._thread.start()
+        return not self._closed
+
+    def submit(self, barcode, product_name, image_url, image_filepath, status=None, source=None, error=None,
+               fetched_at=None):
+        """将一条产品记录加入写入队列，返回 Future。写入队列已关闭时同步写入。fetched_at 默认为当前时间。"""
+        row = (barcode, product_name, image_url, image_filepath,
+               status or status_from_product_name(product_name), source, fetched_at or time.time(), error)
+        future = Future()
+        # 检查是否关闭与入队在同一把锁下完成，close() 的停止信号一定排在已入队的记录之后
+        with self._lock:
+            queued = self._ensure_started()
+            if queued:
+                self._pending[barcode] = (row, future)
+                self._stats['submitted'] += 1
+                self._queue.put(('row', row, future))
+        if not queued:
+            self._commit([(row, future)])
+        return future
+
+    def pending(self, barcode):
+        """返回已入队但尚未提交的记录（字段同 get_product_from_db），没有时返回 None。"""
+        with self._lock:
+            entry = self._pending.get(barcode)
+        if entry is None:
+            return None
+        _, product_name, image_url, image_filepath, status, source, fetched_at, last_error = entry[0]
+        return {'product_name': product_name, 'image_url': image_url, 'image_filepath': image_filepath,
+                'status': status, 'source': source, 'fetched_at': fetched_at, 'attempts': None,
+                'last_error': last_error}
+
+    def flush(self, timeout=None):
+        """等待此前入队的记录全部提交。返回是否在 timeout 内完成。"""
+        future = Future()
+        with self._lock:
+            if self._thread is None or self._closed:
+                return True
+            self._queue.put(('flush', None, future))
+        try:
+            future.result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def close(self, timeout=None):
+        """提交剩余记录并停止写入线程（进程退出时自动调用）。"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(('stop', None, None))
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        """写入线程：攒批、提交，直到收到停止信号。"""
+        while True:
+            kind, row, future = self._queue.get()
+            batch = []
+            waiters = []
+            stop = False
+            deadline = time.time() + self.flush_interval
+            while True:
+                if kind == 'row':
+                    batch.append((row, future))
+                elif kind == 'flush':
+                    waiters.append(future)
+                    break # 立即提交
+                else:
+                    stop = True
+                    break
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    kind, row, future = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+            if stop:
+                # 停止前取出队列中剩余的记录
+                while True:
+                    try:
+                        kind, row, future = self._queue.get_nowait()
+                    except Empty:
+                        break
+                    if kind == 'row':
+                        batch.append((row, future))
+                    elif kind == 'flush':
+                        waiters.append(future)
+            if batch:
+                self._commit(batch)
+            for waiter in waiters:
+                waiter.set_result(True)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        """在一个事务中提交一批记录；整批失败时逐条重试，只让出错的记录失败。"""
+        conn = get_connection()
+        failed = [] # [(row, future, error)]
+        try:
+            conn.executemany(_UPSERT_SQL, [row for row, _ in batch])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"错误：批量写入 {len(batch)} 条记录失败，逐条重试：{e}") # 增加日志
+            for row, future in batch:
+                try:
+                    conn.execute(_UPSERT_SQL, row)
+                    conn.commit()
+                except Exception as row_error:
+                    conn.rollback()
+                    failed.append((row, future, row_error))
+        failed_futures = {id(future) for _, future, _ in failed}
+        with self._lock:
+            for row, future in batch:
+                entry = self._pending.get(row[0])
+                if entry is not None and entry[1] is future:
+                    del self._pending[row[0]]
+            self._stats['committed'] += len(batch) - len(failed)
+            self._stats['failed'] += len(failed)
+            self._stats['batches'] += 1
+        for row, future, row_error in failed:
+            print(f"错误：插入/更新条码 {row[0]} 失败：{row_error}") # 增加日志
+            future.set_exception(row_error)
+        for row, future in batch:
+            if id(future) not in failed_futures:
+                future.set_result(True)
+        print(f"数据库：批量提交 {len(batch) - len(failed)} 条记录。") # 增加日志
+
+    def metrics(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = len(self._pending)
+        return snapshot
+
+
+# 进程级写入队列；atexit 按注册的逆序执行，先提交剩余记录再关闭连接
+product_writer = ProductWriter()
+atexit.register(product_writer.close)
+
 # --- 数据库操作 ---
 def init_database():
-    """初始化SQLite数据库，创建缓存表（如果不存在）。"""
+    """初始化SQLite数据库，创建缓存表（如果不存在）并迁移到当前表结构。"""
     print("数据库：初始化数据库...") # 增加日志
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS products (
                 barcode TEXT PRIMARY KEY,
                 product_name TEXT,
                 image_url TEXT,
-                image_filepath TEXT
+                image_filepath TEXT,
+                status TEXT,
+                source TEXT,
+                fetched_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
             )
         ''')
         conn.commit()
+        migrate_database(conn)
         print("数据库：数据库初始化完成，'products'表已准备。") # 增加日志
     except Exception as e:
         print(f"错误：数据库初始化失败：{e}") # 增加日志
-    finally:
-        if conn:
-            conn.close()
+
+def migrate_database(conn=None):
+    """
+    将旧表结构逐步迁移到 SCHEMA_VERSION，已是最新版本时直接返回。
+    v1：补充 status / source / fetched_at / attempts / last_error 列，按 product_name 中的标记字符串回填 status。
+    v2：没有时间戳的失败记录以迁移时间作为 fetched_at（负缓存从此开始计时），
+        索引改为 (status, fetched_at)，供按状态查询和挑选过期失败记录使用。
+    """
+    conn = conn or get_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    print(f"数据库：迁移表结构 v{version} -> v{SCHEMA_VERSION}...") # 增加日志
+    try:
+        if version < 1:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(products)')}
+            for column, column_type in (('status', 'TEXT'), ('source', 'TEXT'), ('fetched_at', 'REAL'),
+                                        ('attempts', 'INTEGER NOT NULL DEFAULT 0'), ('last_error', 'TEXT')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE products ADD COLUMN {column} {column_type}')
+            # 回填状态：标记字符串 -> 对应状态，空名称 -> invalid，其余 -> ok
+            cases = ' '.join('WHEN ? THEN ?' for _ in SENTINEL_STATUS)
+            params = [value for item in SENTINEL_STATUS.items() for value in item]
+            cursor = conn.execute(
+                f"UPDATE products SET status = CASE WHEN product_name IS NULL OR product_name = '' THEN ? "
+                f"ELSE CASE product_name {cases} ELSE ? END END WHERE status IS NULL",
+                [STATUS_INVALID, *params, STATUS_OK])
+            print(f"数据库：回填 {cursor.rowcount} 条记录的状态。") # 增加日志
+            conn.execute('UPDATE products SET attempts = 1 WHERE attempts = 0') # 旧记录至少获取过一次
+        if version < 2:
+            negative_statuses = list(NEGATIVE_CACHE_TTL)
+            cursor = conn.execute(
+                f'UPDATE products SET fetched_at = ? WHERE fetched_at IS NULL '
+                f'AND status IN ({",".join("?" * len(negative_statuses))})',
+                [time.time(), *negative_statuses])
+            print(f"数据库：{cursor.rowcount} 条失败记录的负缓存从现在开始计时。") # 增加日志
+            conn.execute('DROP INDEX IF EXISTS idx_products_status')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_status_fetched ON products(status, fetched_at)')
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+        print("数据库：迁移完成。") # 增加日志
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：数据库迁移失败：{e}") # 增加日志
+
+def _row_to_product(row):
+    """将 _PRODUCT_COLUMNS 顺序的查询结果转换为字典。"""
+    return dict(zip(_PRODUCT_COLUMNS, row))
 
 def get_product_from_db(barcode):
-    """从数据库查询产品信息。"""
-    conn = None
+    """从数据库查询产品信息，返回 {'product_name', 'image_url', 'image_filepath', 'status', 'source', ...}。"""
+    pending = product_writer.pending(barcode) # 已入队未提交的写入优先
+    if pending is not None:
+        return pending
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute('SELECT product_name, image_url, image_filepath FROM products WHERE barcode = ?', (barcode,))
+        cursor = get_connection().cursor()
+        cursor.execute(f'SELECT {", ".join(_PRODUCT_COLUMNS)} FROM products WHERE barcode = ?', (barcode,))
         row = cursor.fetchone()
-        conn.close()
         if row:
             print(f"数据库：查询到条码 {barcode} 的缓存数据。") # 增加日志
-            return {'product_name': row[0], 'image_url': row[1], 'image_filepath': row[2]}
+            return _row_to_product(row)
         print(f"数据库：未查询到条码 {barcode} 的缓存数据。") # 增加日志
         return None
     except Exception as e:
         print(f"错误：查询数据库失败：{e}") # 增加日志
         return None
-    finally:
-        if conn:
-            conn.close()
 
+def get_products_by_status(statuses):
+    """
+    按状态查询产品记录（使用 idx_products_status_fetched 索引，不扫描全表），
+    用于列出失败记录和挑选需要重新检索的条码。
 
-def insert_product_to_db(barcode, product_name, image_url, image_filepath):
-    """将产品信息插入数据库。"""
-    conn = None
+    Returns:
+        list: [{'barcode', 'product_name', 'image_url', 'image_filepath', 'status', ...}]，按状态、条码排序
+    """
+    statuses = list(statuses)
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute('INSERT OR REPLACE INTO products (barcode, product_name, image_url, image_filepath) VALUES (?, ?, ?, ?)',
-                       (barcode, product_name, image_url, image_filepath))
-        conn.commit()
-        print(f"数据库：成功插入/更新条码 {barcode} 的数据。") # 增加日志
+        cursor = get_connection().cursor()
+        cursor.execute(f'SELECT barcode, {", ".join(_PRODUCT_COLUMNS)} FROM products '
+                       f'WHERE status IN ({",".join("?" * len(statuses))}) ORDER BY status, barcode', statuses)
+        return [dict(barcode=row[0], **_row_to_product(row[1:])) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"错误：按状态查询数据库失败：{e}") # 增加日志
+        return []
+
+def get_expired_negatives(limit=100, now=None):
+    """
+    查询负缓存已过期、可以重新检索的失败记录，按到期时间先后排序。
+    每种失败状态先用索引取出 fetched_at 早于“当前时间 - 基础TTL”的候选（过期的必要条件），
+    再按失败次数计算实际到期时间过滤。
+
+    Returns:
+        list: 同 get_products_by_status，另含 'expires_at'，最多 limit 条
+    """
+    now = now or time.time()
+    expired = []
+    try:
+        cursor = get_connection().cursor()
+        for status, base_ttl in NEGATIVE_CACHE_TTL.items():
+            cursor.execute(f'SELECT barcode, {", ".join(_PRODUCT_COLUMNS)} FROM products '
+                           f'WHERE status = ? AND fetched_at <= ? ORDER BY fetched_at', (status, now - base_ttl))
+            for row in cursor.fetchall():
+                product = dict(barcode=row[0], **_row_to_product(row[1:]))
+                product['expires_at'] = negative_cache_expires_at(product)
+                if product['expires_at'] <= now:
+                    expired.append(product)
     except Exception as e:
-        print(f"错误：插入/更新数据库失败：{e}") # 增加日志
-    finally:
-        if conn:
-            conn.close()
+        print(f"错误：查询过期的失败记录失败：{e}") # 增加日志
+    expired.sort(key=lambda product: product['expires_at'])
+    return expired[:limit]
+
+def get_products_from_db(barcodes, chunk_size=BULK_QUERY_CHUNK_SIZE):
+    """
+    批量查询产品信息：使用分块的 IN (...) 查询，一个连接完成整批条码的解析。
+
+    Returns:
+        dict: barcode -> 同 get_product_from_db 的字典，未命中的条码不在字典中
+    """
+    products = {}
+    unique_barcodes = list(dict.fromkeys(barcodes)) # 去重并保持顺序
+    if not unique_barcodes:
+        return products
+    try:
+        cursor = get_connection().cursor()
+        for i in range(0, len(unique_barcodes), chunk_size):
+            chunk = unique_barcodes[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'SELECT barcode, {", ".join(_PRODUCT_COLUMNS)} FROM products WHERE barcode IN ({placeholders})', chunk)
+            for row in cursor.fetchall():
+                products[row[0]] = _row_to_product(row[1:])
+    except Exception as e:
+        print(f"错误：批量查询数据库失败：{e}") # 增加日志
+    for barcode in unique_barcodes: # 已入队未提交的写入优先
+        pending = product_writer.pending(barcode)
+        if pending is not None:
+            products[barcode] = pending
+    print(f"数据库：批量查询 {len(unique_barcodes)} 个条码，命中 {len(products)} 个缓存记录。") # 增加日志
+    return products
+
+
+def insert_product_to_db(barcode, product_name, image_url, image_filepath, status=None, source=None, error=None,
+                         fetched_at=None):
+    """
+    将产品信息加入写入队列（不等待磁盘），由写入线程批量提交。
+    status 默认由 product_name 推断；source 为数据来源（barcodelookup / ddgs）；error 记录失败原因；
+    fetched_at 为页面获取时间（默认为当前时间，离线重新解析时为快照的获取时间）。
+    返回 Future，需要确认落盘时调用 .result()。
+    """
+    future = product_writer.submit(barcode, product_name, image_url, image_filepath,
+                                   status=status, source=source, error=error, fetched_at=fetched_at)
+    print(f"数据库：条码 {barcode} 的数据已加入写入队列。") # 增加日志
+    return future
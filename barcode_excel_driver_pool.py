@@ -0,0 +1,242 @@
+"""
+Chrome WebDriver 复用池
+
+爬虫线程原先在每个条码的每次重试中都会新建 webdriver.Chrome 并在结束后 quit，
+大量时间和CPU消耗在浏览器的启动与关闭上。本模块提供一个有界、线程安全的浏览器池：
+
+- 最多保持 size 个常驻的无头浏览器，跨条码、跨任务复用；
+- 取出时做健康检查，崩溃或失去响应的浏览器会被丢弃并按需重建；
+- 归还时清理 Cookie / Storage 并回到空白页，避免状态串到下一个条码；
+- 单个浏览器复用达到 max_uses 次后自动回收重建，防止内存膨胀；
+- 提供 hits / spawns / recycles / crashes 等统计指标。
+
+浏览器按“爬取配置”启动：页面加载策略为 eager（DOMContentLoaded 即返回），
+并通过 CDP Network.setBlockedURLs 屏蔽图片、字体、样式表和第三方统计/广告脚本，
+只保留取两个目标节点所需的HTML和脚本。产品图片由 download_image 单独下载。
+
+用法:
+    pool = get_driver_pool(5)
+    driver = pool.acquire()
+    try:
+        driver.get(url)
+    finally:
+        pool.release(driver)
+"""
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+# --- 配置 ---
+DEFAULT_POOL_SIZE = 5  # 默认池大小（与默认线程数一致）
+MAX_USES_PER_DRIVER = 50  # 单个浏览器最多复用次数，超过后回收重建
+ACQUIRE_TIMEOUT = 300  # 等待空闲浏览器的最长时间（秒）
+PAGE_LOAD_STRATEGY = 'eager'  # DOMContentLoaded 后即返回，不等待图片等子资源
+# 屏蔽的资源（CDP Network.setBlockedURLs 通配符）：图片、字体、样式表、媒体和第三方统计/广告
+# 注意不要屏蔽 Cloudflare 校验脚本（challenges.cloudflare.com）
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css", "*.mp4", "*.webm",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*adservice.google.com*", "*amazon-adsystem.com*",
+    "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*", "*clarity.ms*",
+]
+
+
+def create_chrome_options():
+    """按爬取配置生成 Chrome 启动选项。"""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # 无头模式：不显示浏览器窗口
+    chrome_options.add_argument("--disable-gpu")  # 禁用 GPU 加速，有时可避免问题
+    chrome_options.add_argument("--window-size=1920x1080")  # 设置浏览器窗口大小
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")  # 不加载页面图片
+    chrome_options.page_load_strategy = PAGE_LOAD_STRATEGY
+    return chrome_options
+
+
+def apply_crawl_profile(driver):
+    """通过 CDP 屏蔽非必要资源，设置在浏览器会话内持续有效。"""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        print(f"浏览器池：设置资源屏蔽失败：{e}")
+
+
+def create_chrome_driver():
+    """创建一个按爬取配置启动的无头 Chrome 浏览器实例（默认工厂函数）。"""
+    driver = webdriver.Chrome(options=create_chrome_options())
+    apply_crawl_profile(driver)
+    return driver
+
+
+class DriverPool:
+    """有界、线程安全的 Chrome WebDriver 池。"""
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, driver_factory=None, max_uses=MAX_USES_PER_DRIVER):
+        self.size = size
+        self.driver_factory = driver_factory or create_chrome_driver
+        self.max_uses = max_uses
+        self._idle = []  # 空闲浏览器（后进先出，优先复用最近用过的）
+        self._uses = {}  # id(driver) -> 已使用次数
+        self._live = 0  # 当前存活的浏览器数量（空闲 + 使用中）
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {'hits': 0, 'spawns': 0, 'recycles': 0, 'crashes': 0}
+
+    def _is_healthy(self, driver):
+        """健康检查：浏览器进程仍可响应脚本执行。"""
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _reset(self, driver):
+        """清理浏览器状态，供下一个条码使用。"""
+        driver.delete_all_cookies()
+        try:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        except Exception:
+            pass  # about:blank 等页面没有 Storage，忽略
+        driver.get("about:blank")
+
+    def _discard(self, driver, reason):
+        """关闭并丢弃一个浏览器，释放名额。"""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._uses.pop(id(driver), None)
+            self._live -= 1
+            self._stats[reason] += 1
+            self._cond.notify()
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """
+        取出一个可用浏览器。优先复用空闲浏览器，池未满时新建，否则阻塞等待。
+
+        Raises:
+            TimeoutError: 在 timeout 秒内没有可用浏览器
+            RuntimeError: 浏览器池已关闭
+        """
+        deadline = time.time() + timeout
+        while True:
+            driver = None
+            spawn = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("浏览器池已关闭")
+                    if self._idle:
+                        driver = self._idle.pop()
+                        break
+                    if self._live < self.size:
+                        self._live += 1
+                        spawn = True
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutError(f"等待空闲浏览器超时 ({timeout} 秒)")
+                    self._cond.wait(remaining)
+            if spawn:
+                try:
+                    driver = self.driver_factory()
+                except Exception:
+                    with self._cond:
+                        self._live -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._uses[id(driver)] = 1
+                    self._stats['spawns'] += 1
+                print(f"浏览器池：新建浏览器实例 (存活 {self._live}/{self.size})")
+                return driver
+            if self._is_healthy(driver):
+                with self._cond:
+                    self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+                    self._stats['hits'] += 1
+                return driver
+            print("浏览器池：检测到浏览器无响应，丢弃并重建。")
+            self._discard(driver, 'crashes')
+
+    def release(self, driver, discard=False, recycle=False):
+        """
+        归还浏览器。discard=True 表示该浏览器已损坏（如 WebDriverException），直接丢弃；
+        recycle=True 表示浏览器正常但不宜继续使用（如指纹被拦截），关闭后由池重建。
+        """
+        if driver is None:
+            return
+        with self._cond:
+            uses = self._uses.get(id(driver), 0)
+            over_size = self._live > self.size
+            closed = self._closed
+        if discard:
+            self._discard(driver, 'crashes')
+            return
+        if recycle or closed or over_size or uses >= self.max_uses:
+            self._discard(driver, 'recycles')
+            return
+        try:
+            self._reset(driver)
+        except Exception as e:
+            print(f"浏览器池：重置浏览器状态失败，丢弃该实例：{e}")
+            self._discard(driver, 'crashes')
+            return
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        """上下文管理器：自动取出与归还，发生异常时丢弃浏览器。"""
+        driver = self.acquire()
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, discard=True)
+            raise
+        else:
+            self.release(driver)
+
+    def resize(self, size):
+        """调整池大小。缩小时多余的浏览器在归还时回收。"""
+        with self._cond:
+            self.size = max(1, size)
+            self._cond.notify_all()
+
+    def metrics(self):
+        """返回池统计指标的快照。"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({'size': self.size, 'live': self._live, 'idle': len(self._idle)})
+        return snapshot
+
+    def close(self):
+        """关闭池并退出所有空闲浏览器；使用中的浏览器在归还时退出。"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for driver in idle:
+            self._discard(driver, 'recycles')
+
+
+_global_pool = None
+_global_pool_lock = threading.Lock()
+
+
+def get_driver_pool(size=DEFAULT_POOL_SIZE):
+    """获取进程级共享浏览器池（跨任务复用），必要时扩容到 size。"""
+    global _global_pool
+    with _global_pool_lock:
+        if _global_pool is None:
+            _global_pool = DriverPool(size)
+            atexit.register(_global_pool.close)
+        elif size > _global_pool.size:
+            _global_pool.resize(size)
+        return _global_pool
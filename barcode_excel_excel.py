@@ -12,7 +12,7 @@ from selenium_stealth import stealth
 import openpyxl
 from openpyxl.drawing.image import Image
 # 导入 openpyxl.utils 模块，用于列字母和索引转换
-from openpyxl.utils import column_index_from_string
+from openpyxl.utils import column_index_from_string, get_column_letter
 from barcode_excel_db import init_database, get_product_from_db, insert_product_to_db
 
 # --- Excel 操作 ---
@@ -46,6 +46,90 @@ def read_barcodes_from_excel_with_row(filepath, barcode_column_letter, start_row
     print(f"读取Excel：成功读取 {len(barcodes_with_row)} 个有效条码及对应行号。") # 增加日志
     return barcodes_with_row
 
+def prepare_excel_image(image_filepath):
+    """
+    图片后处理：完整解码图片以确认文件可用，返回原图尺寸 (width, height)。
+    图片不存在或损坏时返回 None。与写入工作表分开，可以在写入线程之外并行执行。
+    """
+    if not image_filepath or not os.path.exists(image_filepath):
+        return None
+    try:
+        with PILImage.open(image_filepath) as pil_img:
+            pil_img.load()  # 强制完整解码，提前发现截断/损坏的图片
+            return pil_img.size
+    except Exception as e:
+        print(f"错误：图片 {image_filepath} 无法解码: {e}") # 增加日志
+        return None
+
+
+def write_product_to_sheet(sheet, row_index, barcode, product_name, image_filepath,
+                           product_name_col_index, image_col_index, image_size=None):
+    """
+    将一行结果写入工作表：产品名称写入名称列，图片按单元格大小等比缩放后嵌入图片列。
+    image_size 为 prepare_excel_image 预先得到的原图尺寸，未提供时在此处计算。
+    """
+    image_column_letter = get_column_letter(image_col_index)
+    # 设置当前行的行高 (在循环内部为每行设置)
+    sheet.row_dimensions[row_index].height = 40 # 设置固定行高
+
+    # 写入产品名称
+    sheet.cell(row=row_index, column=product_name_col_index).value = product_name
+    print(f"更新Excel：写入产品名称 '{product_name}' 到行 {row_index}，列 {get_column_letter(product_name_col_index)}。") # 增加日志
+
+    # 嵌入图片
+    if image_filepath and os.path.exists(image_filepath):
+        try:
+            if image_size is None:
+                image_size = prepare_excel_image(image_filepath)
+            if image_size is None:
+                raise ValueError("图片无法解码")
+            # 获取原图尺寸用于计算比例
+            orig_width, orig_height = image_size
+
+            # 创建openpyxl图片对象
+            # openpyxl Image可以直接从图片文件路径创建
+            img = Image(image_filepath)
+
+            # 计算缩放比例,以保持纵横比
+            # openpyxl 的 column_dimensions.width 是以字符宽度为单位的，1个字符宽度大约等于 7 像素
+            # openpyxl 的 row_dimensions.height 是以磅 (points) 为单位的，1磅 ≈ 96/72 = 1.33 像素
+            # 注意：这里假设列宽和行高已经在函数外部设置好
+            col_width_pixels = sheet.column_dimensions[image_column_letter].width * 7
+            row_height_pixels = sheet.row_dimensions[row_index].height * 1.33 # 使用 row_index
+
+            # 避免除以零
+            if orig_width == 0 or orig_height == 0:
+                 print(f"警告：图片 {image_filepath} 尺寸为零，无法嵌入。")
+                 sheet.cell(row=row_index, column=image_col_index).value = "Invalid Image Size"
+            else:
+                scale_factor = min(
+                    col_width_pixels / orig_width,
+                    row_height_pixels / orig_height
+                )
+
+                # 设置显示尺寸
+                img.width = int(orig_width * scale_factor)
+                img.height = int(orig_height * scale_factor)
+
+                # 设置图片位置到单元格
+                cell = sheet.cell(row=row_index, column=image_col_index) # 使用 sheet 和 row_index
+                img.anchor = cell.coordinate
+
+                # 添加图片到工作表
+                sheet.add_image(img) # 使用 sheet
+                print(f"更新Excel：成功嵌入图片 {os.path.basename(image_filepath)} 到行 {row_index}，列 {image_column_letter}。") # 增加日志
+        except Exception as e:
+            print(f"错误：嵌入图片 {image_filepath} 到行 {row_index} 失败: {e}") # 增加日志
+    elif product_name == "Not Found":
+         # 如果条码未找到，可以在图片列标记一下
+         sheet.cell(row=row_index, column=image_col_index).value = "Image Not Found"
+         print(f"更新Excel：条码 {barcode} 未找到，在图片列标记 'Image Not Found'。") # 增加日志
+    else:
+         # 如果爬取成功但没有图片URL或下载失败
+         sheet.cell(row=row_index, column=image_col_index).value = "Image Download Failed"
+         print(f"更新Excel：条码 {barcode} 图片下载失败，在图片列标记 'Image Download Failed'。") # 增加日志
+
+
 # 修改 update_excel_with_results 函数以接收包含行号的结果列表
 def update_excel_with_results_with_row(filepath, results_with_row, barcode_column_letter, product_name_column_letter, image_column_letter):
     """
@@ -71,76 +155,8 @@ def update_excel_with_results_with_row(filepath, results_with_row, barcode_colum
         # 遍历包含行号的结果列表并更新Excel
         for barcode, product_name, image_filepath, row_index in results_with_row:
             print(f"更新Excel：正在处理条码 {barcode}，对应Excel行号 {row_index}。") # 增加日志
-            
-            # 设置当前行的行高 (在循环内部为每行设置)
-            sheet.row_dimensions[row_index].height = 40 # 设置固定行高
-
-            # 写入产品名称
-            sheet.cell(row=row_index, column=product_name_col_index).value = product_name
-            print(f"更新Excel：写入产品名称 '{product_name}' 到行 {row_index}，列 {product_name_column_letter}。") # 增加日志
-
-            # 嵌入图片
-            if image_filepath and os.path.exists(image_filepath):
-                try:
-                    # 直接使用Pillow Image对象创建openpyxl Image
-                    # 导入 PILImage
-                    from PIL import Image as PILImage
-                    pil_img = PILImage.open(image_filepath)
-                    # 将图片转换为RGB模式(避免alpha通道问题)
-                    if pil_img.mode != 'RGB':
-                        pil_img = pil_img.convert('RGB')
-
-                    # 获取原图尺寸用于计算比例
-                    orig_width, orig_height = pil_img.size
-
-                    # 创建openpyxl图片对象
-                    # openpyxl Image可以直接从图片文件路径创建
-                    img = Image(image_filepath)
-
-                    # 计算缩放比例,以保持纵横比
-                    # 使用 image_col_index 代替硬编码的 15
-                    # 需要将列宽和行高转换为像素单位进行计算
-                    # openpyxl 的 column_dimensions.width 是以字符宽度为单位的，需要转换
-                    # 1个字符宽度大约等于 7 像素 (这是一个经验值，可能因字体和DPI而异)
-                    # openpyxl 的 row_dimensions.height 是以磅 (points) 为单位的，需要转换
-                    # 1磅 = 1/72 英寸，1英寸 = 96 像素 (标准 DPI)
-                    # 1磅 ≈ 96/72 = 1.33 像素
-                    # 假设 1字符宽度 ≈ 7像素，1磅 ≈ 1.33像素
-                    # 注意：这里假设列宽和行高已经在函数外部设置好
-                    col_width_pixels = sheet.column_dimensions[chr(ord('A') + image_col_index - 1)].width * 7
-                    row_height_pixels = sheet.row_dimensions[row_index].height * 1.33 # 使用 row_index
-
-                    # 避免除以零
-                    if orig_width == 0 or orig_height == 0:
-                         print(f"警告：图片 {image_filepath} 尺寸为零，无法嵌入。")
-                         sheet.cell(row=row_index, column=image_col_index).value = "Invalid Image Size"
-                    else:
-                        scale_factor = min(
-                            col_width_pixels / orig_width,
-                            row_height_pixels / orig_height
-                        )
-
-                        # 设置显示尺寸
-                        img.width = int(orig_width * scale_factor)
-                        img.height = int(orig_height * scale_factor)
-
-                        # 设置图片位置到单元格
-                        cell = sheet.cell(row=row_index, column=image_col_index) # 使用 sheet 和 row_index
-                        img.anchor = cell.coordinate
-
-                        # 添加图片到工作表
-                        sheet.add_image(img) # 使用 sheet
-                        print(f"更新Excel：成功嵌入图片 {os.path.basename(image_filepath)} 到行 {row_index}，列 {image_column_letter}。") # 增加日志
-                except Exception as e:
-                    print(f"错误：嵌入图片 {image_filepath} 到行 {row_index} 失败: {e}") # 增加日志
-            elif product_name == "Not Found":
-                 # 如果条码未找到，可以在图片列标记一下
-                 sheet.cell(row=row_index, column=image_col_index).value = "Image Not Found"
-                 print(f"更新Excel：条码 {barcode} 未找到，在图片列标记 'Image Not Found'。") # 增加日志
-            else:
-                 # 如果爬取成功但没有图片URL或下载失败
-                 sheet.cell(row=row_index, column=image_col_index).value = "Image Download Failed"
-                 print(f"更新Excel：条码 {barcode} 图片下载失败，在图片列标记 'Image Download Failed'。") # 增加日志
+            write_product_to_sheet(sheet, row_index, barcode, product_name, image_filepath,
+                                   product_name_col_index, image_col_index)
 
 
         # 保存更新后的Excel文件
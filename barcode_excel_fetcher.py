@@ -0,0 +1,177 @@
+"""
+barcodelookup 页面分级获取（HTTP 优先，Selenium 兜底）
+
+产品名称和图片来自两个固定 XPath，大多数情况下静态 HTML 中已经包含。
+本模块先用连接池化的 requests.Session 直接请求页面，并用 lxml 按同样的 XPath 解析；
+只有当响应不可用（Cloudflare 拦截、非200、缺少目标节点等）时才返回 'unusable'，
+由调用方升级到 Selenium 浏览器渲染。
+
+每个条码最终由哪一级（http / selenium / ddgs）提供数据记录在 tier_stats 中，
+用于衡量节省了多少浏览器时间。
+
+测试（本地HTTP服务提供 tests/recorded_pages 下录制的页面，不访问外网）:
+    pytest tests/test_barcode_excel_fetcher.py
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
+from RandomUaStealth import get_random_user_agent
+from barcode_excel_ratelimit import throttle
+
+# --- 配置 ---
+BASE_URL = "https://www.barcodelookup.com/{}"  # 目标网站URL模板
+IMAGE_XPATH = '/html/body/section[2]/div[1]/div/div/div[1]/div[1]/img'  # 产品图片XPath
+PRODUCT_NAME_XPATH = '/html/body/section[2]/div[1]/div/div/div[2]/h4'  # 产品名称XPath
+HTTP_TIMEOUT = 10  # HTTP请求超时（秒）
+HTTP_POOL_SIZE = 20  # 连接池大小
+
+HTTP_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Referer": "https://www.barcodelookup.com/",
+}
+
+# Cloudflare 拦截页面的标识
+CHALLENGE_MARKERS = ("Just a moment...", "Cloudflare", "Enable JavaScript and cookies to continue")
+NOT_FOUND_TITLE = "Barcode Not Found | Barcode Lookup"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """获取进程级共享的 requests.Session（带连接池，保持长连接）。"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(HTTP_HEADERS)
+            _session = session
+        return _session
+
+
+def is_invalid_product_name(product_name):
+    """前6个字符都是数字且第7位是"."的产品名称视为错误数据。"""
+    return len(product_name) >= 7 and product_name[:6].isdigit() and product_name[6] == "."
+
+
+def parse_product_page(page_html, name_xpath=PRODUCT_NAME_XPATH, image_xpath=IMAGE_XPATH):
+    """
+    解析产品页面HTML。
+
+    Returns:
+        dict: {'status': 'ok' | 'not_found' | 'challenge' | 'unusable',
+               'product_name': str 或 None, 'image_url': str 或 None}
+    """
+    result = {'status': 'unusable', 'product_name': None, 'image_url': None}
+    if not page_html:
+        return result
+    try:
+        tree = lxml_html.fromstring(page_html)
+    except Exception as e:
+        print(f"HTTP获取：解析HTML失败：{e}")
+        return result
+    title = (tree.findtext('.//title') or '').strip()
+    if any(marker in title for marker in CHALLENGE_MARKERS) or CHALLENGE_MARKERS[2] in page_html:
+        result['status'] = 'challenge'
+        return result
+    if NOT_FOUND_TITLE in title:
+        result['status'] = 'not_found'
+        return result
+    name_nodes = tree.xpath(name_xpath)
+    image_nodes = tree.xpath(image_xpath)
+    if not name_nodes or not image_nodes:
+        return result  # 静态HTML中缺少目标节点，交给浏览器渲染
+    product_name = ' '.join(name_nodes[0].text_content().split())
+    image_url = image_nodes[0].get('src') or image_nodes[0].get('data-src')
+    if not product_name or is_invalid_product_name(product_name) or not image_url:
+        return result
+    result.update({'status': 'ok', 'product_name': product_name, 'image_url': image_url})
+    return result
+
+
+def target_elements_ready(name_xpath=PRODUCT_NAME_XPATH, image_xpath=IMAGE_XPATH):
+    """
+    Selenium 等待条件：两个目标节点都已出现，或页面为未找到/拦截页面时返回 True。
+    用于替代等待整个页面加载完成。
+    """
+    def _ready(driver):
+        title = driver.title or ''
+        if NOT_FOUND_TITLE in title or any(marker in title for marker in CHALLENGE_MARKERS):
+            return True
+        return bool(driver.find_elements("xpath", name_xpath)) and bool(driver.find_elements("xpath", image_xpath))
+    return _ready
+
+
+def fetch_product_http(barcode, base_url=BASE_URL, name_xpath=PRODUCT_NAME_XPATH, image_xpath=IMAGE_XPATH,
+                       timeout=HTTP_TIMEOUT):
+    """
+    第一级：直接HTTP请求产品页面并解析。
+
+    Returns:
+        dict: 同 parse_product_page，额外包含 'html'（原始页面，失败时为 None）
+    """
+    url = base_url.format(barcode)
+    throttle(url)  # 按主机限速，与 Selenium 共用令牌桶
+    try:
+        response = get_http_session().get(url, timeout=timeout,
+                                          headers={"User-Agent": get_random_user_agent()})
+    except requests.exceptions.RequestException as e:
+        print(f"HTTP获取：请求 {url} 失败：{e}")
+        return {'status': 'unusable', 'product_name': None, 'image_url': None, 'html': None}
+    if response.status_code == 404:
+        result = parse_product_page(response.text, name_xpath, image_xpath)
+        if result['status'] != 'not_found':
+            result['status'] = 'unusable'
+    elif response.status_code != 200:
+        print(f"HTTP获取：{url} 返回状态码 {response.status_code}")
+        status = 'challenge' if response.status_code in (403, 429, 503) else 'unusable'
+        result = {'status': status, 'product_name': None, 'image_url': None}
+    else:
+        result = parse_product_page(response.text, name_xpath, image_xpath)
+    result['html'] = response.text
+    print(f"HTTP获取：条码 {barcode} 结果 {result['status']}")
+    return result
+
+
+class TierStats:
+    """记录每个条码由哪一级获取成功（线程安全）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}  # barcode -> (tier, elapsed)
+
+    def record(self, barcode, tier, elapsed):
+        with self._lock:
+            self._records[barcode] = (tier, elapsed)
+
+    def get(self, barcode):
+        with self._lock:
+            return self._records.get(barcode)
+
+    def summary(self):
+        """按级别汇总数量和平均耗时。"""
+        with self._lock:
+            records = list(self._records.values())
+        summary = {}
+        for tier, elapsed in records:
+            item = summary.setdefault(tier, {'count': 0, 'total_seconds': 0.0})
+            item['count'] += 1
+            item['total_seconds'] += elapsed
+        for item in summary.values():
+            item['avg_seconds'] = round(item['total_seconds'] / item['count'], 2)
+            item['total_seconds'] = round(item['total_seconds'], 2)
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+tier_stats = TierStats()
+
@@ -0,0 +1,175 @@
+"""
+对冲请求（hedged request）：barcodelookup 与 DDGS 竞速
+
+原流程中 DDGS 只有在 barcodelookup 失败之后才开始，而 barcodelookup 最多要尝试 10 次浏览器，
+Cloudflare 重试之间还有指数退避等待。对冲模式下：
+
+- 主来源（barcodelookup）先开始；若 delay 秒（按主来源耗时的 p90 配置）内仍未返回，
+  并行启动备用来源（DDGS）；
+- 先返回可用结果的一方获胜，另一方通过 cancel_event 协作式取消（在重试、等待、下载之间检查）；
+  暂存结果（parked，来源在熔断中）不能胜出；
+- 有副作用的一步（写入图片、写入数据库）之前必须调用 claim() 抢占胜出权，落败方不会覆盖胜者的结果；
+  抢占后仍以 None 结束时让出胜出权，另一来源不会被取消；
+- 主来源失败时可通过 fallback() 直接使用（必要时立即启动）备用来源，与原来的顺序回退一致。
+
+每个条码的胜出来源、耗时和节省的时间记录在 hedge_stats 中，summary() 给出主来源耗时的 p90，
+用于调整 HEDGE_DELAY。
+
+用法:
+    race = HedgedRace(primary, secondary, delay=HEDGE_DELAY)
+    winner, result = race.run()
+    # primary(cancel_event, fallback) / secondary(cancel_event, claim) 返回结果或 None
+"""
+
+import threading
+import time
+
+# --- 配置 ---
+HEDGE_DELAY = 8.0  # 主来源超过此时间（秒，约为其耗时的 p90）仍未返回时启动备用来源
+PRIMARY = 'barcodelookup'  # 胜出来源名称
+SECONDARY = 'ddgs'
+
+
+class HedgedRace:
+    """一次对冲竞速：主来源先行，超时后启动备用来源，先返回可用结果者胜出。"""
+
+    def __init__(self, primary, secondary, delay=HEDGE_DELAY, name="Hedge"):
+        self.primary = primary
+        self.secondary = secondary
+        self.delay = delay
+        self.name = name
+        self.cancel_event = threading.Event()  # 胜负已分时设置，通知落败方停止
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._results = {}  # 来源 -> 结果（None 表示失败）
+        self._winner = None
+        self._secondary_thread = None
+        self._start_time = None
+        self.secondary_started_at = None  # 备用来源启动时距开始的秒数；未启动为 None
+        self.hedged = False  # 备用来源是否因主来源超时而提前启动（而非主来源失败后的回退）
+
+    def claim(self, source=SECONDARY):
+        """抢占胜出权：尚无胜者时记录 source 为胜者并返回 True。有副作用的写入之前调用。"""
+        with self._lock:
+            if self._winner is None:
+                self._winner = source
+                self._changed.notify_all()
+            return self._winner == source
+
+    @staticmethod
+    def _usable(result):
+        """可以胜出的结果：非空且不是暂存结果（parked，来源在熔断中，并未真正获取）。"""
+        return bool(result) and not result.get('parked')
+
+    def _finish(self, source, result):
+        with self._lock:
+            self._results[source] = result
+            usable = self._usable(result)
+            if usable and self._winner is None:
+                self._winner = source
+            elif not usable and self._winner == source:
+                # 抢占胜出权后失败（如写入图片或入库出错）：让出胜出权，继续等待另一来源
+                self._winner = next((other for other, other_result in self._results.items()
+                                     if self._usable(other_result)), None)
+            self._changed.notify_all()
+
+    def _run_source(self, source, func, *args):
+        try:
+            result = func(*args)
+        except Exception as e:
+            print(f"对冲：{self.name} 的 {source} 出错：{e}")  # 增加日志
+            result = None
+        self._finish(source, result)
+
+    def start_secondary(self, reason="未返回"):
+        """启动备用来源（只启动一次）。"""
+        with self._lock:
+            if self._secondary_thread is not None:
+                return
+            self.secondary_started_at = time.time() - self._start_time
+            self._secondary_thread = threading.Thread(
+                target=self._run_source, args=(SECONDARY, self.secondary, self.cancel_event, self.claim),
+                name=f"{self.name}-{SECONDARY}", daemon=True)
+            self._secondary_thread.start()
+        print(f"对冲：{self.name} 主来源 {self.secondary_started_at:.1f} 秒{reason}，启动 {SECONDARY}。")  # 增加日志
+
+    def fallback(self):
+        """主来源失败时调用：启动（或等待已启动的）备用来源，返回其结果。"""
+        self.start_secondary(reason="时失败")
+        with self._lock:
+            while SECONDARY not in self._results:
+                self._changed.wait()
+            return self._results[SECONDARY]
+
+    def run(self):
+        """
+        执行竞速并等待结果。
+
+        Returns:
+            tuple: (胜出来源, 结果)；两个来源都失败时为 (None, None)，主来源返回暂存结果时为 (None, 暂存结果)
+        """
+        self._start_time = time.time()
+        threading.Thread(target=self._run_source, args=(PRIMARY, self.primary, self.cancel_event, self.fallback),
+                         name=f"{self.name}-{PRIMARY}", daemon=True).start()
+        with self._lock:
+            self._changed.wait_for(lambda: PRIMARY in self._results, timeout=self.delay)
+        if self._winner is None and PRIMARY not in self._results:
+            self.hedged = True
+            self.start_secondary()
+        with self._lock:
+            # 等到有胜者的结果，或所有已启动的来源都已返回
+            self._changed.wait_for(lambda: (self._winner is not None and self._winner in self._results)
+                                   or PRIMARY in self._results and (self._secondary_thread is None
+                                                                    or SECONDARY in self._results))
+            winner = self._winner
+            # 没有胜者时返回主来源的结果（None 或暂存结果），由调用方决定是否暂存条码
+            result = self._results.get(winner or PRIMARY)
+        self.cancel_event.set()  # 通知落败方停止
+        return winner, result
+
+    @property
+    def elapsed(self):
+        return time.time() - self._start_time
+
+
+class HedgeStats:
+    """记录每个条码的对冲结果（线程安全）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}  # barcode -> {'winner', 'elapsed', 'hedged', 'saved_seconds'}
+
+    def record(self, barcode, winner, elapsed, secondary_started_at, hedged):
+        """
+        记录一次竞速。对冲启动的备用来源胜出时，顺序执行需要等主来源（此刻仍未结束）失败后才开始备用来源，
+        至少多花备用来源自身的耗时，记为节省的时间（下限）；主来源胜出或未对冲时为 0。
+        """
+        saved = elapsed - secondary_started_at if hedged and winner == SECONDARY else 0.0
+        with self._lock:
+            self._records[barcode] = {'winner': winner, 'elapsed': elapsed, 'hedged': hedged,
+                                      'saved_seconds': saved}
+
+    def get(self, barcode):
+        with self._lock:
+            return self._records.get(barcode)
+
+    def summary(self):
+        """按胜出来源汇总数量、节省时间，以及主来源胜出时耗时的 p90（用于调整 HEDGE_DELAY）。"""
+        with self._lock:
+            records = list(self._records.values())
+        summary = {'races': len(records), 'hedged': sum(1 for r in records if r['hedged']),
+                   'saved_seconds': round(sum(r['saved_seconds'] for r in records), 2), 'wins': {}}
+        for record in records:
+            winner = record['winner'] or 'none'
+            summary['wins'][winner] = summary['wins'].get(winner, 0) + 1
+        primary_latencies = sorted(r['elapsed'] for r in records if r['winner'] == PRIMARY)
+        if primary_latencies:
+            summary['primary_p90_seconds'] = round(primary_latencies[int(0.9 * (len(primary_latencies) - 1))], 2)
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+hedge_stats = HedgeStats()
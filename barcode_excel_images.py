@@ -0,0 +1,199 @@
+"""
+图片下载（连接池、流式、大小上限、内容嗅探、原子写入）
+
+backend.download_image 和 DDGS 的 download_image_with_fallback 原先每次都直接 requests.get，
+每张图片都要重新建立 TCP/TLS 连接；DDGS 还先把整个响应读入内存再经 PIL 重新编码，
+下载中断时会留下 0 字节或残缺的文件（image_check/clean_empty_files.py 就是为此而写）。本模块：
+
+- 所有图片请求共用一个带连接池的 requests.Session（HTTP keep-alive）；
+- 流式读取，Content-Length 或实际读取量超过 MAX_IMAGE_BYTES 时立即放弃；
+- 按文件头魔数判断内容是否为图片（JPEG / PNG / GIF / WEBP / BMP），拒绝以 200 返回的 HTML 错误页；
+- 先写入同目录的 .part 临时文件，完整下载后再 os.replace 为目标文件，失败时删除临时文件，
+  目标路径上要么没有文件，要么是完整的图片。
+
+用法:
+    download_image_file(url, 'downloaded_images/123.jpg')   # 成功返回路径，失败返回 None
+    data, image_type = fetch_image(url)                     # 读入内存；失败抛出异常
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from barcode_excel_ratelimit import throttle
+
+# --- 配置 ---
+IMAGE_TIMEOUT = 10  # 图片请求超时（秒）
+IMAGE_POOL_HOSTS = 32  # 连接池缓存的主机数（DDGS 候选图片来自很多不同主机）
+IMAGE_POOL_SIZE = 16  # 每个主机的最大连接数
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 单张图片大小上限（字节）
+CHUNK_SIZE = 64 * 1024  # 流式读取块大小（字节）
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'downloads': 0, 'bytes': 0, 'failed': 0, 'rejected': {}}
+
+
+class ImageDownloadError(Exception):
+    """响应不是可用的图片（过大、为空或不是图片格式），重试不会改变结果。"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def sniff_image_type(head):
+    """
+    按文件头魔数判断图片格式。
+
+    Returns:
+        str: 'jpeg' / 'png' / 'gif' / 'webp' / 'bmp'；不是已知图片格式时返回 None
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    return None
+
+
+def get_image_session():
+    """获取进程级共享的图片下载 Session（带连接池，保持长连接）。"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=IMAGE_POOL_HOSTS, pool_maxsize=IMAGE_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def _record(outcome, size=0):
+    with _stats_lock:
+        if outcome == 'ok':
+            _stats['downloads'] += 1
+            _stats['bytes'] += size
+        elif outcome == 'failed':
+            _stats['failed'] += 1
+        else:
+            _stats['rejected'][outcome] = _stats['rejected'].get(outcome, 0) + 1
+
+
+def _iter_image_chunks(url, max_bytes, timeout):
+    """
+    流式请求图片，逐块返回内容。第一块之前先检查大小和格式。
+
+    Yields:
+        str 然后 bytes: 第一个值为嗅探出的图片格式，之后为内容块
+    """
+    throttle(url)  # 按图片主机限速
+    with get_image_session().get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise ImageDownloadError('too_large', f"图片大小 {int(content_length)} 字节超过上限 {max_bytes}")
+        image_type = None
+        total = 0
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if not chunk:
+                continue
+            if image_type is None:
+                image_type = sniff_image_type(chunk[:16])
+                if image_type is None:
+                    content_type = response.headers.get('Content-Type', '未知')
+                    raise ImageDownloadError('not_image', f"响应不是图片（Content-Type: {content_type}）")
+                yield image_type
+            total += len(chunk)
+            if total > max_bytes:
+                raise ImageDownloadError('too_large', f"图片超过大小上限 {max_bytes} 字节")
+            yield chunk
+        if image_type is None:
+            raise ImageDownloadError('empty', "响应内容为空")
+
+
+def fetch_image(url, max_bytes=MAX_IMAGE_BYTES, timeout=IMAGE_TIMEOUT):
+    """
+    下载图片到内存。
+
+    Returns:
+        tuple: (图片内容 bytes, 图片格式)
+
+    Raises:
+        ImageDownloadError: 响应不是可用的图片（不应重试）
+        requests.exceptions.RequestException: 网络或 HTTP 错误
+    """
+    chunks = _iter_image_chunks(url, max_bytes, timeout)
+    try:
+        image_type = next(chunks)
+        data = b''.join(chunks)
+    except ImageDownloadError as e:
+        _record(e.reason)
+        raise
+    except Exception:
+        _record('failed')
+        raise
+    finally:
+        chunks.close()  # 提前放弃时关闭响应，连接归还连接池
+    _record('ok', len(data))
+    return data, image_type
+
+
+def write_file_atomic(filepath, data):
+    """先写入临时文件，再原子替换为 filepath。"""
+    temp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, filepath)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def download_image_file(url, filepath, max_bytes=MAX_IMAGE_BYTES, timeout=IMAGE_TIMEOUT):
+    """
+    流式下载图片到 filepath（经临时文件原子替换）。
+
+    Returns:
+        str: 成功时返回 filepath；失败时返回 None（不会留下空文件或残缺文件）
+    """
+    temp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.part"
+    total = 0
+    chunks = _iter_image_chunks(url, max_bytes, timeout)
+    try:
+        next(chunks)  # 格式检查通过后才创建临时文件
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                total += len(chunk)
+        os.replace(temp_path, filepath)
+        _record('ok', total)
+        return filepath
+    except ImageDownloadError as e:
+        _record(e.reason)
+        print(f"错误：下载图片 {url} 失败：{e}")  # 增加日志
+        return None
+    except (requests.exceptions.RequestException, OSError) as e:
+        _record('failed')
+        print(f"错误：下载图片 {url} 失败: {e}")  # 增加日志
+        return None
+    finally:
+        chunks.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def download_metrics():
+    """图片下载统计：成功数、总字节数、失败数和按原因统计的拒绝数。"""
+    with _stats_lock:
+        snapshot = dict(_stats)
+        snapshot['rejected'] = dict(_stats['rejected'])
+    return snapshot
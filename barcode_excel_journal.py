@@ -0,0 +1,179 @@
+"""
+Excel 处理任务日志（断点续跑）
+
+process_excel 崩溃或 Flask 进程重启后，内存中的结果全部丢失，重跑时未入缓存的条码
+需要重新打开浏览器爬取。本模块在 SQLite 中记录每个任务的参数和每一行的处理进度：
+
+    pending -> fetched -> image_done -> written -> translated
+
+- fetched     已获取产品名称和图片URL，图片尚未下载
+- image_done  图片已下载（或已确定没有可写入的结果）
+- written     产品名称和图片已写入并随输出工作簿保存到磁盘
+- translated  翻译也已写入并保存，该行完成
+
+翻译结果单独保存在 translation 列，续跑时不会重复调用翻译接口。
+状态只会前进不会后退；backend.resume(job_id) 按记录的状态从断点继续。
+"""
+
+import json
+import time
+import uuid
+from barcode_excel_db import get_connection
+
+# --- 配置 ---
+JOURNAL_STATES = ('pending', 'fetched', 'image_done', 'written', 'translated')  # 行状态（按先后顺序）
+
+
+def init_journal():
+    """创建任务表和行状态表（如果不存在）。"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                params TEXT,
+                output_path TEXT,
+                status TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_rows (
+                job_id TEXT,
+                row_index INTEGER,
+                barcode TEXT,
+                state TEXT,
+                product_name TEXT,
+                image_url TEXT,
+                image_filepath TEXT,
+                translation TEXT,
+                PRIMARY KEY (job_id, row_index)
+            )
+        ''')
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：任务日志初始化失败：{e}") # 增加日志
+
+
+def new_job_id():
+    """生成新的任务ID。"""
+    return uuid.uuid4().hex[:12]
+
+
+def create_job(job_id, params, output_path, rows):
+    """
+    登记一个新任务及其所有行（状态为 pending）。
+
+    Args:
+        params (dict): process_excel 的参数，续跑时原样使用
+        rows (list): [(row_index, barcode 或 None), ...]
+    """
+    now = time.time()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR REPLACE INTO jobs (job_id, params, output_path, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                       (job_id, json.dumps(params, ensure_ascii=False), output_path, 'running', now, now))
+        cursor.executemany('INSERT OR REPLACE INTO job_rows (job_id, row_index, barcode, state) VALUES (?, ?, ?, ?)',
+                           [(job_id, row_index, barcode, 'pending') for row_index, barcode in rows])
+        conn.commit()
+        print(f"任务日志：登记任务 {job_id}，共 {len(rows)} 行。") # 增加日志
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：登记任务 {job_id} 失败：{e}") # 增加日志
+
+
+def get_job(job_id):
+    """查询任务信息，返回 {'job_id', 'params', 'output_path', 'status', 'created_at', 'updated_at'}，不存在时返回 None。"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT job_id, params, output_path, status, created_at, updated_at FROM jobs WHERE job_id = ?', (job_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {'job_id': row[0], 'params': json.loads(row[1]), 'output_path': row[2], 'status': row[3],
+                'created_at': row[4], 'updated_at': row[5]}
+    except Exception as e:
+        print(f"错误：查询任务 {job_id} 失败：{e}") # 增加日志
+        return None
+
+
+def list_jobs(status=None):
+    """列出任务（按创建时间倒序），可按状态过滤，如 list_jobs('running') 列出可续跑的任务。"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        if status is None:
+            cursor.execute('SELECT job_id, output_path, status, created_at, updated_at FROM jobs ORDER BY created_at DESC')
+        else:
+            cursor.execute('SELECT job_id, output_path, status, created_at, updated_at FROM jobs WHERE status = ? ORDER BY created_at DESC', (status,))
+        return [{'job_id': r[0], 'output_path': r[1], 'status': r[2], 'created_at': r[3], 'updated_at': r[4]}
+                for r in cursor.fetchall()]
+    except Exception as e:
+        print(f"错误：查询任务列表失败：{e}") # 增加日志
+        return []
+
+
+def set_job_status(job_id, status):
+    """更新任务状态：running / done / cancelled / parked（有行因数据来源熔断暂存，可续跑）。"""
+    conn = get_connection()
+    try:
+        conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?', (status, time.time(), job_id))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：更新任务 {job_id} 状态失败：{e}") # 增加日志
+
+
+def load_job_rows(job_id):
+    """读取任务所有行的进度，返回 row_index -> {'barcode', 'state', 'product_name', 'image_url', 'image_filepath', 'translation'}。"""
+    rows = {}
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT row_index, barcode, state, product_name, image_url, image_filepath, translation FROM job_rows WHERE job_id = ?', (job_id,))
+        for row_index, barcode, state, product_name, image_url, image_filepath, translation in cursor.fetchall():
+            rows[row_index] = {'barcode': barcode, 'state': state, 'product_name': product_name, 'image_url': image_url,
+                               'image_filepath': image_filepath, 'translation': translation}
+    except Exception as e:
+        print(f"错误：读取任务 {job_id} 的行状态失败：{e}") # 增加日志
+    return rows
+
+
+def advance_rows(job_id, row_indices, state, **fields):
+    """
+    将若干行推进到 state，并更新 fields 中的列（product_name / image_url / image_filepath）。
+    已处于 state 或更靠后状态的行不受影响。
+    """
+    row_indices = list(row_indices)
+    if not row_indices:
+        return
+    earlier_states = JOURNAL_STATES[:JOURNAL_STATES.index(state)]
+    assignments = ''.join(f', {column} = ?' for column in fields)
+    conn = get_connection()
+    try:
+        conn.executemany(
+            f'UPDATE job_rows SET state = ?{assignments} WHERE job_id = ? AND row_index = ? '
+            f'AND state IN ({",".join("?" * len(earlier_states))})',
+            [(state, *fields.values(), job_id, row_index, *earlier_states) for row_index in row_indices])
+        conn.execute('UPDATE jobs SET updated_at = ? WHERE job_id = ?', (time.time(), job_id))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：更新任务 {job_id} 的行状态失败：{e}") # 增加日志
+
+
+def save_translation(job_id, row_index, translation):
+    """保存某一行的翻译结果（不改变行状态）。"""
+    conn = get_connection()
+    try:
+        conn.execute('UPDATE job_rows SET translation = ? WHERE job_id = ? AND row_index = ?',
+                     (translation, job_id, row_index))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：保存任务 {job_id} 第 {row_index} 行的翻译失败：{e}") # 增加日志
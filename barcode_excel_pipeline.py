@@ -0,0 +1,95 @@
+"""
+分阶段流式处理管道
+
+process_excel 原先严格分阶段执行：全部爬完 -> 重写工作簿 -> translate_excel 重新加载并翻译整表，
+翻译在整个爬取期间处于空闲状态。本模块把处理过程拆成多个阶段，阶段之间用有界队列连接：
+
+    缓存查询 -> 页面获取 -> 图片下载 -> 图片后处理 -> 写入
+                   └──────> 翻译 ──────────────────────┘
+
+- 每个阶段是一个独立并发度的 CrawlScheduler，上游处理完一个条目立即提交给下游；
+- 队列有上限，下游处理不过来时上游 submit 阻塞（背压），内存占用有界；
+- join() 按阶段添加顺序依次排空，阶段之间不能有环（下游不得向上游提交）；
+- 每个阶段统计累计处理耗时（busy_seconds），总耗时接近最慢阶段而非各阶段之和。
+
+用法:
+    pipeline = StagedPipeline()
+    pipeline.add_stage('fetch', fetch_handler, num_workers=5)
+    pipeline.add_stage('write', write_handler, num_workers=1)
+    pipeline.start()
+    pipeline.submit('fetch', item)   # handler 内部用 pipeline.submit('write', ...) 交给下游
+    pipeline.join()
+"""
+
+import threading
+import time
+from barcode_excel_scheduler import CrawlScheduler
+
+# --- 配置 ---
+DEFAULT_STAGE_QUEUE_SIZE = 50  # 每个阶段的待处理队列长度
+
+
+class StagedPipeline:
+    """由多个有界调度器串联而成的处理管道（线程安全）。"""
+
+    def __init__(self):
+        self._stages = []  # [(name, scheduler)]，按上游到下游的顺序
+        self._schedulers = {}  # name -> scheduler
+        self._busy = {}  # name -> 累计处理耗时（秒）
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, handler, num_workers=1, max_pending=DEFAULT_STAGE_QUEUE_SIZE):
+        """添加一个阶段。handler(item, thread_name) 与 CrawlScheduler 相同；阶段需按上游到下游的顺序添加。"""
+        if name in self._schedulers:
+            raise ValueError(f"阶段 {name} 已存在")
+
+        def timed_handler(item, thread_name):
+            start_time = time.time()
+            try:
+                handler(item, thread_name)
+            finally:
+                with self._lock:
+                    self._busy[name] += time.time() - start_time
+
+        scheduler = CrawlScheduler(timed_handler, num_workers=num_workers, max_pending=max_pending,
+                                   name_prefix=name)
+        self._stages.append((name, scheduler))
+        self._schedulers[name] = scheduler
+        self._busy[name] = 0.0
+        return self
+
+    def start(self):
+        """启动所有阶段的工作线程。"""
+        for _, scheduler in self._stages:
+            scheduler.start()
+        return self
+
+    def submit(self, name, item, timeout=None):
+        """
+        向指定阶段提交一个条目，队列满时阻塞（背压）。
+
+        Returns:
+            bool: 是否已入队；该阶段已取消时返回 False
+        """
+        return self._schedulers[name].submit(item, timeout=timeout)
+
+    def cancel(self, names=None):
+        """取消指定阶段（默认全部），丢弃其排队中的条目；未取消的下游阶段继续处理已提交的条目。"""
+        for name, scheduler in self._stages:
+            if (names is None or name in names) and not scheduler.cancelled:
+                scheduler.cancel()
+
+    def join(self):
+        """按上游到下游的顺序依次等待各阶段排空并停止。"""
+        for _, scheduler in self._stages:
+            scheduler.join()
+
+    def metrics(self):
+        """返回各阶段调度统计及累计处理耗时。"""
+        snapshot = {}
+        for name, scheduler in self._stages:
+            stage_metrics = scheduler.metrics()
+            with self._lock:
+                stage_metrics['busy_seconds'] = round(self._busy[name], 2)
+            snapshot[name] = stage_metrics
+        return snapshot
@@ -0,0 +1,165 @@
+"""
+按远程主机的令牌桶限速
+
+爬取线程、图片下载（download_image / download_image_with_fallback）和 DDGS 搜索各自直接访问远程主机，
+突发请求容易触发限流，限流又浪费重试。本模块为每个主机维护一个令牌桶：
+
+- 每秒补充 rate 个令牌，最多积攒 burst 个（允许的突发量）；
+- 每次对外请求前调用 throttle(url)，没有令牌时等待到有令牌为止；
+- 主机的 rate / burst 在 HOST_RATE_LIMITS 中配置，未配置的主机使用默认值；
+- RATE_LIMIT_SHARED=True 时令牌桶保存在 SQLite（RATE_LIMIT_DB）中，
+  同一台机器上的多个爬取进程共享同一份额度。
+
+用法:
+    throttle(url)             # 按 url 的主机限速
+    throttle_host('ddgs')     # 没有固定主机的调用（如 DDGS 搜索）按名称限速
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+from barcode_excel_db import get_connection
+
+# --- 配置 ---
+DEFAULT_RATE = 5.0  # 未配置主机的令牌补充速度（次/秒）
+DEFAULT_BURST = 10  # 未配置主机的突发上限（令牌数）
+HOST_RATE_LIMITS = {  # 主机 -> (rate, burst)
+    'www.barcodelookup.com': (1.0, 3),  # 页面（HTTP 和 Selenium）
+    'ddgs': (0.5, 2),  # DDGS 搜索（按名称限速）
+}
+RATE_LIMIT_SHARED = False  # True：令牌桶保存在 SQLite 中，多个进程共享额度
+RATE_LIMIT_DB = 'rate_limit.db'  # 共享模式的数据库文件
+MAX_WAIT_SLICE = 1.0  # 单次等待的最长时间（秒），之后重新检查令牌
+
+
+def host_of(url):
+    """返回 URL 的主机名（小写）；无法解析时原样返回。"""
+    try:
+        host = urlparse(url).hostname
+    except Exception:
+        host = None
+    return (host or str(url)).lower()
+
+
+class TokenBucket:
+    """进程内令牌桶（线程安全）。"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        尝试取一个令牌。
+
+        Returns:
+            float: 0 表示已取得；否则为需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class SqliteTokenBucket:
+    """保存在 SQLite 中的令牌桶，多个进程共享（每次取令牌是一个 IMMEDIATE 事务）。"""
+
+    def __init__(self, host, rate, burst, db_path=RATE_LIMIT_DB):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.db_path = db_path
+        conn = get_connection(db_path)
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_buckets (host TEXT PRIMARY KEY, tokens REAL, updated_at REAL)')
+        conn.commit()
+
+    def try_acquire(self):
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')  # 取得写锁，读-改-写不会与其他进程交错
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE host = ?', (self.host,)).fetchone()
+            now = time.time()
+            tokens = float(self.burst) if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (host, tokens, updated_at) VALUES (?, ?, ?)',
+                         (self.host, tokens, now))
+            conn.commit()
+            return wait
+        except Exception as e:
+            conn.rollback()
+            print(f"限速：读取共享令牌桶 {self.host} 失败，本次不限速：{e}")  # 增加日志
+            return 0.0
+
+
+class HostRateLimiter:
+    """按主机分配令牌桶，所有对外请求共用（线程安全）。"""
+
+    def __init__(self, shared=RATE_LIMIT_SHARED, limits=None, default_rate=DEFAULT_RATE,
+                 default_burst=DEFAULT_BURST):
+        self.shared = shared
+        self.limits = HOST_RATE_LIMITS if limits is None else limits
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self._buckets = {}  # host -> 令牌桶
+        self._lock = threading.Lock()
+        self._stats = {}  # host -> {'requests', 'throttled', 'waited_seconds'}
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate, burst = self.limits.get(host, (self.default_rate, self.default_burst))
+                bucket = SqliteTokenBucket(host, rate, burst) if self.shared else TokenBucket(rate, burst)
+                self._buckets[host] = bucket
+                self._stats[host] = {'requests': 0, 'throttled': 0, 'waited_seconds': 0.0}
+            return bucket
+
+    def acquire(self, host):
+        """等待直到 host 有可用令牌，返回等待的秒数。"""
+        bucket = self._bucket(host)
+        waited = 0.0
+        while True:
+            wait = bucket.try_acquire()
+            if wait <= 0:
+                break
+            wait = min(wait, MAX_WAIT_SLICE)
+            time.sleep(wait)
+            waited += wait
+        with self._lock:
+            stats = self._stats[host]
+            stats['requests'] += 1
+            if waited:
+                stats['throttled'] += 1
+                stats['waited_seconds'] += waited
+        return waited
+
+    def metrics(self):
+        """返回各主机的请求数、被限速次数和累计等待时间。"""
+        with self._lock:
+            return {host: dict(stats, waited_seconds=round(stats['waited_seconds'], 2))
+                    for host, stats in self._stats.items()}
+
+
+# 进程级限速器，所有对外请求共用
+host_limiter = HostRateLimiter()
+
+
+def throttle(url):
+    """按 url 的主机取令牌（必要时等待），返回等待的秒数。"""
+    return host_limiter.acquire(host_of(url))
+
+
+def throttle_host(host):
+    """按主机名（或 'ddgs' 等名称）取令牌，返回等待的秒数。"""
+    return host_limiter.acquire(host.lower())
@@ -0,0 +1,174 @@
+"""
+失败条码的后台重新检索（负缓存重验证）
+
+"Not Found And No Search" 等失败记录不再被永久跳过：每种失败状态有各自的 TTL，
+每多失败一次 TTL 翻倍（见 barcode_excel_db.NEGATIVE_CACHE_TTL）。前台任务遇到已过期的记录时直接重新爬取；
+本模块的 RevalidationRunner 则在没有前台任务、爬取能力空闲时，以单线程低速逐个重新检索过期的失败记录。
+
+- 前台任务（process_excel）通过 foreground_activity 登记，有任务运行时重验证立即暂停，
+  最多只有一个正在处理的条码会与新任务重叠；
+- 前台任务结束后需空闲 REVALIDATE_IDLE_SECONDS 秒才恢复；
+- 重新检索成功则记录变为有效数据，失败则 attempts 加一、TTL 随之增长。
+
+用法:
+    revalidation_runner = RevalidationRunner(crawl_barcode_shared)
+    revalidation_runner.start()
+
+    @foreground_activity.track
+    def process_excel(...): ...
+"""
+
+import functools
+import threading
+import time
+from barcode_excel_db import init_database, get_expired_negatives, NEGATIVE_CACHE_TTL
+
+# --- 配置 ---
+REVALIDATE_IDLE_SECONDS = 120  # 前台任务结束后空闲多久才开始重新检索（秒）
+REVALIDATE_POLL_INTERVAL = 60  # 前台繁忙或没有过期记录时的检查间隔（秒）
+REVALIDATE_BATCH_SIZE = 20  # 每次从数据库取出的过期记录数量
+REVALIDATE_PAUSE_SECONDS = 2  # 两个条码之间的间隔（秒），保持低速
+REVALIDATE_RETRY_DEFER = min(NEGATIVE_CACHE_TTL.values())  # 检索后记录未更新（如未知错误）时，推迟多久再试（秒）
+
+
+class ForegroundActivity:
+    """前台任务计数（线程安全），用于判断爬取能力是否空闲。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_finished = time.time()  # 进程启动也算作一次“刚结束”，启动后先空闲一段时间
+
+    def __enter__(self):
+        with self._lock:
+            self._active += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._lock:
+            self._active -= 1
+            self._last_finished = time.time()
+        return False
+
+    def track(self, func):
+        """装饰器：函数执行期间登记为前台任务。"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+    @property
+    def active(self):
+        with self._lock:
+            return self._active
+
+    def idle_seconds(self):
+        """已空闲的秒数；有前台任务运行时为 0。"""
+        with self._lock:
+            if self._active:
+                return 0.0
+            return time.time() - self._last_finished
+
+
+# 进程级前台任务登记
+foreground_activity = ForegroundActivity()
+
+
+class RevalidationRunner:
+    """单线程后台重验证：前台空闲时逐个重新检索负缓存已过期的失败条码。"""
+
+    def __init__(self, crawl, activity=foreground_activity, idle_seconds=REVALIDATE_IDLE_SECONDS,
+                 poll_interval=REVALIDATE_POLL_INTERVAL, batch_size=REVALIDATE_BATCH_SIZE,
+                 pause_seconds=REVALIDATE_PAUSE_SECONDS):
+        self.crawl = crawl  # crawl(barcode, thread_name)，如 backend.crawl_barcode_shared
+        self.activity = activity
+        self.idle_seconds = idle_seconds
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._deferred = {}  # barcode -> 下次允许重试的时间
+        self._stats = {'attempted': 0, 'recovered': 0, 'failed': 0, 'paused': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def start(self):
+        """启动后台线程（可重复调用，只启动一次）。"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="Revalidate", daemon=True)
+            self._thread.start()
+        print("重验证：后台重新检索已启动。")  # 增加日志
+        return self
+
+    def stop(self, timeout=None):
+        """停止后台线程；正在处理的条码完成后退出。"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _idle(self):
+        return self.activity.idle_seconds() >= self.idle_seconds
+
+    def _run(self):
+        init_database()
+        while not self._stop.is_set():
+            if not self._idle():
+                self._stop.wait(self.poll_interval)
+                continue
+            now = time.time()
+            self._deferred = {barcode: retry_at for barcode, retry_at in self._deferred.items() if retry_at > now}
+            batch = [product for product in get_expired_negatives(self.batch_size + len(self._deferred), now)
+                     if self._deferred.get(product['barcode'], 0) <= now][:self.batch_size]
+            if not batch:
+                self._stop.wait(self.poll_interval)
+                continue
+            print(f"重验证：前台空闲，重新检索 {len(batch)} 个过期的失败条码。")  # 增加日志
+            for product in batch:
+                if self._stop.is_set():
+                    return
+                if not self._idle():
+                    self._count('paused')
+                    print("重验证：前台任务开始，暂停重新检索。")  # 增加日志
+                    break
+                self._revalidate(product)
+                self._stop.wait(self.pause_seconds)
+
+    def _revalidate(self, product):
+        barcode = product['barcode']
+        self._count('attempted')
+        print(f"重验证：重新检索条码 {barcode}（{product['status']}，已失败 {product['attempts']} 次）。")  # 增加日志
+        try:
+            result = self.crawl(barcode, "Revalidate")
+        except Exception as e:
+            print(f"重验证：条码 {barcode} 重新检索出错：{e}")  # 增加日志
+            result = None
+        if result:
+            self._count('recovered')
+            self._deferred.pop(barcode, None)
+            print(f"重验证：条码 {barcode} 重新检索成功。")  # 增加日志
+        else:
+            # 失败时爬取逻辑已写回新的失败标记（attempts 加一、TTL 增长）；
+            # 若记录未被更新（未知错误），避免下一轮立刻再次选中它
+            self._count('failed')
+            self._deferred[barcode] = time.time() + REVALIDATE_RETRY_DEFER
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def metrics(self):
+        """返回重验证统计的快照。"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update({'running': self.running, 'foreground_jobs': self.activity.active,
+                         'deferred': len(self._deferred)})
+        return snapshot
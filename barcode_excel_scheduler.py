@@ -0,0 +1,143 @@
+"""
+有界工作线程调度器
+
+替代“每个条码一个线程 + time.sleep(0.1) 轮询活动线程列表”的做法：
+固定数量的常驻工作线程从有界队列中取任务执行。
+
+- 队列有上限，submit 在队列满时阻塞（背压），不会无限创建线程对象；
+- cancel() 停止接收新任务并丢弃尚未开始的任务，正在执行的任务完成后线程退出；
+- 每个任务（如 (barcode, row_index)）交给 handler(item, thread_name) 处理，
+  单个任务的异常只记录日志，不会导致工作线程退出。
+
+用法:
+    with CrawlScheduler(handler, num_workers=5) as scheduler:
+        for item in items:
+            scheduler.submit(item)
+    # 退出 with 时等待所有已提交任务完成
+"""
+
+import threading
+from queue import Queue, Empty, Full
+
+# --- 配置 ---
+DEFAULT_WORKERS = 5  # 默认工作线程数
+QUEUE_SIZE_PER_WORKER = 2  # 每个工作线程对应的待处理队列长度
+_STOP = object()  # 通知工作线程退出的哨兵
+
+
+class CrawlScheduler:
+    """固定工作线程数 + 有界队列的任务调度器（线程安全）。"""
+
+    def __init__(self, handler, num_workers=DEFAULT_WORKERS, max_pending=None, name_prefix="Thread"):
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers))
+        self.name_prefix = name_prefix
+        self._queue = Queue(maxsize=max_pending or self.num_workers * QUEUE_SIZE_PER_WORKER)
+        self._cancelled = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def start(self):
+        """启动工作线程（可重复调用，只启动一次）。"""
+        if self._workers:
+            return self
+        for i in range(self.num_workers):
+            thread_name = f"{self.name_prefix}-{i + 1}"
+            worker = threading.Thread(target=self._run, args=(thread_name,), name=thread_name, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+        return self
+
+    def _run(self, thread_name):
+        """工作线程主循环：取任务、执行，直到收到退出哨兵。"""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if self._cancelled.is_set():
+                    self._count('cancelled')
+                    continue
+                try:
+                    self.handler(item, thread_name)
+                    self._count('completed')
+                except Exception as e:
+                    self._count('failed')
+                    print(f"调度器：线程 {thread_name} 处理任务 {item} 时发生错误：{e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, item, timeout=None):
+        """
+        提交一个任务。队列满时阻塞等待（背压）。
+
+        Returns:
+            bool: 任务是否已入队；调度器已取消或等待超时则返回 False
+        """
+        if not self._workers:
+            self.start()
+        waited = 0.0
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                self._count('submitted')
+                return True
+            except Full:
+                waited += 0.5
+                if timeout is not None and waited >= timeout:
+                    return False
+        return False
+
+    def cancel(self):
+        """优雅取消：不再接收新任务，丢弃排队中的任务，正在执行的任务继续完成。"""
+        self._cancelled.set()
+        dropped = 0
+        stops = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is _STOP:
+                stops += 1  # join() 已发出的退出哨兵，稍后放回
+            else:
+                dropped += 1
+            self._queue.task_done()
+        # 放回退出哨兵，否则与 cancel() 并发的 join() 会一直等待工作线程退出
+        for _ in range(stops):
+            self._queue.put(_STOP)
+        self._count('cancelled', dropped)
+        print(f"调度器：已取消，丢弃 {dropped} 个未开始的任务。")
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def join(self):
+        """等待所有已提交任务完成并停止工作线程。"""
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def metrics(self):
+        """返回调度统计的快照。"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update({'workers': self.num_workers, 'pending': self._queue.qsize()})
+        return snapshot
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.cancel()
+        self.join()
+        return False
@@ -0,0 +1,109 @@
+"""
+DDGS 图片搜索结果缓存（SQLite，带 TTL）
+
+search_product_images 每次回退都会请求 DDGS，包括图片处理失败后的重跑和负缓存过期后的重新验证。
+本模块把每个 EAN 的原始搜索结果（图片URL、缩略图、标题、尺寸等，JSON）保存在 ddgs_search_cache 表中：
+
+- 有结果的搜索保存 DDGS_SEARCH_TTL 秒，没有结果的保存 DDGS_EMPTY_SEARCH_TTL 秒；
+- 过期或请求的结果数多于缓存时保存的数量时视为未命中，重新搜索；
+- cache_only=True 时只读缓存（未命中返回 None，不访问网络），可用于离线重放图片选择。
+
+用法:
+    results = get_cached_search(ean, max_results)    # 未命中返回 None
+    save_search(ean, max_results, results)
+"""
+
+import json
+import threading
+import time
+from barcode_excel_db import get_connection
+
+# --- 配置 ---
+DDGS_SEARCH_TTL = 30 * 24 * 3600  # 有结果的搜索缓存时间（秒）
+DDGS_EMPTY_SEARCH_TTL = 6 * 3600  # 没有结果的搜索缓存时间（秒），不超过最短的负缓存 TTL，重新验证时会再次搜索
+DDGS_SEARCH_CACHE_ENABLED = True  # 是否使用搜索缓存
+DDGS_SEARCH_CACHE_ONLY = False  # True：只读缓存，不访问 DDGS（离线重放）
+
+_initialized = False
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def init_search_cache():
+    """创建搜索缓存表（如果不存在）。"""
+    global _initialized
+    conn = get_connection()
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ddgs_search_cache (
+                ean TEXT PRIMARY KEY,
+                max_results INTEGER,
+                results TEXT,
+                fetched_at REAL
+            )
+        ''')
+        conn.commit()
+        _initialized = True
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：DDGS搜索缓存初始化失败：{e}") # 增加日志
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def get_cached_search(ean, max_results, ignore_ttl=False):
+    """
+    读取缓存的搜索结果。
+
+    Args:
+        ignore_ttl (bool): 忽略过期时间（只读缓存模式下使用）
+
+    Returns:
+        list: 搜索结果（可能为空列表）；未命中、已过期或缓存的结果数不足时返回 None
+    """
+    if not _initialized:
+        init_search_cache()
+    try:
+        row = get_connection().execute('SELECT max_results, results, fetched_at FROM ddgs_search_cache WHERE ean = ?',
+                                       (ean,)).fetchone()
+    except Exception as e:
+        print(f"错误：读取EAN {ean} 的DDGS搜索缓存失败：{e}") # 增加日志
+        return None
+    if row is None:
+        _record('misses')
+        return None
+    cached_max_results, results_json, fetched_at = row
+    results = json.loads(results_json)
+    # 缓存时请求的数量较少且结果已满时，可能还有更多结果
+    if max_results > cached_max_results and len(results) >= cached_max_results:
+        _record('misses')
+        return None
+    ttl = DDGS_SEARCH_TTL if results else DDGS_EMPTY_SEARCH_TTL
+    if not ignore_ttl and time.time() - fetched_at > ttl:
+        _record('misses')
+        return None
+    _record('hits')
+    return results[:max_results]
+
+
+def save_search(ean, max_results, results):
+    """保存一次搜索的原始结果。"""
+    if not _initialized:
+        init_search_cache()
+    conn = get_connection()
+    try:
+        conn.execute('INSERT OR REPLACE INTO ddgs_search_cache (ean, max_results, results, fetched_at) VALUES (?, ?, ?, ?)',
+                     (ean, max_results, json.dumps(results, ensure_ascii=False), time.time()))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：保存EAN {ean} 的DDGS搜索缓存失败：{e}") # 增加日志
+
+
+def search_cache_metrics():
+    """搜索缓存的命中和未命中次数。"""
+    with _stats_lock:
+        return dict(_stats)
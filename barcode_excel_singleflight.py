@@ -0,0 +1,116 @@
+"""
+条码单飞（single-flight）去重
+
+供应商表格中同一个EAN经常出现在多行，多个 /upload 任务也可能同时处理同一个条码。
+本模块按规范化后的条码维护一个进程级“进行中”登记表：
+
+- 同一条码同时只有一个线程（leader）真正执行爬取；
+- 其他线程（follower）阻塞等待并直接共享 leader 的结果；
+- 结果在完成后保留 keep_seconds 秒，覆盖“批量查询缓存之后、其他任务刚刚爬完”的窗口。
+
+用法:
+    result, shared = barcode_inflight.do(normalize_barcode(barcode), lambda: crawl(barcode))
+"""
+
+import threading
+import time
+
+# --- 配置 ---
+RECENT_RESULT_SECONDS = 60  # 已完成结果的保留时间（秒）
+
+
+def normalize_barcode(barcode):
+    """
+    规范化条码字符串：去除空白，修复Excel数值单元格产生的 "3346130022886.0"
+    和科学计数法 "3.34613002289e+12" 形式。
+    """
+    text = str(barcode).strip().replace(' ', '')
+    if text.endswith('.0') and text[:-2].isdigit():
+        return text[:-2]
+    if 'e+' in text.lower():
+        try:
+            return str(int(float(text)))
+        except ValueError:
+            return text
+    return text
+
+
+class _Call:
+    """一次进行中的调用。"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight:
+    """按键合并并发调用（线程安全）。"""
+
+    def __init__(self, keep_seconds=RECENT_RESULT_SECONDS):
+        self.keep_seconds = keep_seconds
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+        self._last_prune = 0.0
+        self._stats = {'leaders': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        """
+        执行 fn()，同一 key 的并发调用只执行一次。
+
+        Returns:
+            tuple: (result, shared)，shared 为 True 表示结果来自其他线程的调用
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.finished_at is not None \
+                    and time.time() - call.finished_at > self.keep_seconds:
+                call = None  # 保留的结果已过期
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self._stats['leaders'] += 1
+            else:
+                leader = False
+                self._stats['shared'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._calls.pop(key, None)  # 失败的调用不保留，下次重新执行
+            raise
+        finally:
+            call.finished_at = time.time()
+            call.done.set()
+            self._prune()
+        return call.result, False
+
+    def _prune(self):
+        """清理过期的已完成调用（最多每秒一次）。"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < 1:
+                return
+            self._last_prune = now
+            expired = [key for key, call in self._calls.items()
+                       if call.finished_at is not None and now - call.finished_at > self.keep_seconds]
+            for key in expired:
+                del self._calls[key]
+
+    def metrics(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['in_flight'] = sum(1 for call in self._calls.values() if call.finished_at is None)
+        return snapshot
+
+
+# 进程级共享登记表，跨线程、跨 /upload 任务生效
+barcode_inflight = SingleFlight()
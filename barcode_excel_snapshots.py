@@ -0,0 +1,269 @@
+"""
+抓取页面的压缩快照库（离线重新解析）
+
+barcodelookup 改版后，写死的 PRODUCT_NAME_XPATH / IMAGE_XPATH 会失效，受影响的条码只能重新爬取。
+本模块把每次获取到的产品页面 HTML 压缩保存下来：
+
+- 页面内容按 SHA-256 内容寻址保存在 SNAPSHOT_DIR/objects/ab/<sha256>.html.zst（或 .gz）中，
+  内容相同的页面只存一份；有 zstandard 时用 zstd 压缩，否则用 gzip；
+- 索引表 page_snapshots 按 (barcode, fetched_at) 记录每次获取的来源、URL、解析状态和内容哈希；
+- reextract 命令用新的 XPath 重新解析已保存的页面（只占用 CPU，不访问网络），
+  也可以用 --field 提取新的字段。
+
+用法:
+    python barcode_excel_snapshots.py stats
+    python barcode_excel_snapshots.py reextract --name-xpath '//h4' --image-xpath '//img[@id="x"]' \\
+        --field brand='//span[@class="brand"]' --output reextract_results.csv [--update-db]
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import os
+import time
+from barcode_excel_db import get_connection
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，没有时使用 gzip
+    zstandard = None
+
+# --- 配置 ---
+SNAPSHOT_DIR = 'page_snapshots'  # 快照根目录
+SNAPSHOTS_ENABLED = True  # 是否保存抓取到的页面
+ZSTD_LEVEL = 10  # zstd 压缩级别
+GZIP_LEVEL = 6  # gzip 压缩级别
+_SUFFIX = {'zstd': '.html.zst', 'gzip': '.html.gz'}
+
+_initialized = False
+
+
+def init_snapshots():
+    """创建快照索引表（如果不存在）。"""
+    global _initialized
+    conn = get_connection()
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS page_snapshots (
+                barcode TEXT,
+                fetched_at REAL,
+                source TEXT,
+                url TEXT,
+                status TEXT,
+                sha256 TEXT,
+                compression TEXT,
+                PRIMARY KEY (barcode, fetched_at)
+            )
+        ''')
+        conn.commit()
+        _initialized = True
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：快照索引初始化失败：{e}") # 增加日志
+
+
+def _object_path(sha256, compression):
+    return os.path.join(SNAPSHOT_DIR, 'objects', sha256[:2], sha256 + _SUFFIX[compression])
+
+
+def _compress(data):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return 'gzip', gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _decompress(blob, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 快照需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+def save_snapshot(barcode, page_html, source, url=None, status=None):
+    """
+    压缩保存一次抓取到的页面并登记索引。内容已存在时只登记索引。
+
+    Args:
+        source: 'http' 或 'selenium'
+        status: 解析结果（ok / not_found / unusable ...）
+
+    Returns:
+        str: 内容的 SHA-256；未保存时返回 None
+    """
+    if not SNAPSHOTS_ENABLED or not page_html:
+        return None
+    if not _initialized:
+        init_snapshots()
+    try:
+        data = page_html.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        compression = 'zstd' if zstandard is not None else 'gzip'
+        path = _object_path(sha256, compression)
+        if not os.path.exists(path):
+            compression, blob = _compress(data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(temp_path, path)  # 原子替换，并发写入同一内容也不会产生残缺文件
+        conn = get_connection()
+        conn.execute('INSERT OR REPLACE INTO page_snapshots (barcode, fetched_at, source, url, status, sha256, compression) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?)', (barcode, time.time(), source, url, status, sha256, compression))
+        conn.commit()
+        return sha256
+    except Exception as e:
+        print(f"错误：保存条码 {barcode} 的页面快照失败：{e}") # 增加日志
+        return None
+
+
+def load_snapshot(sha256, compression):
+    """读取并解压一个快照，返回 HTML 字符串。"""
+    with open(_object_path(sha256, compression), 'rb') as f:
+        return _decompress(f.read(), compression).decode('utf-8')
+
+
+def latest_snapshots(barcodes=None):
+    """
+    每个条码最近一次的快照索引。
+
+    Returns:
+        list: [{'barcode', 'fetched_at', 'source', 'url', 'status', 'sha256', 'compression'}]，按条码排序
+    """
+    if not _initialized:
+        init_snapshots()
+    cursor = get_connection().cursor()
+    # SQLite 中与 MAX() 同行的其他列取自取得最大值的那一行
+    cursor.execute('SELECT barcode, MAX(fetched_at), source, url, status, sha256, compression '
+                   'FROM page_snapshots GROUP BY barcode ORDER BY barcode')
+    wanted = set(barcodes) if barcodes else None
+    keys = ('barcode', 'fetched_at', 'source', 'url', 'status', 'sha256', 'compression')
+    return [dict(zip(keys, row)) for row in cursor.fetchall() if wanted is None or row[0] in wanted]
+
+
+def extract_fields(page_html, fields):
+    """
+    用 XPath 从页面中提取额外字段。
+
+    Args:
+        fields (dict): 字段名 -> XPath；结果取第一个节点的文本（或属性值）
+
+    Returns:
+        dict: 字段名 -> 字符串或 None
+    """
+    from lxml import html as lxml_html
+    tree = lxml_html.fromstring(page_html)
+    values = {}
+    for name, xpath in fields.items():
+        nodes = tree.xpath(xpath)
+        if not nodes:
+            values[name] = None
+        elif isinstance(nodes[0], str):
+            values[name] = nodes[0].strip()  # 属性或 text() 结果
+        else:
+            values[name] = ' '.join(nodes[0].text_content().split())
+    return values
+
+
+def reextract(name_xpath, image_xpath, fields=None, barcodes=None, output_path=None, update_db=False):
+    """
+    用新的 XPath 重新解析每个条码最近一次的快照，不访问网络。
+
+    Args:
+        fields (dict): 额外提取的字段（字段名 -> XPath）
+        output_path (str): 结果 CSV 路径；None 时不写文件
+        update_db (bool): 将解析成功的产品名称和图片URL写回 products 表，fetched_at 为快照的获取时间；
+                          图片URL未变时保留已有图片文件，变化时清空图片路径，下次处理该条码时重新获取
+
+    Returns:
+        list: [{'barcode', 'status', 'product_name', 'image_url', ...额外字段}]
+    """
+    from barcode_excel_fetcher import parse_product_page
+    fields = fields or {}
+    snapshots = latest_snapshots(barcodes)
+    print(f"重新解析：共 {len(snapshots)} 个条码的快照。") # 增加日志
+    start_time = time.time()
+    results = []
+    for snapshot in snapshots:
+        try:
+            page_html = load_snapshot(snapshot['sha256'], snapshot['compression'])
+        except Exception as e:
+            print(f"错误：读取条码 {snapshot['barcode']} 的快照失败：{e}") # 增加日志
+            continue
+        parsed = parse_product_page(page_html, name_xpath, image_xpath)
+        result = {'barcode': snapshot['barcode'], 'fetched_at': snapshot['fetched_at'], 'status': parsed['status'],
+                  'product_name': parsed['product_name'], 'image_url': parsed['image_url']}
+        if fields:
+            result.update(extract_fields(page_html, fields))
+        results.append(result)
+    elapsed = time.time() - start_time
+    ok_results = [result for result in results if result['status'] == 'ok']
+    print(f"重新解析完成：{len(results)} 个页面，成功 {len(ok_results)} 个，耗时 {elapsed:.2f} 秒"
+          f"（{len(results) / elapsed if elapsed else 0:.0f} 页/秒）。") # 增加日志
+    if output_path:
+        with open(output_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=['barcode', 'fetched_at', 'status', 'product_name', 'image_url', *fields])
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"重新解析结果已保存到: {output_path}") # 增加日志
+    if update_db and ok_results:
+        from barcode_excel_db import get_products_from_db, insert_product_to_db, product_writer, SOURCE_BARCODELOOKUP
+        existing = get_products_from_db([result['barcode'] for result in ok_results])
+        changed_images = 0
+        for result in ok_results:
+            product = existing.get(result['barcode']) or {}
+            image_filepath = product.get('image_filepath')
+            error = None
+            if product.get('image_url') != result['image_url']:
+                image_filepath = None  # 已有图片文件来自旧的图片URL，不能与新URL对应
+                error = "重新解析后图片URL已变化，需要重新下载图片"
+                changed_images += 1
+            insert_product_to_db(result['barcode'], result['product_name'], result['image_url'], image_filepath,
+                                 source=SOURCE_BARCODELOOKUP, error=error, fetched_at=result['fetched_at'])
+        product_writer.flush()
+        print(f"已将 {len(ok_results)} 条重新解析的结果写回数据库，其中 {changed_images} 条图片URL已变化，"
+              f"需要重新下载图片。") # 增加日志
+    return results
+
+
+def snapshot_stats():
+    """快照数量、条码数和压缩后占用的磁盘空间。"""
+    if not _initialized:
+        init_snapshots()
+    cursor = get_connection().cursor()
+    cursor.execute('SELECT COUNT(*), COUNT(DISTINCT barcode), COUNT(DISTINCT sha256) FROM page_snapshots')
+    snapshots, barcodes, objects = cursor.fetchone()
+    total_bytes = 0
+    for root, _, files in os.walk(os.path.join(SNAPSHOT_DIR, 'objects')):
+        total_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return {'snapshots': snapshots, 'barcodes': barcodes, 'objects': objects,
+            'compressed_mb': round(total_bytes / 1024 / 1024, 2)}
+
+
+def _parse_field(text):
+    name, _, xpath = text.partition('=')
+    if not name or not xpath:
+        raise argparse.ArgumentTypeError(f"字段格式应为 名称=XPath：{text}")
+    return name, xpath
+
+
+if __name__ == "__main__":
+    from barcode_excel_fetcher import PRODUCT_NAME_XPATH, IMAGE_XPATH
+    parser = argparse.ArgumentParser(description="页面快照库：统计与离线重新解析")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="显示快照统计")
+    reextract_parser = subparsers.add_parser('reextract', help="用新的 XPath 重新解析已保存的页面")
+    reextract_parser.add_argument('--name-xpath', default=PRODUCT_NAME_XPATH, help="产品名称 XPath")
+    reextract_parser.add_argument('--image-xpath', default=IMAGE_XPATH, help="产品图片 XPath")
+    reextract_parser.add_argument('--field', action='append', type=_parse_field, default=[],
+                                  help="额外字段，格式 名称=XPath，可重复")
+    reextract_parser.add_argument('--barcode', action='append', help="只解析指定条码，可重复")
+    reextract_parser.add_argument('--output', default='reextract_results.csv', help="结果 CSV 路径")
+    reextract_parser.add_argument('--update-db', action='store_true', help="将解析成功的结果写回数据库")
+    args = parser.parse_args()
+    if args.command == 'stats':
+        print(snapshot_stats())
+    else:
+        reextract(args.name_xpath, args.image_xpath, fields=dict(args.field), barcodes=args.barcode,
+                  output_path=args.output, update_db=args.update_db)
@@ -0,0 +1,100 @@
+"""
+barcode_cache.db 连接方式基准测试
+
+对比两种访问方式在多线程下的查询/写入吞吐：
+- before: 每次调用新建连接、默认 rollback journal、逐行提交后关闭（原 barcode_excel_db 的做法）
+- after:  barcode_excel_db 当前实现（每线程持久连接、WAL、synchronous=NORMAL、busy_timeout、mmap，
+          写入经写入队列批量提交，计时包含等待全部提交完成）
+
+在临时目录中的独立数据库上运行，不影响真实缓存:
+    python db_benchmark.py [线程数] [每线程操作数]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import barcode_excel_db
+
+
+def legacy_get_product(db_path, barcode):
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT product_name, image_url, image_filepath FROM products WHERE barcode = ?', (barcode,))
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+def legacy_insert_product(db_path, barcode, product_name, image_url, image_filepath):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('INSERT OR REPLACE INTO products (barcode, product_name, image_url, image_filepath) VALUES (?, ?, ?, ?)',
+                     (barcode, product_name, image_url, image_filepath))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_threads(num_threads, ops_per_thread, operation, finish=None):
+    """
+    num_threads 个线程各执行 ops_per_thread 次 operation(thread_index, i)，返回每秒操作数。
+    finish 在所有线程结束后调用并计入耗时（如等待写入队列提交）。
+    """
+    def worker(thread_index):
+        for i in range(ops_per_thread):
+            operation(thread_index, i)
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(num_threads)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if finish is not None:
+        finish()
+    return num_threads * ops_per_thread / (time.time() - start_time)
+
+
+def benchmark(label, get_product, insert_product, num_threads, ops_per_thread, flush=None):
+    seed_count = num_threads * ops_per_thread
+    for i in range(seed_count):
+        insert_product(f"seed{i}", f"Product {i}", f"https://example.com/{i}.jpg", f"downloaded_images/seed{i}.jpg")
+    if flush is not None:
+        flush()
+    lookups = run_threads(num_threads, ops_per_thread,
+                          lambda t, i: get_product(f"seed{(t * ops_per_thread + i) % seed_count}"))
+    inserts = run_threads(num_threads, ops_per_thread,
+                          lambda t, i: insert_product(f"new{t}_{i}", f"Product {t}_{i}", None, None), finish=flush)
+    print(f"{label:<8} 查询: {lookups:>10.0f} 次/秒    写入: {inserts:>10.0f} 次/秒")
+    return lookups, inserts
+
+
+if __name__ == "__main__":
+    num_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    ops_per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"线程数: {num_threads}，每线程操作数: {ops_per_thread}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # before：原始做法
+        legacy_db = os.path.join(tmp_dir, 'legacy.db')
+        barcode_excel_db.DATABASE_NAME = legacy_db
+        conn = sqlite3.connect(legacy_db)
+        conn.execute('CREATE TABLE products (barcode TEXT PRIMARY KEY, product_name TEXT, image_url TEXT, image_filepath TEXT)')
+        conn.commit()
+        conn.close()
+        before = benchmark("before",
+                           lambda barcode: legacy_get_product(legacy_db, barcode),
+                           lambda *row: legacy_insert_product(legacy_db, *row),
+                           num_threads, ops_per_thread)
+
+        # after：barcode_excel_db 当前实现（关闭日志输出以免影响计时）
+        barcode_excel_db.DATABASE_NAME = os.path.join(tmp_dir, 'pooled.db')
+        barcode_excel_db.print = lambda *args, **kwargs: None
+        barcode_excel_db.init_database()
+        after = benchmark("after", barcode_excel_db.get_product_from_db, barcode_excel_db.insert_product_to_db,
+                          num_threads, ops_per_thread, flush=barcode_excel_db.product_writer.flush)
+        barcode_excel_db.product_writer.close()
+        barcode_excel_db.close_connections()
+    print(f"提升: 查询 {after[0] / before[0]:.1f} 倍，写入 {after[1] / before[1]:.1f} 倍")
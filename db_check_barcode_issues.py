@@ -5,12 +5,12 @@
 check_barcode_issues.py - 检查barcode_cache.db数据库中的条码数据问题
 """
 
-import sqlite3
+from barcode_excel_db import connect
 import re
 
 def check_barcode_issues():
     """检查条码数据问题"""
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     # 获取所有条码
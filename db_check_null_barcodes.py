@@ -5,11 +5,11 @@
 check_null_barcodes.py - 检查数据库中的空条码记录
 """
 
-import sqlite3
+from barcode_excel_db import connect
 
 def check_null_barcodes():
     """检查数据库中的空条码记录"""
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     # 统计空条码记录
@@ -10,12 +10,12 @@ clean_invalid_barcodes.py - 清理无效条码格式工具
 3. 帮助解决导出到Excel时的重复问题
 """
 
-import sqlite3
+from barcode_excel_db import connect
 import re
 
 def get_invalid_barcodes():
     """获取所有无效条码记录"""
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     # 查找无效的条码格式（非纯数字）
@@ -89,7 +89,7 @@ def fix_invalid_barcodes():
 
 def clean_barcode_format_option(records):
     """自动清理条码格式"""
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     updated_count = 0
@@ -133,7 +133,7 @@ def clean_barcode_format_option(records):
 
 def delete_invalid_records(records):
     """删除所有无效记录"""
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     try:
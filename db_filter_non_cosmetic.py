@@ -11,7 +11,7 @@ db_filter_non_cosmetic.py - 过滤非美妆产品记录
 4. 更新数据库记录
 """
 
-import sqlite3
+from barcode_excel_db import connect, init_database, status_from_product_name
 import openpyxl
 import requests
 import json
@@ -274,7 +274,8 @@ def update_database(barcodes):
         print("没有需要更新的数据库记录")
         return
     
-    conn = sqlite3.connect(DATABASE_NAME)
+    init_database()  # 确保表结构已迁移（status 列）
+    conn = connect(DATABASE_NAME)
     cursor = conn.cursor()
     
     updated_count = 0
@@ -282,8 +283,8 @@ def update_database(barcodes):
     try:
         for barcode, status in barcodes:
             cursor.execute(
-                'UPDATE products SET product_name = ? WHERE barcode = ?',
-                (status, barcode)
+                'UPDATE products SET product_name = ?, status = ? WHERE barcode = ?',
+                (status, status_from_product_name(status), barcode)
             )
             if cursor.rowcount > 0:
                 updated_count += 1
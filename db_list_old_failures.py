@@ -10,7 +10,7 @@ db_list_old_failures.py - 列出需要重新检索的旧失败记录
 3. 提供批量重置选项，将这些记录标记为待重新检索
 """
 
-import sqlite3
+from barcode_excel_db import connect, init_database, get_products_by_status, RETRYABLE_STATUSES
 import json
 from datetime import datetime
 import openpyxl
@@ -20,19 +20,11 @@ DATABASE_NAME = 'barcode_cache.db'
 
 def get_old_failure_records():
     """获取所有旧的失败记录（N/A 和 Not Found）"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    # 查找 product_name 为 "N/A" 或 "Not Found" 的记录
-    cursor.execute('''
-        SELECT barcode, product_name, image_url, image_filepath
-        FROM products 
-        WHERE product_name IN ('N/A', 'Not Found')
-        ORDER BY product_name, barcode
-    ''')
+    init_database()  # 确保表结构已迁移（status 列及索引）
     
-    records = cursor.fetchall()
-    conn.close()
+    # 按状态查找 "N/A" 或 "Not Found" 的记录（索引查询）
+    records = [(r['barcode'], r['product_name'], r['image_url'], r['image_filepath'])
+               for r in get_products_by_status(RETRYABLE_STATUSES)]
     
     return records
 
@@ -238,15 +230,15 @@ def delete_old_failures():
         print("操作已取消")
         return False
     
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect(DATABASE_NAME)
     cursor = conn.cursor()
     
     try:
-        # 删除 N/A 和 Not Found 记录
-        cursor.execute('''
-            DELETE FROM products 
-            WHERE product_name IN ('N/A', 'Not Found')
-        ''')
+        # 删除 N/A 和 Not Found 记录（按 status 索引定位）
+        cursor.execute(
+            f'DELETE FROM products WHERE status IN ({",".join("?" * len(RETRYABLE_STATUSES))})',
+            RETRYABLE_STATUSES
+        )
         
         deleted_count = cursor.rowcount
         conn.commit()
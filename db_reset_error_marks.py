@@ -10,7 +10,7 @@ db_reset_error_marks.py - 重置错误标记的条码记录
 3. 或者直接删除这些记录，让系统重新检索
 """
 
-import sqlite3
+from barcode_excel_db import connect, init_database, status_from_product_name
 import openpyxl
 
 DATABASE_NAME = 'barcode_cache.db'
@@ -65,7 +65,8 @@ def reset_marks_to_old(barcodes):
     "Not Found And No Search" -> "Not Found"
     "N/A And No Search" -> "N/A"
     """
-    conn = sqlite3.connect(DATABASE_NAME)
+    init_database()  # 确保表结构已迁移（status 列及索引）
+    conn = connect(DATABASE_NAME)
     cursor = conn.cursor()
     
     reset_count = 0
@@ -91,8 +92,8 @@ def reset_marks_to_old(barcodes):
                 
                 if new_mark:
                     cursor.execute(
-                        'UPDATE products SET product_name = ? WHERE barcode = ?',
-                        (new_mark, barcode)
+                        'UPDATE products SET product_name = ?, status = ? WHERE barcode = ?',
+                        (new_mark, status_from_product_name(new_mark), barcode)
                     )
                     reset_count += 1
                     print(f"重置条码 {barcode}: {current_mark} -> {new_mark}")
@@ -112,7 +113,7 @@ def delete_barcode_records(barcodes):
     """
     直接删除条码记录，让系统重新检索
     """
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = connect(DATABASE_NAME)
     cursor = conn.cursor()
     
     deleted_count = 0
@@ -25,7 +25,7 @@ python dbtoadd.py
 - 数据库结构遵循 barcode_excel_db.py 中的定义
 """
 
-import sqlite3
+from barcode_excel_db import connect
 import os
 import sys
 
@@ -63,7 +63,7 @@ def check_barcode_exists(barcode):
     """检查条码是否已存在"""
     conn = None
     try:
-        conn = sqlite3.connect('barcode_cache.db')
+        conn = connect('barcode_cache.db')
         cursor = conn.cursor()
         cursor.execute('SELECT barcode FROM products WHERE barcode = ?', (barcode,))
         result = cursor.fetchone()
@@ -104,7 +104,7 @@ def main():
         product_data['product_name'],
         product_data['image_url'],
         product_data['image_filepath']
-    )
+    ).result()  # 等待写入队列提交
     
     print("数据添加完成！")
 
@@ -16,7 +16,7 @@ python dbtocheck.py
 注意：主键（barcode字段）应该是唯一的，重复的主键会导致数据完整性问题。
 """
 
-import sqlite3
+from barcode_excel_db import connect
 import os
 
 def check_database_exists():
@@ -31,7 +31,7 @@ def check_duplicate_primary_keys():
     
     conn = None
     try:
-        conn = sqlite3.connect('barcode_cache.db')
+        conn = connect('barcode_cache.db')
         cursor = conn.cursor()
         
         # 查找重复的条码
@@ -1,11 +1,11 @@
-import sqlite3
+from barcode_excel_db import connect
 import openpyxl
 from openpyxl.utils import get_column_letter
 import os
 
 def export_db_to_excel(db_path, output_file='db_export.xlsx'):
     # 连接SQLite数据库
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     # 获取所有表名
@@ -1,4 +1,4 @@
-import sqlite3
+from barcode_excel_db import connect
 import pandas as pd
 
 def main():
@@ -6,7 +6,7 @@ def main():
     error_barcodes = pd.read_excel('db_export_filtered.xlsx').iloc[:, 0].tolist()
     
     # 连接数据库
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     # 构建删除语句
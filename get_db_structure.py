@@ -1,9 +1,9 @@
-import sqlite3
+from barcode_excel_db import connect
 import pandas as pd
 
 def main():
     # 连接数据库
-    conn = sqlite3.connect('barcode_cache.db')
+    conn = connect('barcode_cache.db')
     cursor = conn.cursor()
     
     # 获取所有表名
@@ -1,6 +1,9 @@
 import sqlite3
 import json
 import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 项目根目录
+from barcode_excel_db import connect  # 统一的数据库连接配置（WAL 等）
 
 def get_database_structure():
     """获取数据库结构并保存到JSON文件"""
@@ -14,7 +17,7 @@ def get_database_structure():
     
     try:
         # 连接数据库
-        conn = sqlite3.connect(db_path)
+        conn = connect(db_path)
         cursor = conn.cursor()
         
         # 获取所有表名
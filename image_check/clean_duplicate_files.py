@@ -2,6 +2,9 @@ import os
 import pandas as pd
 import sqlite3
 from pathlib import Path
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 项目根目录
+from barcode_excel_db import connect  # 统一的数据库连接配置（WAL 等）
 
 def clean_duplicate_files():
     """根据Excel文件中的记录删除相同文件和对应的数据库记录"""
@@ -25,7 +28,7 @@ def clean_duplicate_files():
     
     # 连接数据库
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connect(db_path)
         cursor = conn.cursor()
     except sqlite3.Error as e:
         print(f"数据库连接错误：{e}")
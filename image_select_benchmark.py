@@ -0,0 +1,124 @@
+"""
+DDGS 最佳图片选择基准测试
+
+对比两种实现在同一组候选图片上的选择结果和耗时：
+- before: 原 select_best_image 的做法（逐张 cv2.calcHist 提取特征，StandardScaler + KMeans(n_clusters=1, n_init=10)，
+          Python 循环找距离中心最近的图片）。scikit-learn 已不是运行依赖，只有本基准测试需要，
+          单独安装: pip install scikit-learn
+- after:  DDGS_ean_image_api.select_best_image_index 当前实现（批量解码、一次 bincount 计算所有直方图、向量化距离）
+
+分别统计整体耗时（含 JPEG 解码和缩放，两种实现相同）和解码之后的特征提取与选择部分的耗时。
+选择结果的一致性由 tests/test_image_select.py 固定检查（不需要 scikit-learn）。
+
+候选图片为随机生成的 JPEG（每个条码 10 张，尺寸、底色和色块随机，固定随机种子），不访问网络:
+    python image_select_benchmark.py [条码数] [每个条码的候选图片数]
+"""
+
+import sys
+import time
+import cv2
+import numpy as np
+import DDGS_ean_image_api
+
+try:
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+except ImportError:  # 开发依赖，只有 before 实现需要
+    KMeans = StandardScaler = None
+
+
+def legacy_extract_image_features(image_data):
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return legacy_resized_features(cv2.resize(img, (64, 64)))
+
+
+def legacy_resized_features(img):
+    hist_b = cv2.calcHist([img], [0], None, [8], [0, 256])
+    hist_g = cv2.calcHist([img], [1], None, [8], [0, 256])
+    hist_r = cv2.calcHist([img], [2], None, [8], [0, 256])
+    feature = np.concatenate([hist_b.flatten(), hist_g.flatten(), hist_r.flatten()])
+    feature = feature / np.sum(feature)
+    height, width = img.shape[:2]
+    return np.append(feature, [height, width, width / height])
+
+
+def legacy_select_best_image_index(image_data_list):
+    features = []
+    valid_indices = []
+    for index, data in enumerate(image_data_list):
+        feature = legacy_extract_image_features(data)
+        if feature is not None:
+            features.append(feature)
+            valid_indices.append(index)
+    if not valid_indices:
+        return None
+    if len(valid_indices) == 1:
+        return valid_indices[0]
+    return valid_indices[legacy_closest_to_center(features)]
+
+
+def legacy_closest_to_center(features):
+    X_scaled = StandardScaler().fit_transform(np.array(features))
+    kmeans = KMeans(n_clusters=1, random_state=42, n_init=10)
+    kmeans.fit(X_scaled)
+    distances = [(i, np.linalg.norm(feature - kmeans.cluster_centers_[0])) for i, feature in enumerate(X_scaled)]
+    closest_idx, _ = min(distances, key=lambda x: x[1])
+    return closest_idx
+
+
+def make_candidates(rng, count):
+    """生成 count 张随机 JPEG 候选图片，偶尔混入一段无法解码的数据。"""
+    candidates = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            candidates.append(b'not an image')
+            continue
+        height, width = int(rng.integers(200, 800)), int(rng.integers(200, 800))
+        img = np.empty((height, width, 3), np.uint8)
+        img[:] = rng.integers(0, 256, 3)
+        for _ in range(int(rng.integers(1, 6))):
+            y, x = int(rng.integers(0, height)), int(rng.integers(0, width))
+            img[y:y + int(rng.integers(20, 300)), x:x + int(rng.integers(20, 300))] = rng.integers(0, 256, 3)
+        noise = rng.integers(-3, 4, img.shape)
+        img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+        candidates.append(cv2.imencode('.jpg', img)[1].tobytes())
+    return candidates
+
+
+def benchmark(label, select, fixtures):
+    start_time = time.perf_counter()
+    choices = [select(candidates) for candidates in fixtures]
+    per_barcode = (time.perf_counter() - start_time) / len(fixtures) * 1000
+    print(f"{label:<8} 每个条码: {per_barcode:>8.3f} 毫秒")
+    return choices, per_barcode
+
+
+def compare(title, before_select, after_select, fixtures):
+    print(title)
+    before_choices, before = benchmark("before", before_select, fixtures)
+    after_choices, after = benchmark("after", after_select, fixtures)
+    mismatches = sum(1 for a, b in zip(before_choices, after_choices) if a != b)
+    print(f"选择结果不一致: {mismatches}/{len(fixtures)}    提升: {before / after:.1f} 倍")
+
+
+if __name__ == "__main__":
+    if KMeans is None:
+        sys.exit("基准测试需要 scikit-learn 运行原实现（before）: pip install scikit-learn")
+    num_barcodes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_candidates = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"条码数: {num_barcodes}，每个条码的候选图片数: {num_candidates}")
+    rng = np.random.default_rng(42)
+    fixtures = [make_candidates(rng, num_candidates) for _ in range(num_barcodes)]
+    DDGS_ean_image_api.print = lambda *args, **kwargs: None  # 关闭日志输出以免影响计时
+    compare("整体（含解码）:", legacy_select_best_image_index, DDGS_ean_image_api.select_best_image_index, fixtures)
+
+    # 解码和缩放之后的部分：预先解码，只比较特征提取与选择
+    decoded = [DDGS_ean_image_api.decode_candidate_images(candidates)[0] for candidates in fixtures]
+    decoded = [images for images in decoded if len(images) > 1]
+    compare("特征提取与选择（不含解码）:",
+            lambda images: legacy_closest_to_center([legacy_resized_features(img) for img in images]),
+            lambda images: DDGS_ean_image_api.closest_to_center(DDGS_ean_image_api.histogram_features(images)),
+            decoded)
@@ -13,10 +13,13 @@ from difflib import SequenceMatcher
 from rapidfuzz import fuzz
 import pandas as pd
 import json
+from barcode_excel_singleflight import normalize_barcode
 class PerfumeMatcher:
     def __init__(self, term_file):
         self.df = pd.read_excel(term_file)
         self._preprocess_dataframe()
+        self._ean_index = None  # 规范化条码 -> 中文品名，首次查询时建立
+        self._ean_lock = Lock()
 
     def _preprocess_dataframe(self):
         """一次性预处理所有香水数据"""
@@ -64,47 +67,31 @@ class PerfumeMatcher:
         matches = self.get_all_matches(text, threshold)
         return [m['原始名称'] for m in matches] if matches else None
 
-    def get_CHINESE_NAME(self, ean):
-        """根据ean条码从中文品名汇总表.xlsx获取中文名称"""
-        try:
-            # 这里需要实现从中文品名汇总表.xlsx中根据ean查找中文名称的逻辑
-            # 示例代码 - 实际实现需要根据具体文件格式调整
-            #print(f"正在根据EAN {ean} 查找中文品名...")
-            if not hasattr(self, 'ean_df'):#
+    def _build_ean_index(self):
+        """
+        读取中文品名汇总表.xlsx，编译为 规范化条码 -> 中文品名 的字典（只在首次查询时执行一次）。
+        Excel 数值单元格产生的 "3346130022886.0" 和科学计数法条码会被修复；同一条码出现多次时取第一行。
+        """
+        with self._ean_lock:
+            if self._ean_index is None:
                 self.ean_df = pd.read_excel('中文品名汇总表.xlsx')
-                """
-                #打印表单行数
-                print(f"中文品名汇总表.xlsx 行数: {len(self.ean_df)}")
-                print(f"中文品名汇总表.xlsx 列数: {len(self.ean_df.columns)}")
-                #打印表单前5行
-                print(f"中文品名汇总表.xlsx 前5行数据:")
-                print(self.ean_df.head())
-                #打印表单14016行和其之后5行
-                print(f"中文品名汇总表.xlsx 第14016行及之后5行数据:")
-                print(self.ean_df.iloc[14016:14021])
-                """
+                ean_index = {}
+                for barcode, chinese_name in zip(self.ean_df['条码'].tolist(), self.ean_df['中文品名'].tolist()):
+                    if pd.isna(barcode) or pd.isna(chinese_name):
+                        continue
+                    ean_index.setdefault(normalize_barcode(barcode), chinese_name)
+                print(f"中文品名汇总表.xlsx 已建立条码索引: {len(self.ean_df)} 行, {len(ean_index)} 个条码")
+                self._ean_index = ean_index
+        return self._ean_index
 
-            """
-            # 添加数据类型调试
-            print(f"EAN数据类型: {type(ean)}, 值: {ean}")
-            print(f"条码列数据类型: {self.ean_df['条码'].dtype}")
-            """
-            # 确保ean是字符串类型进行比较
-            ean_str = str(ean).strip()
-            #print(f"转换后的EAN: '{ean_str}'")
-            
-            # 尝试精确匹配
-            result = self.ean_df[self.ean_df['条码'].astype(str).str.strip() == ean_str]
-            
-            if not result.empty:
-                print(f"找到EAN {ean} 对应的中文品名: {result.iloc[0]['中文品名']}")
-                return result.iloc[0]['中文品名']
-            
-            # 如果精确匹配失败，尝试打印一些调试信息
-            #print(f"精确匹配失败，尝试查看前几个条码:")
-            #print(self.ean_df['条码'].astype(str).str.strip().head(10).tolist())
-            
-            return None
+    def get_CHINESE_NAME(self, ean):
+        """根据ean条码从中文品名汇总表.xlsx获取中文名称（按规范化条码查字典）"""
+        try:
+            ean_index = self._ean_index if self._ean_index is not None else self._build_ean_index()
+            chinese_name = ean_index.get(normalize_barcode(ean))
+            if chinese_name is not None:
+                print(f"找到EAN {ean} 对应的中文品名: {chinese_name}")
+            return chinese_name
         except Exception as e:
             print(f"EAN查找失败: {str(e)}")
             return None
@@ -193,6 +180,23 @@ def translate_single(text, ean=None, pinpai=None):
     #print(completion.choices[0].message.content)
     return completion.choices[0].message.content
 
+def translate_with_retry(original, ean=None, row_idx=None, show_log=True):
+    """翻译单行内容，失败时重试一次。返回 (是否成功, 翻译结果或"翻译失败")"""
+    try:
+        result = translate_single(original, ean)
+    except Exception:
+        try:
+            print(f"第{row_idx}行第一次翻译失败，正在重试...")
+            result = translate_single(original, ean)
+        except Exception as e:
+            if show_log:
+                print(f"第{row_idx}行翻译失败: {str(e)}")
+            return False, "翻译失败"
+
+    if show_log:
+        print(f"原文: {original}\n翻译: {result}\n{'='*50}")
+    return True, result
+
 def process_single(ws, row_idx, src_col_idx, dst_col_idx, barcode_col_idx=None, show_log=True):
     try:
         src_cell = ws.cell(row=row_idx, column=src_col_idx+1)
@@ -206,23 +210,9 @@ def process_single(ws, row_idx, src_col_idx, dst_col_idx, barcode_col_idx=None,
             barcode_cell = ws.cell(row=row_idx, column=barcode_col_idx+1)
             ean = barcode_cell.value if barcode_cell.value else None
             
-        try:
-            result = translate_single(original, ean)
-            ws.cell(row=row_idx, column=dst_col_idx+1, value=result)
-        except Exception as e:
-            try:
-                print(f"第{row_idx}行第一次翻译失败，正在重试...")
-                result = translate_single(original, ean)
-                ws.cell(row=row_idx, column=dst_col_idx+1, value=result)
-            except Exception as e:
-                ws.cell(row=row_idx, column=dst_col_idx+1, value="翻译失败")
-                if show_log:
-                    print(f"第{row_idx}行翻译失败: {str(e)}")
-                return False
-        
-        if show_log:
-            print(f"原文: {original}\n翻译: {result}\n{'='*50}")
-        return True
+        success, result = translate_with_retry(original, ean, row_idx, show_log)
+        ws.cell(row=row_idx, column=dst_col_idx+1, value=result)
+        return success
     except Exception as e:
         ws.cell(row=row_idx, column=dst_col_idx+1, value="翻译失败")
         if show_log:
@@ -1,9 +1,9 @@
-import sqlite3
+from barcode_excel_db import connect
 
 def print_and_delete_errors(db_path, barcode_to_search=None):
     try:
         # 连接到数据库
-        conn = sqlite3.connect(db_path)
+        conn = connect(db_path)
         cursor = conn.cursor()
 
         # 获取所有表名
@@ -1,6 +1,9 @@
 from flask import Flask, request, render_template, send_from_directory, jsonify
 import os
-from backend import process_excel
+import threading
+from backend import process_excel, resume, revalidation_runner, REVALIDATION_ENABLED
+from barcode_excel_breaker import breaker_metrics
+from barcode_excel_journal import init_journal, list_jobs, new_job_id
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -9,6 +12,18 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB limit
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 运行中任务的取消事件：job_id -> threading.Event，POST /cancel/<job_id> 时设置
+_cancel_events = {}
+_cancel_lock = threading.Lock()
+
+def _register_job(job_id):
+    with _cancel_lock:
+        return _cancel_events.setdefault(job_id, threading.Event())
+
+def _unregister_job(job_id):
+    with _cancel_lock:
+        _cancel_events.pop(job_id, None)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -26,28 +41,83 @@ def upload_file():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
         file.save(filepath)
         
-        params = {
-            'excel_filepath': filepath,
-            'barcode_column_letter': request.form['barcode_col'],
-            'start_row': int(request.form['start_row']),
-            'end_row': int(request.form['end_row']),
-            'image_column_letter': request.form['image_col'],
-            'product_name_column_letter': request.form['name_col'],
-            'translate_dst_column_letter': request.form['translate_col']
-        }
+        try:
+            params = {
+                'excel_filepath': filepath,
+                'barcode_column_letter': request.form['barcode_col'],
+                'start_row': int(request.form['start_row']),
+                'end_row': int(request.form['end_row']),
+                'image_column_letter': request.form['image_col'],
+                'product_name_column_letter': request.form['name_col'],
+                'translate_dst_column_letter': request.form['translate_col']
+            }
+            # 可选：本次任务的爬取线程数
+            if request.form.get('threads'):
+                params['num_threads'] = int(request.form['threads'])
+        except (KeyError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'Invalid form field: {e}'}), 400
+        # 任务ID：进程崩溃或重启后可通过 /resume/<job_id> 从断点继续
+        params['job_id'] = new_job_id()
         
         try:
-            output_path = process_excel(**params)
+            output_path = process_excel(**params, cancel_event=_register_job(params['job_id']))
             return jsonify({
                 'success': True,
+                'job_id': params['job_id'],
                 'filename': os.path.basename(output_path)
             })
         except Exception as e:
-            return jsonify({'error': str(e)}), 500
+            return jsonify({'success': False, 'error': str(e), 'job_id': params['job_id']}), 500
+        finally:
+            _unregister_job(params['job_id'])
+
+@app.route('/jobs')
+def jobs():
+    # 列出任务；?status=running 只列出未完成（可续跑）的任务
+    init_journal()
+    return jsonify(list_jobs(request.args.get('status')))
+
+@app.route('/resume/<job_id>', methods=['POST'])
+def resume_job(job_id):
+    try:
+        output_path = resume(job_id, cancel_event=_register_job(job_id))
+        if not output_path:
+            return jsonify({'error': f'Job {job_id} not found or failed'}), 404
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'filename': os.path.basename(output_path)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e), 'job_id': job_id}), 500
+    finally:
+        _unregister_job(job_id)
+
+@app.route('/cancel/<job_id>', methods=['POST'])
+def cancel_job(job_id):
+    # 取消运行中的任务：尚未开始的条码被放弃，正在处理的条码完成后结束，之后可通过 /resume/<job_id> 续跑
+    with _cancel_lock:
+        cancel_event = _cancel_events.get(job_id)
+    if cancel_event is None:
+        return jsonify({'error': f'Job {job_id} is not running'}), 404
+    cancel_event.set()
+    return jsonify({'success': True, 'job_id': job_id})
+
+@app.route('/revalidation')
+def revalidation():
+    # 后台重新检索失败条码的统计
+    return jsonify(revalidation_runner.metrics())
+
+@app.route('/breakers')
+def breakers():
+    # 各数据来源熔断器的状态和滚动窗口统计
+    return jsonify(breaker_metrics())
 
 @app.route('/download/<filename>')
 def download_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
 
 if __name__ == '__main__':
+    if REVALIDATION_ENABLED:
+        revalidation_runner.start()  # 前台空闲时重新检索负缓存已过期的失败条码
     app.run(host='0.0.0.0', port=5111, debug=False)
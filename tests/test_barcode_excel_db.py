@@ -0,0 +1,48 @@
+"""
+products 表的写入与负缓存 TTL（临时数据库，不影响 barcode_cache.db）。
+"""
+
+import pytest
+import barcode_excel_db
+from barcode_excel_db import (ProductWriter, get_product_from_db, negative_cache_expires_at, NEGATIVE_CACHE_TTL,
+                              NEGATIVE_CACHE_BACKOFF, STATUS_NO_SEARCH)
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(barcode_excel_db, 'DATABASE_NAME', str(tmp_path / 'barcode_cache.db'))
+    monkeypatch.setattr(barcode_excel_db, 'print', lambda *args, **kwargs: None, raising=False)
+    barcode_excel_db.init_database()
+    writer = ProductWriter(flush_interval=0.01)
+    yield writer
+    writer.close()
+
+
+def write(writer, barcode, product_name):
+    writer.submit(barcode, product_name, None, None).result(5)
+    return get_product_from_db(barcode)
+
+
+def negative_ttl(product):
+    return negative_cache_expires_at(product) - product['fetched_at']
+
+
+def test_repeated_failures_grow_ttl(writer):
+    base_ttl = NEGATIVE_CACHE_TTL[STATUS_NO_SEARCH]
+    assert negative_ttl(write(writer, '1000000000001', "No Search")) == base_ttl
+    assert negative_ttl(write(writer, '1000000000001', "No Search")) == base_ttl * NEGATIVE_CACHE_BACKOFF
+
+
+def test_failure_after_success_uses_base_ttl(writer):
+    for _ in range(5):
+        write(writer, '1000000000002', "Product Name")
+    product = write(writer, '1000000000002', "No Search")
+    assert product['attempts'] == 1
+    assert negative_ttl(product) == NEGATIVE_CACHE_TTL[STATUS_NO_SEARCH]
+
+
+def test_status_change_resets_attempts(writer):
+    write(writer, '1000000000003', "No Search")
+    write(writer, '1000000000003', "No Search")
+    product = write(writer, '1000000000003', "Not Found And No Search")
+    assert product['attempts'] == 1
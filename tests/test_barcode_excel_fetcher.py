@@ -0,0 +1,96 @@
+"""
+barcode_excel_fetcher 的 HTTP 获取测试：本地 HTTP 服务提供 recorded_pages 下录制的页面，不访问外网。
+"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from barcode_excel_fetcher import fetch_product_http, parse_product_page
+
+PAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recorded_pages')
+
+# 条码 -> (状态码, 录制的页面)
+RECORDED_ROUTES = {
+    '3346130022886': (200, 'product_ok.html'),
+    '0000000000000': (404, 'not_found.html'),
+    '1111111111111': (200, 'cloudflare_challenge.html'),
+    '2222222222222': (403, 'cloudflare_challenge.html'),
+    '4006000000000': (200, 'missing_image.html'),
+    '5555555555555': (500, 'product_ok.html'),
+}
+
+
+def read_page(filename):
+    with open(os.path.join(PAGE_DIR, filename), encoding='utf-8') as f:
+        return f.read()
+
+
+class RecordedPageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, filename = RECORDED_ROUTES.get(self.path.strip('/'), (404, 'not_found.html'))
+        body = read_page(filename).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedPageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/{{}}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('barcode, status, product_name, image_url', [
+    ('3346130022886', 'ok', 'Chanel Coco Mademoiselle Eau De Parfum Spray 50ml',
+     'https://images.barcodelookup.com/1234/12345678-1.jpg'),
+    ('0000000000000', 'not_found', None, None),
+    ('1111111111111', 'challenge', None, None),
+    ('2222222222222', 'challenge', None, None),
+    ('4006000000000', 'unusable', None, None),
+    ('5555555555555', 'unusable', None, None),
+])
+def test_fetch_product_http(base_url, barcode, status, product_name, image_url):
+    result = fetch_product_http(barcode, base_url=base_url)
+    assert result['status'] == status
+    assert result['product_name'] == product_name
+    assert result['image_url'] == image_url
+    assert result['html'] == read_page(RECORDED_ROUTES[barcode][1])
+
+
+def test_fetch_product_http_connection_error():
+    # 端口 9 (discard) 上没有服务：请求失败时返回 unusable，由调用方升级到 Selenium
+    result = fetch_product_http('3346130022886', base_url='http://127.0.0.1:9/{}', timeout=2)
+    assert result == {'status': 'unusable', 'product_name': None, 'image_url': None, 'html': None}
+
+
+@pytest.mark.parametrize('filename, status', [
+    ('product_ok.html', 'ok'),
+    ('not_found.html', 'not_found'),
+    ('cloudflare_challenge.html', 'challenge'),
+    ('missing_image.html', 'unusable'),
+])
+def test_parse_product_page(filename, status):
+    assert parse_product_page(read_page(filename))['status'] == status
+
+
+def test_parse_product_page_rejects_invalid_name():
+    # 前6位为数字、第7位为 "." 的产品名称是错误数据
+    page_html = read_page('product_ok.html').replace('<h4>', '<h4>123456.789 ', 1)
+    assert parse_product_page(page_html) == {'status': 'unusable', 'product_name': None, 'image_url': None}
+
+
+def test_parse_product_page_custom_xpath():
+    # reextract 用新的 XPath 重新解析快照
+    result = parse_product_page(read_page('product_ok.html'), name_xpath='//div[@class="col-50 product-details"]/h4',
+                                image_xpath='//div[@id="largeProductImage"]/img')
+    assert result['status'] == 'ok'
+    assert result['product_name'] == 'Chanel Coco Mademoiselle Eau De Parfum Spray 50ml'
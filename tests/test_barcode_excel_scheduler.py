@@ -0,0 +1,59 @@
+"""
+CrawlScheduler：有界队列、取消与 join 的并发。
+"""
+
+import threading
+import time
+from barcode_excel_scheduler import CrawlScheduler
+
+
+def test_all_submitted_items_are_handled():
+    handled = []
+    lock = threading.Lock()
+
+    def handler(item, thread_name):
+        with lock:
+            handled.append(item)
+
+    with CrawlScheduler(handler, num_workers=3) as scheduler:
+        for item in range(50):
+            assert scheduler.submit(item)
+    assert sorted(handled) == list(range(50))
+    assert scheduler.metrics()['completed'] == 50
+
+
+def test_handler_errors_do_not_stop_workers():
+    def handler(item, thread_name):
+        if item % 2:
+            raise ValueError(item)
+
+    with CrawlScheduler(handler, num_workers=2) as scheduler:
+        for item in range(10):
+            scheduler.submit(item)
+    metrics = scheduler.metrics()
+    assert (metrics['completed'], metrics['failed']) == (5, 5)
+
+
+def test_cancel_concurrent_with_join():
+    # join() 已放入退出哨兵、工作线程仍在处理任务时 cancel()：哨兵不能被丢弃，join() 必须返回
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler(item, thread_name):
+        started.set()
+        release.wait(5)
+
+    scheduler = CrawlScheduler(handler, num_workers=2, max_pending=10).start()
+    for item in range(6):
+        scheduler.submit(item)
+    started.wait(5)
+    join_thread = threading.Thread(target=scheduler.join, daemon=True)
+    join_thread.start()
+    time.sleep(0.2)  # 等 join() 放入退出哨兵
+    scheduler.cancel()
+    release.set()
+    join_thread.join(5)
+    assert not join_thread.is_alive()
+    metrics = scheduler.metrics()
+    assert metrics['completed'] + metrics['cancelled'] == 6
+    assert not scheduler.submit(99)
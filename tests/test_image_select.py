@@ -0,0 +1,70 @@
+"""
+DDGS 最佳图片选择：向量化实现必须与原 StandardScaler + KMeans(n_clusters=1) 的选择结果一致。
+
+EXPECTED_* 是原实现（image_select_benchmark.legacy_*，需要 scikit-learn）在下面固定随机种子的数据上的选择结果，
+测试本身不依赖 scikit-learn。候选图片用 PNG 编码（无损），解码结果与 libjpeg 版本无关。
+"""
+
+import cv2
+import numpy as np
+import DDGS_ean_image_api
+from DDGS_ean_image_api import closest_to_center, rank_candidate_images, select_best_image_index
+
+# legacy_closest_to_center 在 make_feature_sets() 上的结果
+EXPECTED_CLOSEST = [2, 4, 0, 0, 3, 0, 0, 6, 3, 2, 3, 0]
+# legacy_select_best_image_index 在 make_candidate_groups() 上的结果
+EXPECTED_SELECTED = [0, 1, 3, 3, 2, 4, 6, 1, 3, 1, 1, 1]
+
+
+def make_feature_sets(seed=7, count=12):
+    """随机特征矩阵：24 维归一化直方图 + 缩放后相同的高、宽、宽高比（方差为0的列）。"""
+    rng = np.random.default_rng(seed)
+    feature_sets = []
+    for _ in range(count):
+        rows = int(rng.integers(2, 11))
+        hist = rng.dirichlet(np.ones(24), size=rows)
+        feature_sets.append(np.hstack([hist, np.tile([64, 64, 1.0], (rows, 1))]))
+    return feature_sets
+
+
+def make_candidate_groups(seed=42, count=12):
+    """每组 3-8 张随机 PNG 候选图片（尺寸、底色和色块随机），偶尔混入无法解码的数据。"""
+    rng = np.random.default_rng(seed)
+    groups = []
+    for _ in range(count):
+        candidates = []
+        for _ in range(int(rng.integers(3, 9))):
+            if rng.random() < 0.1:
+                candidates.append(b'not an image')
+                continue
+            height, width = int(rng.integers(40, 160)), int(rng.integers(40, 160))
+            img = np.empty((height, width, 3), np.uint8)
+            img[:] = rng.integers(0, 256, 3)
+            for _ in range(int(rng.integers(1, 4))):
+                y, x = int(rng.integers(0, height)), int(rng.integers(0, width))
+                img[y:y + int(rng.integers(5, 80)), x:x + int(rng.integers(5, 80))] = rng.integers(0, 256, 3)
+            candidates.append(cv2.imencode('.png', img)[1].tobytes())
+        groups.append(candidates)
+    return groups
+
+
+def test_closest_to_center_matches_legacy():
+    assert [closest_to_center(features) for features in make_feature_sets()] == EXPECTED_CLOSEST
+
+
+def test_select_best_image_index_matches_legacy(monkeypatch):
+    monkeypatch.setattr(DDGS_ean_image_api, 'print', lambda *args, **kwargs: None, raising=False)
+    assert [select_best_image_index(candidates) for candidates in make_candidate_groups()] == EXPECTED_SELECTED
+
+
+def test_rank_candidate_images_skips_undecodable():
+    candidates = make_candidate_groups(count=3)[2]  # 第3组包含一段无法解码的数据
+    ranking = rank_candidate_images(candidates)
+    assert sorted(ranking) == [index for index, data in enumerate(candidates) if data != b'not an image']
+    assert ranking[0] == EXPECTED_SELECTED[2]
+
+
+def test_select_best_image_index_without_valid_images():
+    assert select_best_image_index([b'not an image', b'']) is None
+    single = cv2.imencode('.png', np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+    assert select_best_image_index([b'not an image', single]) == 1